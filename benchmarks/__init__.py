@@ -0,0 +1,10 @@
+"""
+    Нагрузочные замеры основных операций сервисов на синтетических данных.
+    Запуск из корня репозитория (база данных для замеров пересоздается, она должна отличаться от базы приложения):
+
+        PYTHONPATH=src python -m benchmarks.run --database bench_sport_app --output benchmarks/results/master.json
+        PYTHONPATH=src python -m benchmarks.compare benchmarks/results/master.json benchmarks/results/feature.json
+
+    Объемы данных и генератор случайных чисел задаются параметрами run, поэтому замеры разных веток
+    выполняются на одинаковых данных.
+"""
@@ -0,0 +1,49 @@
+"""
+    Сравнение результатов двух запусков benchmarks.run. Замедление медианы более чем на threshold или рост
+    числа SQL-запросов считается регрессией; при наличии регрессий команда завершается с кодом 1.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def compare(base: dict, head: dict, threshold: float) -> tuple[list[str], bool]:
+    lines = [f"{'benchmark':<20} {'base ms':>10} {'head ms':>10} {'change':>8} {'queries':>9}"]
+    regressed = False
+    for name, head_result in head['results'].items():
+        base_result = base['results'].get(name)
+        if base_result is None:
+            lines.append(f"{name:<20} {'-':>10} {head_result['median_ms']:10.2f} {'new':>8}")
+            continue
+        change = head_result['median_ms'] / base_result['median_ms'] - 1
+        slower = change > threshold
+        more_queries = head_result['queries'] > base_result['queries']
+        regressed |= slower or more_queries
+        queries = f"{base_result['queries']:g}->{head_result['queries']:g}"
+        mark = '  REGRESSION' if slower or more_queries else ''
+        lines.append(
+            f"{name:<20} {base_result['median_ms']:10.2f} {head_result['median_ms']:10.2f} "
+            f"{change:+8.1%} {queries:>9}{mark}"
+        )
+    return lines, regressed
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.compare', description=__doc__)
+    parser.add_argument('base', type=Path)
+    parser.add_argument('head', type=Path)
+    parser.add_argument('--threshold', type=float, default=0.1, help='допустимое замедление медианы, доля')
+    args = parser.parse_args(argv)
+
+    base, head = (json.loads(path.read_text()) for path in (args.base, args.head))
+    for key in ('volumes', 'seed'):
+        if base['meta'][key] != head['meta'][key]:
+            print(f"warning: {key} differ: {base['meta'][key]} != {head['meta'][key]}", file=sys.stderr)
+    lines, regressed = compare(base, head, args.threshold)
+    print('\n'.join(lines))
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,338 @@
+"""
+    Нагрузочное тестирование запущенного сервера по HTTP с заданным соотношением сценариев:
+
+        schedule  - анонимный опрос расписания с фильтрами и ETag (If-None-Match), как это делают страницы расписания
+        clients   - поиск и просмотр клиентов оператором
+        booking   - запись клиентов на занятия; кроме того, каждые --burst-every секунд --burst-size записей
+                    одновременно отправляются на одно занятие, как в момент открытия регистрации
+        reports   - отчеты администратора
+
+    Каждый из --users виртуальных пользователей выполняет сценарии один за другим в течение --duration секунд.
+    Пример запуска на локальном сервере с синтетическими данными (benchmarks.seed):
+
+        PYTHONPATH=src python -m benchmarks.load --seed-database bench_sport_app --seed-only
+        cd src && db_database=bench_sport_app gunicorn sport_app.app:app -w 4 -k uvicorn.workers.UvicornWorker -b :8000
+        PYTHONPATH=src python -m benchmarks.load --url http://localhost:8000 --users 50 --duration 60
+
+    Ответы 409 (клиент уже записан, нет мест) и 503 с Retry-After (очередь записи заполнена) при записи - ожидаемый
+    результат нагрузки и учитываются как отказы, а не ошибки.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+import httpx
+from sqlalchemy import create_engine, insert
+
+from sport_app import tables
+from sport_app.database import url_object
+from sport_app.services.auth import password_hasher
+from sport_app.settings import settings
+
+from .run import ensure_database
+from .seed import Volumes, seed
+
+
+# Ответы, означающие отказ в обслуживании по правилам приложения, а не ошибку. Остальные ответы 4xx и 5xx - ошибки
+REJECTED = {409, 503}
+
+
+class Stats:
+    """Время ответа и исходы запросов по операциям: код ответа или имя исключения httpx"""
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.outcomes: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, operation: str, latency_s: float, outcome: str):
+        self.latencies[operation].append(latency_s)
+        self.outcomes[operation][outcome] += 1
+
+    @staticmethod
+    def _summarize(latencies: list[float], outcomes: dict[str, int], elapsed_s: float) -> dict:
+        ms = sorted(latency * 1000 for latency in latencies)
+        percentiles = statistics.quantiles(ms, n=100, method='inclusive') if len(ms) > 1 else ms * 99
+        errors = sum(n for outcome, n in outcomes.items() if not outcome.isdigit() or
+                     (int(outcome) >= 400 and int(outcome) not in REJECTED))
+        rejected = sum(n for outcome, n in outcomes.items() if outcome.isdigit() and int(outcome) in REJECTED)
+        return {
+            'requests': len(ms),
+            'rps': len(ms) / elapsed_s,
+            'p50_ms': percentiles[49],
+            'p90_ms': percentiles[89],
+            'p99_ms': percentiles[98],
+            'max_ms': ms[-1],
+            'error_rate': errors / len(ms),
+            'rejected_rate': rejected / len(ms),
+            'outcomes': dict(sorted(outcomes.items())),
+        }
+
+    def summary(self, elapsed_s: float) -> dict:
+        operations = {
+            operation: self._summarize(latencies, self.outcomes[operation], elapsed_s)
+            for operation, latencies in sorted(self.latencies.items())
+        }
+        outcomes = defaultdict(int)
+        for operation_outcomes in self.outcomes.values():
+            for outcome, n in operation_outcomes.items():
+                outcomes[outcome] += n
+        latencies = [latency for operation_latencies in self.latencies.values() for latency in operation_latencies]
+        total = self._summarize(latencies, outcomes, elapsed_s) if latencies else {}
+        return {'elapsed_s': elapsed_s, 'total': total, 'operations': operations}
+
+
+class Target(NamedTuple):
+    """Данные сервера, на которые ссылаются сценарии"""
+    program_ids: list[int]
+    categories: list[str]
+    placements: list[str]
+    client_ids: list[int]
+    # ближайшие занятия: id программы, дата в ISO формате
+    classes: list[tuple[int, str]]
+
+
+class User:
+    def __init__(self, client: httpx.AsyncClient, stats: Stats, target: Target, staff_headers: dict, rng: random.Random):
+        self.client = client
+        self.stats = stats
+        self.target = target
+        self.staff_headers = staff_headers
+        self.rng = rng
+        self.etags: dict[str, str] = {}
+
+    async def request(self, operation: str, method: str, url: str, staff: bool = False, **kwargs) -> Optional[httpx.Response]:
+        headers = {**kwargs.pop('headers', {}), **(self.staff_headers if staff else {})}
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers=headers, **kwargs)
+        except httpx.HTTPError as e:
+            self.stats.record(operation, time.perf_counter() - start, type(e).__name__)
+            return None
+        self.stats.record(operation, time.perf_counter() - start, str(response.status_code))
+        return response
+
+    async def schedule(self):
+        target, rng = self.target, self.rng
+        params = rng.choice([
+            {},
+            {'compact': 'true'},
+            {'program': rng.choice(target.program_ids)},
+            {'category': rng.choice(target.categories)},
+            {'placement': rng.choice(target.placements)},
+        ])
+        key = json.dumps(params, sort_keys=True)
+        headers = {'If-None-Match': self.etags[key]} if key in self.etags else {}
+        response = await self.request('schedule', 'GET', '/api/schedule/', params=params, headers=headers)
+        if response is not None and 'etag' in response.headers:
+            self.etags[key] = response.headers['etag']
+
+    async def clients(self):
+        if self.rng.random() < 0.5:
+            query = str(self.rng.randint(100, 999))
+            await self.request('client_search', 'GET', '/api/client/search', staff=True, params={'q': query})
+        else:
+            client_id = self.rng.choice(self.target.client_ids)
+            await self.request('client_get', 'GET', f'/api/client/{client_id}', staff=True)
+
+    async def book(self, program: int, date: str, operation: str = 'book'):
+        client_id = self.rng.choice(self.target.client_ids)
+        await self.request(
+            operation, 'POST', f'/api/client/{client_id}/book', staff=True, params={'program': program, 'date': date}
+        )
+
+    async def booking(self):
+        await self.book(*self.rng.choice(self.target.classes))
+
+    async def reports(self):
+        if self.rng.random() < 0.5:
+            programs = self.rng.sample(self.target.program_ids, min(10, len(self.target.program_ids)))
+            await self.request(
+                'programs_report', 'POST', '/api/reports/programs', staff=True,
+                json={'programs': programs, 'period': 'month'},
+            )
+        else:
+            client_id = self.rng.choice(self.target.client_ids)
+            await self.request(
+                'client_report', 'GET', f'/api/reports/client/{client_id}', staff=True, params={'period': 'week'}
+            )
+
+
+SCENARIOS: dict[str, Callable[[User], Awaitable[None]]] = {
+    'schedule': User.schedule,
+    'clients': User.clients,
+    'booking': User.booking,
+    'reports': User.reports,
+}
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    """schedule=70,clients=15,booking=10,reports=5"""
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f'неизвестный сценарий {name}, доступны: {", ".join(SCENARIOS)}')
+        mix[name] = float(weight)
+    return mix
+
+
+async def sign_in(client: httpx.AsyncClient, username: str, password: str) -> dict[str, str]:
+    response = await client.post('/api/auth/sign-in', data={'username': username, 'password': password})
+    response.raise_for_status()
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+
+async def get_json(client: httpx.AsyncClient, url: str, **kwargs):
+    response = await client.get(url, **kwargs)
+    response.raise_for_status()
+    return response.json()
+
+
+async def discover(client: httpx.AsyncClient, staff_headers: dict) -> Target:
+    programs = await get_json(client, '/api/programs/', headers=staff_headers)
+    clients = await get_json(client, '/api/client/', params={'limit': 500}, headers=staff_headers)
+    schedule = await get_json(client, '/api/schedule/')
+    now = datetime.datetime.now(datetime.timezone.utc)
+    classes = [
+        (record['program']['id'], record['date']) for record in schedule
+        if datetime.datetime.fromisoformat(record['date']) > now and record['program']['available_registration']
+    ]
+    if not programs or not clients['items'] or not classes:
+        raise SystemExit('на сервере нет программ, клиентов или предстоящих занятий, см. --seed-database')
+    return Target(
+        program_ids=[p['id'] for p in programs],
+        categories=sorted({p['category']['name'] for p in programs}),
+        placements=sorted({p['placement']['name'] for p in programs}),
+        client_ids=[c['id'] for c in clients['items']],
+        classes=classes,
+    )
+
+
+async def user_loop(user: User, mix: dict[str, float], deadline: float, think_s: float):
+    names, weights = list(mix), list(mix.values())
+    while time.monotonic() < deadline:
+        await SCENARIOS[user.rng.choices(names, weights)[0]](user)
+        if think_s:
+            await asyncio.sleep(user.rng.expovariate(1 / think_s))
+
+
+async def burst_loop(user: User, size: int, every_s: float, deadline: float):
+    """Одновременная запись size клиентов на одно занятие каждые every_s секунд"""
+    while time.monotonic() + every_s < deadline:
+        await asyncio.sleep(every_s)
+        program, date = user.rng.choice(user.target.classes)
+        await asyncio.gather(*(user.book(program, date, 'book_burst') for _ in range(size)))
+
+
+async def run_load(args: argparse.Namespace) -> dict:
+    limits = httpx.Limits(max_connections=args.users + args.burst_size, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        staff_headers = await sign_in(client, args.username, args.password)
+        target = await discover(client, staff_headers)
+        stats = Stats()
+        rng = random.Random(args.seed)
+
+        def new_user() -> User:
+            return User(client, stats, target, staff_headers, random.Random(rng.random()))
+
+        start = time.monotonic()
+        deadline = start + args.duration
+        tasks = [user_loop(new_user(), args.mix, deadline, args.think_ms / 1000) for _ in range(args.users)]
+        if args.burst_size and args.mix.get('booking'):
+            tasks.append(burst_loop(new_user(), args.burst_size, args.burst_every, deadline))
+        await asyncio.gather(*tasks)
+        return stats.summary(time.monotonic() - start)
+
+
+def seed_database(database: str, volumes: Volumes, seed_value: int):
+    """Заполняет базу данных синтетическими данными и добавляет администратора settings.adm_username"""
+    ensure_database(database)
+    engine = create_engine(url_object.set(database=database))
+    seed(engine, volumes, seed_value)
+    with engine.begin() as conn:
+        conn.execute(insert(tables.Staff.__table__).values(
+            username=settings.adm_username,
+            email=settings.adm_email,
+            role=tables.Roles.admin,
+            password_hash=password_hasher.handler.hash(settings.adm_password),
+        ))
+    engine.dispose()
+
+
+def print_summary(summary: dict):
+    print(f"{'operation':<16} {'requests':>9} {'rps':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} "
+          f"{'max ms':>9} {'errors':>7} {'rejected':>9}", file=sys.stderr)
+    rows = list(summary['operations'].items()) + [('total', summary['total'])]
+    for operation, s in rows:
+        print(f"{operation:<16} {s['requests']:9d} {s['rps']:8.1f} {s['p50_ms']:9.1f} {s['p90_ms']:9.1f} "
+              f"{s['p99_ms']:9.1f} {s['max_ms']:9.1f} {s['error_rate']:7.2%} {s['rejected_rate']:9.2%}",
+              file=sys.stderr)
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    defaults = Volumes()
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.load', description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--url', default=f'http://localhost:{settings.server_port}')
+    parser.add_argument('--users', type=int, default=20, help='число одновременных пользователей')
+    parser.add_argument('--duration', type=float, default=30, help='длительность нагрузки, секунд')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('schedule=70,clients=15,booking=10,reports=5'))
+    parser.add_argument('--think-ms', type=float, default=0, help='средняя пауза пользователя между сценариями')
+    parser.add_argument('--burst-size', type=int, default=100)
+    parser.add_argument('--burst-every', type=float, default=10)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--username', default=settings.adm_username)
+    parser.add_argument('--password', default=settings.adm_password)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--seed-database', help='перед нагрузкой заполнить эту базу данных синтетическими данными')
+    parser.add_argument('--seed-only', action='store_true', help='только заполнить базу данных')
+    parser.add_argument('--programs', type=int, default=defaults.programs)
+    parser.add_argument('--records', type=int, default=defaults.records)
+    parser.add_argument('--clients', type=int, default=defaults.clients)
+    parser.add_argument('--bookings', type=int, default=defaults.bookings)
+    parser.add_argument('--output', type=Path, help='файл JSON с результатами')
+    args = parser.parse_args(argv)
+    if args.seed_database == settings.db_database:
+        parser.error('база данных для нагрузки должна отличаться от базы данных приложения')
+    if args.seed_only and not args.seed_database:
+        parser.error('--seed-only требует --seed-database')
+    return args
+
+
+def main(argv: list[str]) -> Optional[dict]:
+    args = parse_args(argv)
+    if args.seed_database:
+        volumes = Volumes(args.programs, args.records, args.clients, args.bookings)
+        seed_database(args.seed_database, volumes, args.seed)
+        print(f'seeded {args.seed_database}', file=sys.stderr)
+        if args.seed_only:
+            return None
+
+    summary = asyncio.run(run_load(args))
+    summary['meta'] = {
+        'url': args.url,
+        'users': args.users,
+        'duration_s': args.duration,
+        'mix': args.mix,
+        'think_ms': args.think_ms,
+        'burst_size': args.burst_size,
+        'burst_every_s': args.burst_every,
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    print_summary(summary)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(summary, indent=2, ensure_ascii=False))
+    return summary
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
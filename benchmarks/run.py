@@ -0,0 +1,276 @@
+"""
+    Замер времени выполнения операций сервисов. Каждая операция выполняется warmup раз без учета, затем repeat раз;
+    для каждой сохраняются распределение времени выполнения и число SQL-запросов за вызов.
+    Подготовка к вызову (setup) в замер не входит.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional
+
+from sqlalchemy import create_engine, delete, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from sport_app import models, tables
+from sport_app.database import url_object, collect_query_stats
+from sport_app.services import ScheduleService, ClientService, AsyncClientService, SchemaService
+from sport_app.services.reports import ReportsService
+from sport_app.services.booking import booking_catalog
+from sport_app.services.schedules.cache import schedule_cache
+from sport_app.settings import settings
+
+from .seed import Dataset, Volumes, seed
+
+
+class Environment(NamedTuple):
+    Session: sessionmaker
+    AsyncSession: sessionmaker
+    loop: asyncio.AbstractEventLoop
+    dataset: Dataset
+
+
+BenchFunc = Callable[[Environment, int], None]
+
+
+class Benchmark(NamedTuple):
+    name: str
+    func: BenchFunc
+    setup: Optional[BenchFunc]
+
+
+benchmarks: list[Benchmark] = []
+
+
+def benchmark(name: str, setup: Optional[BenchFunc] = None) -> Callable[[BenchFunc], BenchFunc]:
+    def decorator(func: BenchFunc) -> BenchFunc:
+        benchmarks.append(Benchmark(name, func, setup))
+        return func
+    return decorator
+
+
+def invalidate_schedule(env: Environment, i: int):
+    schedule_cache.invalidate()
+
+
+@benchmark('schedule', setup=invalidate_schedule)
+def construct_schedule(env: Environment, i: int):
+    with env.Session() as session:
+        ScheduleService(session).encoded_schedule({})
+
+
+@benchmark('schedule_compact', setup=invalidate_schedule)
+def construct_compact_schedule(env: Environment, i: int):
+    with env.Session() as session:
+        ScheduleService(session).encoded_schedule({}, compact=True)
+
+
+@benchmark('schedule_cached')
+def construct_cached_schedule(env: Environment, i: int):
+    with env.Session() as session:
+        ScheduleService(session).encoded_schedule({})
+
+
+def booking(env: Environment, i: int, offset: int = 0) -> tuple[int, int, datetime.datetime]:
+    """Резервный клиент и ближайшее занятие для i-й итерации"""
+    clients, slots = env.dataset.reserved_client_ids, env.dataset.upcoming_slots
+    program, date = slots[(i + offset) % len(slots)]
+    return clients[(i + offset) % len(clients)], program, date
+
+
+def cancel_booking(env: Environment, i: int, offset: int = 0):
+    """Снимает бронирование, оставшееся от прошлого запуска с тем же клиентом и занятием"""
+    client, program, date = booking(env, i, offset)
+    B = tables.BookedClasses
+    with env.Session() as session:
+        session.execute(delete(B).where(tuple_(B.client, B.program, B.date) == (client, program, date)))
+        session.commit()
+
+
+@benchmark('book_client', setup=cancel_booking)
+def book_client(env: Environment, i: int):
+    with env.Session() as session:
+        ClientService(session).book_client(*booking(env, i))
+
+
+# Асинхронная запись использует других клиентов, чтобы не пересекаться с замером book_client
+ASYNC_BOOKING_OFFSET = 500
+
+
+@benchmark('book_client_async', setup=lambda env, i: cancel_booking(env, i, ASYNC_BOOKING_OFFSET))
+def book_client_async(env: Environment, i: int):
+    async def book():
+        async with env.AsyncSession() as session:
+            await AsyncClientService(session).book_client(*booking(env, i, ASYNC_BOOKING_OFFSET))
+    env.loop.run_until_complete(book())
+
+
+@benchmark('programs_report')
+def programs_report(env: Environment, i: int):
+    request = models.ProgramsReport(programs=env.dataset.program_ids, period=models.Periods.month)
+    with env.Session() as session:
+        ReportsService(session).programs_report(request)
+
+
+@benchmark('client_report')
+def client_report(env: Environment, i: int):
+    client_ids = env.dataset.client_ids
+    with env.Session() as session:
+        ReportsService(session).client_report(client_ids[i * 7919 % len(client_ids)], models.Periods.week)
+
+
+def restore_upcoming_bookings(env: Environment, i: int):
+    """Возвращает бронирования, снятые предыдущей активацией схемы"""
+    B = tables.BookedClasses
+    with env.Session() as session:
+        session.execute(
+            insert(B.__table__).on_conflict_do_nothing(),
+            [{'client': c, 'program': p, 'date': d} for c, p, d in env.dataset.upcoming_bookings],
+        )
+        session.commit()
+
+
+@benchmark('schema_activation', setup=restore_upcoming_bookings)
+def activate_schema(env: Environment, i: int):
+    """Схемы поочередно сменяют друг друга, снимая бронирования на занятия, отсутствующие в новой схеме"""
+    dataset = env.dataset
+    schema_id = dataset.other_schema_id if i % 2 == 0 else dataset.active_schema_id
+    with env.Session() as session:
+        SchemaService(session).update_schema(schema_id, models.SchemaUpdate(active=True))
+
+
+def summarize(durations: list[float], queries: list[int]) -> dict:
+    ms = sorted(d * 1000 for d in durations)
+    return {
+        'iterations': len(ms),
+        'min_ms': ms[0],
+        'median_ms': statistics.median(ms),
+        'mean_ms': statistics.fmean(ms),
+        'p95_ms': statistics.quantiles(ms, n=20)[18] if len(ms) > 1 else ms[0],
+        'max_ms': ms[-1],
+        'queries': statistics.median(queries),
+    }
+
+
+def measure(bench: Benchmark, env: Environment, repeat: int, warmup: int) -> dict:
+    durations, queries = [], []
+    for i in range(warmup + repeat):
+        if bench.setup:
+            bench.setup(env, i)
+        with collect_query_stats() as stats:
+            start = time.perf_counter()
+            bench.func(env, i)
+            elapsed = time.perf_counter() - start
+        if i >= warmup:
+            durations.append(elapsed)
+            queries.append(stats.count)
+    return summarize(durations, queries)
+
+
+def git_revision() -> dict:
+    def git(*args) -> Optional[str]:
+        try:
+            return subprocess.run(
+                ['git', *args], capture_output=True, text=True, check=True, cwd=Path(__file__).parent
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {'commit': git('rev-parse', 'HEAD'), 'branch': git('rev-parse', '--abbrev-ref', 'HEAD')}
+
+
+def ensure_database(database: str):
+    admin_engine = create_engine(url_object.set(database='postgres'), isolation_level='AUTOCOMMIT')
+    with admin_engine.connect() as conn:
+        exists = conn.execute(text('SELECT 1 FROM pg_database WHERE datname = :name'), {'name': database}).scalar()
+        if not exists:
+            conn.execute(text(f'CREATE DATABASE "{database}" ENCODING \'UTF8\' TEMPLATE template0'))
+    admin_engine.dispose()
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    defaults = Volumes()
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description=__doc__)
+    parser.add_argument('--database', default='bench_sport_app', help='база данных для замеров (пересоздается)')
+    parser.add_argument('--programs', type=int, default=defaults.programs)
+    parser.add_argument('--records', type=int, default=defaults.records)
+    parser.add_argument('--clients', type=int, default=defaults.clients)
+    parser.add_argument('--bookings', type=int, default=defaults.bookings)
+    parser.add_argument('--weeks', type=int, default=defaults.weeks)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--only', nargs='*', choices=[b.name for b in benchmarks], help='выполнить только эти замеры')
+    parser.add_argument('--output', type=Path, help='файл JSON с результатами')
+    args = parser.parse_args(argv)
+    if args.database == settings.db_database:
+        parser.error('база данных для замеров должна отличаться от базы данных приложения')
+    if args.repeat + args.warmup > defaults.reserved_clients // 2:
+        parser.error(f'repeat + warmup не должны превышать {defaults.reserved_clients // 2}')
+    return args
+
+
+def main(argv: list[str]) -> dict:
+    args = parse_args(argv)
+    volumes = Volumes(args.programs, args.records, args.clients, args.bookings, args.weeks)
+    ensure_database(args.database)
+    url = url_object.set(database=args.database)
+    engine = create_engine(url)
+    async_engine = create_async_engine(url.set(drivername=f'{settings.db_dialect}+{settings.db_async_driver}'))
+
+    started = time.perf_counter()
+    dataset = seed(engine, volumes, args.seed)
+    print(f'seeded {args.database} in {time.perf_counter() - started:.1f} s', file=sys.stderr)
+
+    env = Environment(
+        Session=sessionmaker(engine, autocommit=False, autoflush=False),
+        AsyncSession=sessionmaker(
+            async_engine, class_=AsyncSession, autocommit=False, autoflush=False, expire_on_commit=False
+        ),
+        loop=asyncio.new_event_loop(),
+        dataset=dataset,
+    )
+    booking_catalog.sessionmaker = env.AsyncSession
+    results = {}
+    try:
+        for bench in benchmarks:
+            if args.only and bench.name not in args.only:
+                continue
+            results[bench.name] = measure(bench, env, args.repeat, args.warmup)
+            print(f"{bench.name:<20} median {results[bench.name]['median_ms']:9.2f} ms  "
+                  f"p95 {results[bench.name]['p95_ms']:9.2f} ms  "
+                  f"queries {results[bench.name]['queries']:g}", file=sys.stderr)
+    finally:
+        env.loop.run_until_complete(async_engine.dispose())
+        env.loop.close()
+        engine.dispose()
+
+    report = {
+        'meta': {
+            **git_revision(),
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'volumes': volumes._asdict(),
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'warmup': args.warmup,
+        },
+        'results': results,
+    }
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    return report
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,157 @@
+"""
+    Генератор синтетических данных: программы, элементы расписания, две схемы (активная и схема для замера
+    активации), клиенты и бронирования за прошедшие недели и на предстоящие занятия.
+"""
+import datetime
+import random
+from typing import NamedTuple
+
+from dateutil import relativedelta as rd
+from sqlalchemy import insert, text
+from sqlalchemy.engine import Engine
+
+from sport_app import tables, utils
+from sport_app.tables import Base
+
+
+class Volumes(NamedTuple):
+    programs: int = 60
+    records: int = 400
+    clients: int = 5000
+    bookings: int = 100_000
+    # глубина истории бронирований в неделях
+    weeks: int = 26
+    # клиенты без бронирований, которых записывают на занятия замеры записи
+    reserved_clients: int = 1000
+
+
+class Dataset(NamedTuple):
+    program_ids: list[int]
+    client_ids: list[int]
+    reserved_client_ids: list[int]
+    active_schema_id: int
+    other_schema_id: int
+    # ближайшие занятия активной схемы, до которых не менее часа: id программы, дата
+    upcoming_slots: list[tuple[int, datetime.datetime]]
+    # бронирования на ближайшие занятия: id клиента, id программы, дата
+    upcoming_bookings: list[tuple[int, int, datetime.datetime]]
+
+
+CATEGORIES = 5
+PLACEMENTS = 4
+PROGRAMS_PER_INSTRUCTOR = 4
+DAY_TIMES = [datetime.time(hour, minute) for hour in range(7, 22) for minute in (0, 30)]
+
+
+def _insert(conn, table, rows: list[dict], chunk: int = 10_000):
+    for start in range(0, len(rows), chunk):
+        conn.execute(insert(table), rows[start:start + chunk])
+
+
+def _sync_sequences(conn, tables_with_ids):
+    for table in tables_with_ids:
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), (SELECT max(id) FROM {table.name}))"
+        ))
+
+
+def upcoming_date(week_day: int, day_time: datetime.time) -> datetime.datetime:
+    """Ближайшая дата занятия: на текущей неделе, если оно еще не прошло, иначе на следующей"""
+    date = utils.calculate_date(week_day, day_time)
+    return date if date > utils.now() else date + rd.relativedelta(days=7)
+
+
+def seed(engine: Engine, volumes: Volumes, seed_value: int = 0) -> Dataset:
+    """Пересоздает таблицы и заполняет их данными, которые однозначно определяются volumes и seed_value"""
+    rng = random.Random(seed_value)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    categories = [{'name': f'category-{i}', 'color': f'#{i:06x}'} for i in range(CATEGORIES)]
+    placements = [{'name': f'placement-{i}'} for i in range(PLACEMENTS)]
+    instructors = [
+        {'id': i, 'credentials': f'instructor-{i}', 'phone': f'+7 800 {i:07d}'}
+        for i in range(1, volumes.programs // PROGRAMS_PER_INSTRUCTOR + 2)
+    ]
+    programs = [
+        {
+            'id': i,
+            'name': f'program-{i}',
+            'category': rng.choice(categories)['name'],
+            'placement': rng.choice(placements)['name'],
+            'instructor': rng.choice(instructors)['id'],
+            'paid': rng.random() < 0.3,
+            'place_limit': None,
+            'registration_opens': None,
+            'available_registration': True,
+        }
+        for i in range(1, volumes.programs + 1)
+    ]
+    slots = rng.sample(
+        [(week_day, day_time, program['id']) for week_day in range(7) for day_time in DAY_TIMES for program in programs],
+        volumes.records,
+    )
+    records = [
+        {'id': i, 'week_day': week_day, 'day_time': day_time, 'duration': 60, 'program': program}
+        for i, (week_day, day_time, program) in enumerate(slots, start=1)
+    ]
+    # схемы отличаются десятой частью элементов, что соответствует типичному изменению расписания
+    active_records = rng.sample(records, len(records) * 9 // 10)
+    other_records = rng.sample(records, len(records) * 9 // 10)
+    schemas = [
+        {'id': 1, 'name': 'active', 'active': True},
+        {'id': 2, 'name': 'other', 'active': False},
+    ]
+    schema_records = (
+        [{'schedule_schema': 1, 'schema_record': r['id']} for r in active_records]
+        + [{'schedule_schema': 2, 'schema_record': r['id']} for r in other_records]
+    )
+    clients = [
+        {'id': i, 'credentials': f'client-{i}', 'phone': f'+7 900 {i:07d}'}
+        for i in range(1, volumes.clients + volumes.reserved_clients + 1)
+    ]
+    client_ids = [c['id'] for c in clients[:volumes.clients]]
+
+    upcoming = {(r['program'], r['week_day'], r['day_time']): upcoming_date(r['week_day'], r['day_time'])
+                for r in active_records}
+    now = utils.now()
+    bookings = set()
+    while len(bookings) < volumes.bookings:
+        record = rng.choice(active_records)
+        date = upcoming[(record['program'], record['week_day'], record['day_time'])]
+        date -= rd.relativedelta(weeks=rng.randint(0, volumes.weeks))
+        bookings.add((rng.choice(client_ids), record['program'], date))
+    bookings = sorted(bookings)
+
+    with engine.begin() as conn:
+        _insert(conn, tables.Category.__table__, categories)
+        _insert(conn, tables.Placement.__table__, placements)
+        _insert(conn, tables.Instructor.__table__, instructors)
+        _insert(conn, tables.Program.__table__, programs)
+        _insert(conn, tables.SchemaRecord.__table__, records)
+        _insert(conn, tables.ScheduleSchema.__table__, schemas)
+        _insert(conn, tables.schedule_schema_record, schema_records)
+        _insert(conn, tables.Client.__table__, clients)
+        _insert(conn, tables.BookedClasses.__table__, [
+            {'client': client, 'program': program, 'date': date} for client, program, date in bookings
+        ])
+        _sync_sequences(conn, [
+            tables.Instructor.__table__,
+            tables.Program.__table__,
+            tables.SchemaRecord.__table__,
+            tables.ScheduleSchema.__table__,
+            tables.Client.__table__,
+        ])
+        conn.execute(text('ANALYZE'))
+
+    return Dataset(
+        program_ids=[p['id'] for p in programs],
+        client_ids=client_ids,
+        reserved_client_ids=[c['id'] for c in clients[volumes.clients:]],
+        active_schema_id=1,
+        other_schema_id=2,
+        upcoming_slots=sorted(
+            (program, date) for (program, _, _), date in upcoming.items() if date > now + rd.relativedelta(hours=1)
+        ),
+        upcoming_bookings=[b for b in bookings if b[2] > now],
+    )
@@ -0,0 +1,8 @@
+def on_starting(server):
+    from sport_app.metrics import clear_store
+    clear_store()
+
+
+def child_exit(server, worker):
+    from sport_app.metrics import mark_process_dead
+    mark_process_dead(worker.pid)
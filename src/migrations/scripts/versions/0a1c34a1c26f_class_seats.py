@@ -0,0 +1,70 @@
+"""class seats counter maintained by trigger
+
+Revision ID: 0a1c34a1c26f
+Revises: e975322795b6
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a1c34a1c26f'
+down_revision = 'e975322795b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('class_seats',
+    sa.Column('program', sa.Integer(), nullable=False),
+    sa.Column('date', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('booked', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['program'], ['program.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('program', 'date')
+    )
+    # Блокировка запрещает запись в booked_classes до конца транзакции миграции: бронирование, сделанное между
+    # заполнением class_seats и созданием триггера, не было бы учтено в счетчике мест
+    op.execute('LOCK TABLE booked_classes IN SHARE ROW EXCLUSIVE MODE')
+    op.execute("""
+    INSERT INTO class_seats (program, date, booked)
+    SELECT program, date, count(*) FROM booked_classes
+    WHERE date IS NOT NULL
+    GROUP BY program, date
+    """)
+    op.execute("""
+    CREATE OR REPLACE FUNCTION booked_classes_seats() RETURNS trigger AS $$
+    DECLARE
+        seats_limit integer;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            UPDATE class_seats SET booked = booked - 1
+            WHERE program = OLD.program AND date = OLD.date;
+            RETURN OLD;
+        END IF;
+
+        SELECT place_limit INTO seats_limit FROM program WHERE id = NEW.program;
+        INSERT INTO class_seats AS seats (program, date, booked)
+        VALUES (NEW.program, NEW.date, 1)
+        ON CONFLICT (program, date) DO UPDATE SET booked = seats.booked + 1
+        WHERE coalesce(seats_limit, 0) = 0 OR seats.booked < seats_limit;
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'no seats available for program % on %', NEW.program, NEW.date
+                USING ERRCODE = 'SA001';
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+    CREATE TRIGGER booked_classes_seats
+    BEFORE INSERT OR DELETE ON booked_classes
+    FOR EACH ROW EXECUTE FUNCTION booked_classes_seats()
+    """)
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER IF EXISTS booked_classes_seats ON booked_classes')
+    op.execute('DROP FUNCTION IF EXISTS booked_classes_seats()')
+    op.drop_table('class_seats')
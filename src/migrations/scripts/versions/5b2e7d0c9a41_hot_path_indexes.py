@@ -0,0 +1,37 @@
+"""indexes for schedule, booking and report queries
+
+Revision ID: 5b2e7d0c9a41
+Revises: 0a1c34a1c26f
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b2e7d0c9a41'
+down_revision = '0a1c34a1c26f'
+branch_labels = None
+depends_on = None
+
+
+# CREATE INDEX CONCURRENTLY не блокирует запись в таблицы, но не может выполняться внутри транзакции
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_booked_classes_date_program', 'booked_classes', ['date', 'program'],
+                        postgresql_include=['id'], postgresql_concurrently=True)
+        op.create_index('ix_booked_classes_program_date', 'booked_classes', ['program', 'date'],
+                        postgresql_include=['id'], postgresql_concurrently=True)
+        op.create_index('ix_schema_record_slot', 'schema_record', ['week_day', 'day_time', 'program'],
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_schema_record_slot', table_name='schema_record',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_booked_classes_program_date', table_name='booked_classes',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_booked_classes_date_program', table_name='booked_classes',
+                      postgresql_concurrently=True)
@@ -0,0 +1,121 @@
+"""attendance counters per week and month maintained by trigger
+
+Revision ID: 8d3f61b2c7e5
+Revises: 5b2e7d0c9a41
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from sport_app.settings import settings
+
+
+# revision identifiers, used by Alembic.
+revision = '8d3f61b2c7e5'
+down_revision = '5b2e7d0c9a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('program_attendance',
+    sa.Column('program', sa.Integer(), nullable=False),
+    sa.Column('period', sa.String(), nullable=False),
+    sa.Column('year', sa.Integer(), nullable=False),
+    sa.Column('num', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['program'], ['program.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('program', 'period', 'year', 'num')
+    )
+    op.create_table('client_attendance',
+    sa.Column('client', sa.Integer(), nullable=False),
+    sa.Column('program', sa.Integer(), nullable=False),
+    sa.Column('period', sa.String(), nullable=False),
+    sa.Column('year', sa.Integer(), nullable=False),
+    sa.Column('num', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['client'], ['client.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['program'], ['program.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('client', 'program', 'period', 'year', 'num')
+    )
+    # Блокировка запрещает запись в booked_classes до конца транзакции миграции: бронирование, сделанное между
+    # заполнением счетчиков и созданием триггера, не попало бы в отчеты
+    op.execute('LOCK TABLE booked_classes IN SHARE ROW EXCLUSIVE MODE')
+    op.execute(f"""
+    CREATE TEMPORARY VIEW booking_periods AS
+    SELECT client, program, 'week' AS period,
+           date_part('isoyear', timezone('{settings.timezone}', date)) AS year,
+           date_part('week', timezone('{settings.timezone}', date)) AS num
+    FROM booked_classes WHERE date IS NOT NULL
+    UNION ALL
+    SELECT client, program, 'month',
+           date_part('year', timezone('{settings.timezone}', date)),
+           date_part('month', timezone('{settings.timezone}', date))
+    FROM booked_classes WHERE date IS NOT NULL
+    """)
+    op.execute("""
+    INSERT INTO program_attendance (program, period, year, num, amount)
+    SELECT program, period, year, num, count(*) FROM booking_periods
+    GROUP BY program, period, year, num
+    """)
+    op.execute("""
+    INSERT INTO client_attendance (client, program, period, year, num, amount)
+    SELECT client, program, period, year, num, count(*) FROM booking_periods
+    GROUP BY client, program, period, year, num
+    """)
+    op.execute('DROP VIEW booking_periods')
+    # Часовой пояс передается аргументом триггера, а не зашивается в функцию. После изменения settings.timezone
+    # триггер и счетчики пересоздаются командой python -m sport_app.rebuild_attendance
+    op.execute("""
+    CREATE OR REPLACE FUNCTION booked_classes_attendance() RETURNS trigger AS $$
+    DECLARE
+        booking booked_classes;
+        period_name text;
+        period_year integer;
+        period_num integer;
+        local_date timestamp;
+    BEGIN
+        booking := CASE TG_OP WHEN 'DELETE' THEN OLD ELSE NEW END;
+        IF booking.date IS NULL THEN
+            RETURN NULL;
+        END IF;
+        local_date := timezone(TG_ARGV[0], booking.date);
+
+        FOREACH period_name IN ARRAY ARRAY['week', 'month'] LOOP
+            period_year := date_part(CASE period_name WHEN 'week' THEN 'isoyear' ELSE 'year' END, local_date);
+            period_num := date_part(period_name, local_date);
+            IF TG_OP = 'DELETE' THEN
+                UPDATE program_attendance SET amount = amount - 1
+                WHERE program = booking.program AND period = period_name
+                    AND year = period_year AND num = period_num;
+                UPDATE client_attendance SET amount = amount - 1
+                WHERE client = booking.client AND program = booking.program AND period = period_name
+                    AND year = period_year AND num = period_num;
+                CONTINUE;
+            END IF;
+
+            INSERT INTO program_attendance AS a (program, period, year, num, amount)
+            VALUES (booking.program, period_name, period_year, period_num, 1)
+            ON CONFLICT (program, period, year, num) DO UPDATE SET amount = a.amount + 1;
+
+            INSERT INTO client_attendance AS a (client, program, period, year, num, amount)
+            VALUES (booking.client, booking.program, period_name, period_year, period_num, 1)
+            ON CONFLICT (client, program, period, year, num) DO UPDATE SET amount = a.amount + 1;
+        END LOOP;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """)
+    op.execute(f"""
+    CREATE TRIGGER booked_classes_attendance
+    AFTER INSERT OR DELETE ON booked_classes
+    FOR EACH ROW EXECUTE FUNCTION booked_classes_attendance('{settings.timezone}')
+    """)
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER IF EXISTS booked_classes_attendance ON booked_classes')
+    op.execute('DROP FUNCTION IF EXISTS booked_classes_attendance()')
+    op.drop_table('client_attendance')
+    op.drop_table('program_attendance')
@@ -0,0 +1,35 @@
+"""trigram indexes for client search
+
+Revision ID: c4a9e2f17b3d
+Revises: 8d3f61b2c7e5
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a9e2f17b3d'
+down_revision = '8d3f61b2c7e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.add_column('client', sa.Column(
+        'phone_digits', sa.String(), sa.Computed("regexp_replace(phone, '[^0-9]', '', 'g')"), nullable=True
+    ))
+    with op.get_context().autocommit_block():
+        op.create_index('ix_client_credentials_trgm', 'client', ['credentials'], postgresql_using='gin',
+                        postgresql_ops={'credentials': 'gin_trgm_ops'}, postgresql_concurrently=True)
+        op.create_index('ix_client_phone_digits_trgm', 'client', ['phone_digits'], postgresql_using='gin',
+                        postgresql_ops={'phone_digits': 'gin_trgm_ops'}, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_client_phone_digits_trgm', table_name='client', postgresql_concurrently=True)
+        op.drop_index('ix_client_credentials_trgm', table_name='client', postgresql_concurrently=True)
+    op.drop_column('client', 'phone_digits')
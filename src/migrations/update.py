@@ -3,7 +3,7 @@ from alembic import command
 
 from sport_app.database import Session
 from sport_app.settings import settings
-from sport_app.services.schedules.schedule import ScheduleService, SchemaService
+from sport_app.services.schedules.schema import SchemaService
 from sport_app.services.auth import AuthService
 from sport_app.models import SchemaCreate
 from sport_app import tables
@@ -14,7 +14,7 @@ command.upgrade(alembic_cfg, "head")
 
 session = Session()
 
-ScheduleService(session).validate_active_schema()
+SchemaService(session).activate_scheduled_schema()
 
 if not SchemaService(session).active_schema:
     SchemaService(session).create_schema(SchemaCreate(name='my_active'))
@@ -1,7 +1,9 @@
 import uvicorn
 
 from .settings import settings
+from .metrics import clear_store
 
+clear_store()
 
 uvicorn.run(
     'sport_app.app:app',
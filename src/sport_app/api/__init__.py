@@ -5,6 +5,7 @@ from .schedules import schedule_router
 from .clients import router as client_router
 from .auth import router as auth_router
 from .reports import router as report_router
+from .monitoring import router as monitoring_router
 
 router = APIRouter(
     prefix='/api'
@@ -14,3 +15,4 @@ router.include_router(schedule_router)
 router.include_router(client_router)
 router.include_router(auth_router)
 router.include_router(report_router)
+router.include_router(monitoring_router)
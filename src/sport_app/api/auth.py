@@ -7,7 +7,7 @@ from fastapi.security import OAuth2PasswordRequestForm
 
 from ..models import Staff
 from ..models import Token, StaffCreate
-from ..services import AuthService
+from ..services import AuthService, AsyncAuthService
 from ..services.auth import validate_admin_access
 
 
@@ -21,11 +21,11 @@ router = APIRouter(
     '/sign-in',
     response_model=Token
 )
-def sign_in(
+async def sign_in(
     auth_data: OAuth2PasswordRequestForm = Depends(),
-    auth_service: AuthService = Depends(),
+    auth_service: AsyncAuthService = Depends(),
 ):
-    return auth_service.authenticate_staff(auth_data.username, auth_data.password)
+    return await auth_service.authenticate_staff(auth_data.username, auth_data.password)
 
 
 @router.post(
@@ -34,11 +34,11 @@ def sign_in(
     dependencies=[Depends(validate_admin_access)],
     description='Регистрация сотрудника'
 )
-def sign_up(
+async def sign_up(
     staff_data: StaffCreate,
-    auth_service: AuthService = Depends(),
+    auth_service: AsyncAuthService = Depends(),
 ):
-    return auth_service.register_new_staff(staff_data)
+    return await auth_service.register_new_staff(staff_data)
 
 
 @router.get(
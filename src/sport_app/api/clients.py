@@ -1,14 +1,15 @@
 import datetime
-from typing import Union
+from typing import Optional, Union
 
 from fastapi import (
     APIRouter,
     Depends,
+    Query,
     status,
 )
 
-from ..models import Client, CreateClient, ClientUpdate, ClientMinimum, Staff
-from ..services import ClientService
+from ..models import Client, CreateClient, ClientUpdate, ClientMinimum, ClientsPage, ClientsMinimumPage, Staff
+from ..services import ClientService, AsyncClientService
 from ..services.auth import validate_admin_access, validate_operator_access
 
 
@@ -20,13 +21,34 @@ router = APIRouter(
 
 @router.get(
     '/',
-    response_model=Union[list[Client], list[ClientMinimum]]
+    response_model=Union[ClientsPage, ClientsMinimumPage],
+    description='Клиенты, упорядоченные по id. Следующая страница запрашивается с after_id=next_after_id. '
+                'Оператору возвращаются только id и ФИО клиентов',
 )
 def get_clients(
+    after_id: Optional[int] = None,
+    limit: int = Query(default=50, ge=1, le=500),
+    with_total: bool = False,
+    credentials: Optional[str] = None,
+    phone: Optional[str] = None,
     staff_member: Staff = Depends(validate_operator_access),
     client_service: ClientService = Depends(),
 ):
-    return client_service.get_many(staff_member)
+    return client_service.get_many(staff_member, after_id, limit, with_total, credentials, phone)
+
+
+@router.get(
+    '/search',
+    response_model=Union[list[Client], list[ClientMinimum]],
+    description='Поиск клиентов по части ФИО (с учетом опечаток) или номера телефона',
+)
+def search_clients(
+    q: str = Query(min_length=2, max_length=100),
+    limit: int = Query(default=20, ge=1, le=100),
+    staff_member: Staff = Depends(validate_operator_access),
+    client_service: ClientService = Depends(),
+):
+    return client_service.search(staff_member, q, limit)
 
 
 @router.get(
@@ -84,13 +106,13 @@ def update_client(
     status_code=status.HTTP_204_NO_CONTENT,
     dependencies=[Depends(validate_operator_access)],
 )
-def book_client(
+async def book_client(
     client_id: int,
     program: int,
     date: datetime.datetime,
-    client_service: ClientService = Depends(),
+    client_service: AsyncClientService = Depends(),
 ):
-    client_service.book_client(client_id, program, date)
+    await client_service.book_client(client_id, program, date)
 
 
 @router.delete(
@@ -98,11 +120,11 @@ def book_client(
     status_code=status.HTTP_204_NO_CONTENT,
     dependencies=[Depends(validate_operator_access)],
 )
-def remove_client_booking(
+async def remove_client_booking(
     client_id: int,
     program: int,
     date: datetime.datetime,
-    client_service: ClientService = Depends(),
+    client_service: AsyncClientService = Depends(),
 ):
-    client_service.remove_client_booking(client_id, program, date)
+    await client_service.remove_client_booking(client_id, program, date)
 
@@ -0,0 +1,23 @@
+from fastapi import (
+    APIRouter,
+    Depends,
+)
+
+from ..models import PoolStatus
+from ..services.auth import validate_admin_access
+from ..services.monitoring import pools_status
+
+
+router = APIRouter(
+    prefix='/monitoring',
+    tags=['monitoring'],
+    dependencies=[Depends(validate_admin_access)],
+)
+
+
+@router.get(
+    '/pool',
+    response_model=list[PoolStatus],
+)
+def get_pool_status():
+    return pools_status()
@@ -11,7 +11,7 @@ from ...models import (
     InstructorUpdate,
     InstructorPublic,
 )
-from ...services import InstructorService
+from ...services import InstructorService, AsyncInstructorService
 from ...services.auth import validate_admin_access
 
 
@@ -86,12 +86,12 @@ def update_instructor(
     response_model=InstructorPublic,
     dependencies=[Depends(validate_admin_access)],
 )
-def upload_instructor_image(
+async def upload_instructor_image(
     instructor_id: int,
     image: UploadFile,
-    instructor_service: InstructorService = Depends()
+    instructor_service: AsyncInstructorService = Depends()
 ):
-    return instructor_service.upload_image(instructor_id, image)
+    return await instructor_service.upload_image(instructor_id, image)
 
 
 @router.delete(
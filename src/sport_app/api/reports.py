@@ -1,10 +1,16 @@
+import datetime
+from typing import AsyncIterator, Optional
+
 from fastapi import (
     APIRouter,
     Depends,
+    Query,
 )
-from ..models import ClientReportRow, ProgramsReportResponse, ProgramsReport, Periods
+from fastapi.responses import StreamingResponse
+
+from ..models import ClientReportRow, ProgramsReportResponse, ProgramsReport, Periods, ExportFormat
 from ..services.auth import validate_admin_access, validate_operator_access
-from ..services.reports import ReportsService
+from ..services.reports import AsyncReportsService, encode_export
 
 
 router = APIRouter(
@@ -18,12 +24,12 @@ router = APIRouter(
     response_model=list[ClientReportRow],
     dependencies=[Depends(validate_admin_access)],
 )
-def get_client_report(
+async def get_client_report(
     client_id: int,
     period: Periods,
-    report_service: ReportsService = Depends()
+    report_service: AsyncReportsService = Depends()
 ):
-    return report_service.client_report(client_id, period)
+    return await report_service.client_report(client_id, period)
 
 
 @router.post(
@@ -31,9 +37,67 @@ def get_client_report(
     response_model=ProgramsReportResponse,
     dependencies=[Depends(validate_admin_access)]
 )
-def get_programs_report(
+async def get_programs_report(
     report_data: ProgramsReport,
-    report_service: ReportsService = Depends(),
+    report_service: AsyncReportsService = Depends(),
 ):
-    return report_service.programs_report(report_data)
+    return await report_service.programs_report(report_data)
+
+
+export_responses = {200: {'content': {ExportFormat.csv.media_type: {}, ExportFormat.ndjson.media_type: {}}}}
+
+
+def export_response(partitions: AsyncIterator[list[dict]], export_format: ExportFormat, name: str):
+    return StreamingResponse(
+        encode_export(partitions, export_format),
+        media_type=export_format.media_type,
+        headers={'Content-Disposition': f'attachment; filename="{name}.{export_format.value}"'},
+    )
+
+
+@router.get(
+    '/export/bookings',
+    response_class=StreamingResponse,
+    responses=export_responses,
+    dependencies=[Depends(validate_admin_access)],
+    description='Выгрузка бронирований на занятия с from (включительно) по to (не включительно)',
+)
+async def export_bookings(
+    date_from: Optional[datetime.datetime] = Query(default=None, alias='from'),
+    date_to: Optional[datetime.datetime] = Query(default=None, alias='to'),
+    export_format: ExportFormat = Query(default=ExportFormat.csv, alias='format'),
+    report_service: AsyncReportsService = Depends(),
+):
+    return export_response(report_service.export_bookings(date_from, date_to), export_format, 'bookings')
+
 
+@router.get(
+    '/export/client/{client_id}',
+    response_class=StreamingResponse,
+    responses=export_responses,
+    dependencies=[Depends(validate_admin_access)],
+    description='Выгрузка всех бронирований клиента',
+)
+async def export_client_history(
+    client_id: int,
+    export_format: ExportFormat = Query(default=ExportFormat.csv, alias='format'),
+    report_service: AsyncReportsService = Depends(),
+):
+    return export_response(
+        report_service.export_client_history(client_id), export_format, f'client-{client_id}'
+    )
+
+
+@router.post(
+    '/export/programs',
+    response_class=StreamingResponse,
+    responses=export_responses,
+    dependencies=[Depends(validate_admin_access)],
+    description='Выгрузка отчета по программам',
+)
+async def export_programs_report(
+    report_data: ProgramsReport,
+    export_format: ExportFormat = Query(default=ExportFormat.csv, alias='format'),
+    report_service: AsyncReportsService = Depends(),
+):
+    return export_response(report_service.export_programs_report(report_data), export_format, 'programs')
@@ -1,11 +1,19 @@
+import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+
 from fastapi import (
     APIRouter,
-    Depends
+    Depends,
+    Header,
+    Query,
+    Response,
+    status
 )
-from typing import Optional
+from fastapi.responses import StreamingResponse
+from typing import Optional, Union
 
-from ...models import ScheduleRecord
-from ...services import ScheduleService
+from ...models import ScheduleRecord, CompactSchedule
+from ...services import AsyncScheduleService
 
 
 router = APIRouter(
@@ -13,16 +21,75 @@ router = APIRouter(
 )
 
 
+def is_not_modified(
+    etag: str,
+    last_modified: datetime.datetime,
+    if_none_match: Optional[str],
+    if_modified_since: Optional[str],
+) -> bool:
+    """Проверка условных заголовков запроса (RFC 9110): If-None-Match имеет приоритет над If-Modified-Since"""
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags
+    if if_modified_since is not None:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
 @router.get(
     '/',
-    response_model=list[ScheduleRecord]
+    response_model=Union[list[ScheduleRecord], CompactSchedule],
+    description='Расписание на текущую и следующую недели. '
+                'compact - программы передаются один раз в словаре programs, занятия ссылаются на них по id',
+)
+async def get_schedule(
+    category: Optional[str] = None,
+    instructor: Optional[int] = None,
+    placement: Optional[str] = None,
+    program: Optional[int] = None,
+    compact: bool = False,
+    if_none_match: Optional[str] = Header(default=None),
+    if_modified_since: Optional[str] = Header(default=None),
+    schedule_service: AsyncScheduleService = Depends()
+):
+    etag, last_modified = schedule_service.validators()
+    headers = {
+        'ETag': etag,
+        'Last-Modified': format_datetime(last_modified.astimezone(datetime.timezone.utc), usegmt=True),
+        'Cache-Control': 'no-cache',
+    }
+    if is_not_modified(etag, last_modified, if_none_match, if_modified_since):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    filters = {
+        "category": category,
+        "instructor": instructor,
+        "placement": placement,
+        "id": program,
+    }
+    # расписание возвращается уже сериализованным, response_model используется только для описания схемы ответа
+    content = await schedule_service.encoded_schedule(filters, compact)
+    return Response(content=content, media_type='application/json', headers=headers)
+
+
+@router.get(
+    '/range',
+    response_class=StreamingResponse,
+    responses={200: {'content': {'application/x-ndjson': {}}}},
+    description='Расписание за период с from по to включительно. '
+                'Занятия передаются потоком в формате NDJSON (по одному ScheduleRecord в строке)',
 )
-def get_schedule(
+async def get_schedule_range(
+    date_from: datetime.date = Query(alias='from'),
+    date_to: datetime.date = Query(alias='to'),
     category: Optional[str] = None,
     instructor: Optional[int] = None,
     placement: Optional[str] = None,
     program: Optional[int] = None,
-    schedule_service: ScheduleService = Depends()
+    schedule_service: AsyncScheduleService = Depends()
 ):
     filters = {
         "category": category,
@@ -30,4 +97,10 @@ def get_schedule(
         "placement": placement,
         "id": program,
     }
-    return schedule_service.construct_schedule(filters)
\ No newline at end of file
+    records = await schedule_service.expand_schedule(filters, date_from, date_to)
+
+    async def lines():
+        async for record in records:
+            yield record.json() + '\n'
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
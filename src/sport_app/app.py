@@ -1,7 +1,11 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, status
 from fastapi.routing import APIRoute
 from fastapi.middleware.cors import CORSMiddleware
 from . import api
+from .images import image_processor, CACHE_CONTROL
+from .metrics import MetricsMiddleware, metrics
+from .profiling import QueryStatsMiddleware
+from .tasks import scheduler
 from .settings import settings
 
 # for development purposes
@@ -56,6 +60,10 @@ tags_metadata = [
     {
         'name': 'reports',
         'description': 'Отчеты'
+    },
+    {
+        'name': 'monitoring',
+        'description': 'Состояние воркера'
     }
 ]
 
@@ -63,6 +71,26 @@ app = FastAPI(openapi_tags=tags_metadata)
 
 app.include_router(api.router)
 use_route_names_as_operation_ids(app)
+# nginx не проксирует /metrics, адрес доступен только внутри сети сервера
+app.add_route('/metrics', metrics, include_in_schema=False)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(QueryStatsMiddleware)
+
+
+@app.on_event('startup')
+async def start_scheduler():
+    if settings.scheduler_enabled:
+        scheduler.start()
+
+
+@app.on_event('shutdown')
+async def stop_scheduler():
+    await scheduler.stop()
+
+
+@app.on_event('shutdown')
+def stop_image_processor():
+    image_processor.shutdown()
 
 
 # for development purposes
@@ -72,7 +100,10 @@ use_route_names_as_operation_ids(app)
 def send_img(
     file: str
 ):
-    return FileResponse(Path.cwd() / 'images' / 'instructors' / file)
+    path = Path.cwd() / settings.images_path / 'instructors' / file
+    if not settings.serve_images or not path.is_file():
+        raise HTTPException(status.HTTP_404_NOT_FOUND)
+    return FileResponse(path, headers={'Cache-Control': CACHE_CONTROL})
 # __END
 
 
@@ -0,0 +1,65 @@
+"""
+    Создание вариантов для фотографий инструкторов, загруженных до их появления.
+    Такие фотографии хранятся в исходном виде как <token>.jpg под случайным именем, и миниатюры с карточками
+    для них не отдаются (Instructor.photo_variants). Скрипт строит варианты из исходных файлов (images.render),
+    заменяет photo_token инструкторов на хэш содержимого и удаляет исходные файлы. Повторный запуск обрабатывает
+    только оставшиеся фотографии. Запускается из того же рабочего каталога, что и приложение:
+
+        python -m sport_app.backfill_images
+"""
+import argparse
+import sys
+from pathlib import Path
+
+from sqlalchemy import select, update
+
+from . import images, tables
+from .database import Session
+from .services.programs.instructor import upload_dir
+
+
+def backfill(session, directory: Path) -> dict[str, int]:
+    """Возвращает количество обработанных фотографий, отсутствующих и нераспознанных исходных файлов"""
+    result = {'rendered': 0, 'missing': 0, 'invalid': 0}
+    tokens = session.execute(
+        select(tables.Instructor.photo_token).where(tables.Instructor.photo_token.isnot(None)).distinct()
+    ).scalars().all()
+    for token in tokens:
+        if images.has_variants(token):
+            continue
+        source = directory / images.filename(token, 'full')
+        if not source.exists():
+            print(f'{token}: file {source} not found', file=sys.stderr)
+            result['missing'] += 1
+            continue
+        try:
+            new_token = images.render(source.read_bytes(), str(directory))
+        except images.InvalidImage:
+            print(f'{token}: {source} is not an image', file=sys.stderr)
+            result['invalid'] += 1
+            continue
+        session.execute(
+            update(tables.Instructor)
+            .where(tables.Instructor.photo_token == token)
+            .values(photo_token=new_token)
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        source.unlink()
+        result['rendered'] += 1
+    return result
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog='python -m sport_app.backfill_images', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--directory', type=Path, default=None, help='каталог фотографий инструкторов')
+    args = parser.parse_args(argv)
+    with Session() as session:
+        result = backfill(session, args.directory or upload_dir())
+    print(', '.join(f'{key}: {value}' for key, value in result.items()))
+    return 1 if result['invalid'] or result['missing'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,6 +1,16 @@
-from sqlalchemy import create_engine
-from sqlalchemy.engine import URL
+import heapq
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import URL, Engine
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession as _AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 
 from .settings import settings
 
@@ -14,7 +24,85 @@ url_object = URL.create(
     database=settings.db_database,
 )
 
-engine = create_engine(url_object)
+
+class PoolStats:
+    """Число выдач соединений пулом, отказов по таймауту и время ожидания соединения в текущем процессе"""
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total_s = 0.0
+        self.wait_max_s = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, wait_s: float, timeout: bool = False):
+        with self._lock:
+            if timeout:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total_s += wait_s
+            self.wait_max_s = max(self.wait_max_s, wait_s)
+
+
+class TimedPoolMixin:
+    """
+    Измеряет время получения соединения из пула, включая ожидание свободного соединения, создание нового
+    и проверку pre-ping. Статистика сохраняется при пересоздании пула (engine.dispose)
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.stats.observe(time.perf_counter() - start, timeout=True)
+            raise
+        self.stats.observe(time.perf_counter() - start)
+        return connection
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_options() -> dict:
+    return dict(
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout_s,
+        pool_recycle=settings.db_pool_recycle_s,
+        pool_pre_ping=settings.db_pool_pre_ping,
+    )
+
+
+def connect_args(driver: str) -> dict:
+    """Ограничение времени выполнения запроса устанавливается параметром сеанса при подключении"""
+    if not settings.db_statement_timeout_ms:
+        return {}
+    timeout = str(settings.db_statement_timeout_ms)
+    if driver == 'asyncpg':
+        return {'server_settings': {'statement_timeout': timeout}}
+    return {'options': f'-c statement_timeout={timeout}'}
+
+
+engine = create_engine(
+    url_object,
+    poolclass=TimedQueuePool,
+    connect_args=connect_args(url_object.drivername),
+    **pool_options(),
+)
 
 Session = sessionmaker(
     engine,
@@ -23,6 +111,88 @@ Session = sessionmaker(
 )
 
 
+async_engine = create_async_engine(
+    url_object.set(drivername=f'{settings.db_dialect}+{settings.db_async_driver}'),
+    poolclass=TimedAsyncQueuePool,
+    connect_args=connect_args(settings.db_async_driver),
+    **pool_options(),
+)
+
+AsyncSession = sessionmaker(
+    async_engine,
+    class_=_AsyncSession,
+    autocommit=False,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
+class QueryStats:
+    """
+    Запросы к базе данных, выполненные при обработке одного HTTP-запроса: их число, общее время, самые долгие
+    запросы и число выполнений каждого текста запроса. Многократное выполнение одного текста обычно означает
+    загрузку связанных объектов по одному (N+1), например, при обращении к Program.instructor_obj в цикле.
+    """
+    def __init__(self, slowest: int = settings.sql_slowest_statements):
+        self.count = 0
+        self.total_s = 0.0
+        self.executions: Counter[str] = Counter()
+        self._slowest_size = slowest
+        self._slowest: list[tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, duration_s: float):
+        with self._lock:
+            self.count += 1
+            self.total_s += duration_s
+            self.executions[statement] += 1
+            if len(self._slowest) < self._slowest_size:
+                heapq.heappush(self._slowest, (duration_s, statement))
+            else:
+                heapq.heappushpop(self._slowest, (duration_s, statement))
+
+    @property
+    def slowest(self) -> list[tuple[float, str]]:
+        return sorted(self._slowest, reverse=True)
+
+    def repeated(self, threshold: int = settings.sql_repeat_threshold) -> list[tuple[str, int]]:
+        return [(statement, n) for statement, n in self.executions.most_common() if n >= threshold]
+
+
+query_stats: ContextVar[Optional[QueryStats]] = ContextVar('query_stats', default=None)
+
+
+@contextmanager
+def collect_query_stats() -> Iterator[QueryStats]:
+    """Собирает статистику запросов всех движков, выполненных в текущем контексте (и его копиях) внутри блока"""
+    stats = QueryStats()
+    token = query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        query_stats.reset(token)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if query_stats.get() is not None:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    stats = query_stats.get()
+    if stats is not None and conn.info.get('query_start'):
+        stats.record(statement, time.perf_counter() - conn.info['query_start'].pop())
+
+
+@event.listens_for(Engine, 'handle_error')
+def _discard_query_timer(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('query_start'):
+        conn.info['query_start'].pop()
+
+
 def get_session():
     session = Session()
     try:
@@ -31,6 +201,14 @@ def get_session():
         session.close()
 
 
+async def get_async_session():
+    session = AsyncSession()
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
 def as_dict(obj):
     return {c.key: getattr(obj, c.key)
             for c in obj.__table__.columns}
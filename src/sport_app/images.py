@@ -0,0 +1,136 @@
+"""
+    Варианты фотографий инструкторов.
+    Загруженное изображение декодируется и перекодируется в JPEG нескольких размеров: миниатюра для страниц расписания,
+    карточка инструктора и полноразмерное изображение. Декодирование и масштабирование занимают процессорное время,
+    поэтому выполняются в пуле процессов, а не в потоке, обслуживающем запрос.
+    Имена файлов образованы хэшем содержимого вариантов: файл по одному адресу никогда не изменяется, поэтому nginx
+    отдает изображения с заголовком Cache-Control: immutable, и браузеры кэшируют их без повторных запросов.
+"""
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+from .settings import settings
+
+
+# Наибольшая сторона варианта в пикселях
+VARIANTS = {
+    'thumb': 160,
+    'card': 480,
+    'full': 1600,
+}
+
+JPEG_QUALITY = 85
+
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+# Имя вариантов - хэш их содержимого (render). Фотографии, загруженные до появления вариантов, сохранены только
+# в исходном виде под случайным именем и получают варианты после запуска python -m sport_app.backfill_images
+TOKEN_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def has_variants(token: str) -> bool:
+    return TOKEN_PATTERN.fullmatch(token) is not None
+
+
+def filename(token: str, variant: str) -> str:
+    """Имя полноразмерного варианта не содержит суффикса: <token>.jpg"""
+    return f'{token}.jpg' if variant == 'full' else f'{token}-{variant}.jpg'
+
+
+def urls(token: str) -> dict[str, str]:
+    return {variant: f'{settings.images_path}/instructors/{filename(token, variant)}' for variant in VARIANTS}
+
+
+def _to_rgb(image: Image.Image) -> Image.Image:
+    """JPEG не поддерживает прозрачность, поэтому прозрачные области заполняются белым цветом"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render(data: bytes, directory: str) -> str:
+    """
+    Сохраняет варианты изображения в directory и возвращает их общее имя - хэш содержимого всех вариантов.
+    Выполняется в процессе пула
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            source.load()
+            image = _to_rgb(ImageOps.exif_transpose(source))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        raise InvalidImage from None
+    encoded = {}
+    digest = hashlib.sha256()
+    for variant, size in VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        resized.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        encoded[variant] = buffer.getvalue()
+        digest.update(encoded[variant])
+    token = digest.hexdigest()[:32]
+    for variant, content in encoded.items():
+        path = Path(directory) / filename(token, variant)
+        if path.exists():
+            continue
+        # Файл появляется под итоговым именем только полностью записанным
+        temp_path = path.with_name(f'.{path.name}.{os.getpid()}')
+        temp_path.write_bytes(content)
+        os.replace(temp_path, path)
+    return token
+
+
+def remove(directory: Path, token: str):
+    for variant in VARIANTS:
+        (directory / filename(token, variant)).unlink(missing_ok=True)
+
+
+class ImageProcessor:
+    """
+    Пул процессов для обработки изображений. Пул создается при первой загрузке изображения; процессы запускаются
+    методом spawn, поскольку fork многопоточного процесса сервера небезопасен.
+    """
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            return self._executor
+
+    async def render(self, data: bytes, directory: Path) -> str:
+        return await asyncio.wrap_future(self.executor.submit(render, data, str(directory)))
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+image_processor = ImageProcessor(settings.image_workers)
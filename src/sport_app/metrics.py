@@ -0,0 +1,104 @@
+"""
+    Метрики запросов в формате Prometheus.
+    Middleware учитывает число запросов, коды ответов и время обработки каждой операции; меткой операции служит
+    operation_id маршрута (имя функции-обработчика). Воркеры gunicorn записывают значения метрик в файлы общего
+    каталога (режим multiprocess библиотеки prometheus_client), а GET /metrics суммирует значения всех воркеров.
+    Каталог очищается при запуске gunicorn (gunicorn.conf.py) или сервера разработки.
+"""
+import os
+import time
+from pathlib import Path
+
+from .settings import settings
+
+# Режим multiprocess выбирается при импорте prometheus_client
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', settings.metrics_dir)
+Path(os.environ['PROMETHEUS_MULTIPROC_DIR']).mkdir(parents=True, exist_ok=True)
+
+from prometheus_client import (  # noqa: E402
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    CONTENT_TYPE_LATEST,
+    generate_latest,
+    multiprocess,
+)
+from starlette.requests import Request  # noqa: E402
+from starlette.responses import Response  # noqa: E402
+from starlette.types import ASGIApp, Message, Receive, Scope, Send  # noqa: E402
+
+
+UNMATCHED = 'unmatched'
+
+REQUESTS = Counter(
+    'http_requests_total',
+    'Число обработанных запросов',
+    ['operation', 'method', 'status'],
+)
+LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Время обработки запроса, включая передачу тела ответа',
+    ['operation', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+
+def clear_store():
+    """Удаляет значения метрик завершившихся процессов. Вызывается до запуска воркеров"""
+    for file in Path(os.environ['PROMETHEUS_MULTIPROC_DIR']).glob('*.db'):
+        file.unlink(missing_ok=True)
+
+
+def mark_process_dead(pid: int):
+    multiprocess.mark_process_dead(pid)
+
+
+class MetricsMiddleware:
+    """
+    Операция определяется по обработчику (endpoint), который маршрутизатор записывает в scope.
+    Время измеряется до отправки последней части ответа, поэтому включает потоковую выгрузку.
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._operations: dict = {}
+
+    def _operation(self, scope: Scope) -> str:
+        endpoint = scope.get('endpoint')
+        if endpoint is None:
+            return UNMATCHED
+        if endpoint not in self._operations:
+            for route in scope['app'].routes:
+                if getattr(route, 'endpoint', None) is endpoint:
+                    self._operations[endpoint] = getattr(route, 'operation_id', None) or route.name
+                    break
+            else:
+                self._operations[endpoint] = endpoint.__name__
+        return self._operations[endpoint]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            operation = self._operation(scope)
+            method = scope['method']
+            REQUESTS.labels(operation, method, str(status_code)).inc()
+            LATENCY.labels(operation, method).observe(time.perf_counter() - start)
+
+
+def metrics(request: Request) -> Response:
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
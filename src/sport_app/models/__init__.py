@@ -3,6 +3,7 @@ from .schedules import *
 from .clients import *
 from .auth import *
 from .reports import *
+from .monitoring import *
 from ..database import as_dict
 
 
@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Optional
 from pydantic import BaseModel, Field, Json
 
 
@@ -30,3 +30,17 @@ class CreateClient(BaseClient):
 
 class ClientUpdate(BaseClient):
     pass
+
+
+class ClientsPage(BaseModel):
+    """
+    Страница списка клиентов. next_after_id - значение after_id для запроса следующей страницы,
+    total - количество клиентов, удовлетворяющих фильтрам (если запрошено)
+    """
+    items: list[Client]
+    next_after_id: Optional[int]
+    total: Optional[int]
+
+
+class ClientsMinimumPage(ClientsPage):
+    items: list[ClientMinimum]
@@ -0,0 +1,14 @@
+from pydantic import BaseModel
+
+
+class PoolStatus(BaseModel):
+    name: str
+    pid: int
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+    checkouts: int
+    timeouts: int
+    wait_avg_ms: float
+    wait_max_ms: float
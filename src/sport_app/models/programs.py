@@ -35,9 +35,16 @@ class InstructorUpdate(BaseInstructor):
     pass
 
 
+class PhotoVariants(BaseModel):
+    thumb: str
+    card: str
+    full: str
+
+
 class Instructor(BaseInstructor):
     id: int
     photo_src: Optional[str]
+    photo_variants: Optional[PhotoVariants]
 
     class Config:
         orm_mode = True
@@ -47,6 +54,7 @@ class InstructorPublic(BaseModel):
     id: int
     credentials: str
     photo_src: Optional[str]
+    photo_variants: Optional[PhotoVariants]
 
     class Config:
         orm_mode = True
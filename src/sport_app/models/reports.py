@@ -10,6 +10,15 @@ class Periods(str, enum.Enum):
     month = "month"
 
 
+class ExportFormat(str, enum.Enum):
+    csv = "csv"
+    ndjson = "ndjson"
+
+    @property
+    def media_type(self) -> str:
+        return {"csv": "text/csv", "ndjson": "application/x-ndjson"}[self.value]
+
+
 class ProgramsReport(BaseModel):
     programs: list[int]
     period: Periods
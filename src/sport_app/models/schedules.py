@@ -54,4 +54,17 @@ class ScheduleRecord(BaseModel):
     date: datetime.datetime
     duration: int
     registration_opens_at: Optional[datetime.datetime]
-    places_available: Optional[int]
\ No newline at end of file
+    places_available: Optional[int]
+
+
+class ScheduleOccurrence(BaseModel):
+    program: int
+    date: datetime.datetime
+    duration: int
+    registration_opens_at: Optional[datetime.datetime]
+    places_available: Optional[int]
+
+
+class CompactSchedule(BaseModel):
+    programs: dict[int, Program]
+    occurrences: list[ScheduleOccurrence]
\ No newline at end of file
@@ -0,0 +1,68 @@
+"""
+    Статистика запросов к базе данных за HTTP-запрос.
+    Middleware собирает число запросов, их общее время и самые долгие запросы (database.collect_query_stats).
+    Сотрудникам статистика возвращается в заголовках ответа X-DB-Queries и Server-Timing (отображается в
+    инструментах разработчика браузера). Запросы, выполненные не менее settings.sql_repeat_threshold раз,
+    записываются в журнал как возможная проблема N+1, сводка по запросу - на уровне DEBUG.
+"""
+import logging
+from typing import Optional
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .database import collect_query_stats, QueryStats
+from .services.auth import AuthService
+from . import models
+
+
+logger = logging.getLogger(__name__)
+
+
+def _shorten(statement: str, length: int = 200) -> str:
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= length else f'{statement[:length]}...'
+
+
+def _staff_member(scope: Scope) -> Optional[models.Staff]:
+    authorization = Headers(scope=scope).get('authorization', '')
+    scheme, _, token = authorization.partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    try:
+        return AuthService.verify_token(token)
+    except HTTPException:
+        return None
+
+
+def log_query_stats(scope: Scope, stats: QueryStats):
+    request = f"{scope['method']} {scope['path']}"
+    for statement, executions in stats.repeated():
+        logger.warning('%s: statement executed %d times, possible N+1: %s', request, executions, _shorten(statement))
+    if stats.count and logger.isEnabledFor(logging.DEBUG):
+        slowest = '; '.join(f'{duration * 1000:.1f} ms {_shorten(statement)}' for duration, statement in stats.slowest)
+        logger.debug('%s: %d queries, %.1f ms, slowest: %s', request, stats.count, stats.total_s * 1000, slowest)
+
+
+class QueryStatsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        with collect_query_stats() as stats:
+            async def send_with_stats(message: Message):
+                if message['type'] == 'http.response.start' and _staff_member(scope) is not None:
+                    headers = MutableHeaders(scope=message)
+                    headers['X-DB-Queries'] = str(stats.count)
+                    headers.append('Server-Timing', f'db;dur={stats.total_s * 1000:.1f};desc="{stats.count} queries"')
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_stats)
+            finally:
+                log_query_stats(scope, stats)
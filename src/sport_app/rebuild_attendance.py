@@ -0,0 +1,67 @@
+"""
+    Пересоздание счетчиков посещаемости (program_attendance, client_attendance) после изменения settings.timezone.
+    Триггер booked_classes_attendance получает часовой пояс аргументом при создании, поэтому сам он изменение
+    настройки не замечает. Скрипт в одной транзакции под блокировкой записи в booked_classes пересоздает триггер
+    с текущим часовым поясом и заново заполняет счетчики по всем бронированиям. Запускается из того же рабочего
+    каталога, что и приложение:
+
+        python -m sport_app.rebuild_attendance
+"""
+import argparse
+import sys
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from . import tables
+from .database import engine
+from .settings import settings
+
+
+BOOKING_PERIODS = """
+SELECT client, program, 'week' AS period,
+       date_part('isoyear', timezone(:timezone, date)) AS year,
+       date_part('week', timezone(:timezone, date)) AS num
+FROM booked_classes WHERE date IS NOT NULL
+UNION ALL
+SELECT client, program, 'month',
+       date_part('year', timezone(:timezone, date)),
+       date_part('month', timezone(:timezone, date))
+FROM booked_classes WHERE date IS NOT NULL
+"""
+
+
+def rebuild(connection: Connection, timezone: str) -> int:
+    """
+    Пересоздает триггер и счетчики в часовом поясе timezone в текущей транзакции connection
+    :return: количество строк program_attendance
+    """
+    connection.execute(text('LOCK TABLE booked_classes IN SHARE ROW EXCLUSIVE MODE'))
+    connection.execute(text('DROP TRIGGER IF EXISTS booked_classes_attendance ON booked_classes'))
+    connection.execute(tables.booked_classes_attendance_trigger(timezone))
+    connection.execute(text('TRUNCATE program_attendance, client_attendance'))
+    result = connection.execute(text(f"""
+    INSERT INTO program_attendance (program, period, year, num, amount)
+    SELECT program, period, year, num, count(*) FROM ({BOOKING_PERIODS}) AS b
+    GROUP BY program, period, year, num
+    """), {'timezone': timezone})
+    connection.execute(text(f"""
+    INSERT INTO client_attendance (client, program, period, year, num, amount)
+    SELECT client, program, period, year, num, count(*) FROM ({BOOKING_PERIODS}) AS b
+    GROUP BY client, program, period, year, num
+    """), {'timezone': timezone})
+    return result.rowcount
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog='python -m sport_app.rebuild_attendance', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args(argv)
+    with engine.begin() as connection:
+        rows = rebuild(connection, settings.timezone)
+    print(f'{settings.timezone}: program_attendance rows: {rows}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,9 +1,9 @@
 from .programs.category import CategoryService
 from .programs.program import ProgramService
-from .programs.instructor import InstructorService
+from .programs.instructor import InstructorService, AsyncInstructorService
 from .programs.placement import PlacementService
-from .schedules.schedule import ScheduleService
+from .schedules.schedule import ScheduleService, AsyncScheduleService
 from .schedules.records import RecordService
 from .schedules.schema import SchemaService
-from .client import ClientService
-from .auth import AuthService
\ No newline at end of file
+from .client import ClientService, AsyncClientService
+from .auth import AuthService, AsyncAuthService
\ No newline at end of file
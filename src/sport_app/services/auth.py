@@ -1,4 +1,10 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
+from typing import Callable, Optional, TypeVar
 
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
@@ -8,10 +14,12 @@ from jose import (
 )
 from passlib.hash import bcrypt
 from pydantic import ValidationError
-from sqlalchemy import delete
+from sqlalchemy import delete, update
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..database import Session, get_session
+from .schedules.cache import SharedVersion
+from ..database import Session, get_session, get_async_session
 from ..settings import settings
 from .. import models, tables
 
@@ -19,6 +27,96 @@ from .. import models, tables
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='api/auth/sign-in/')
 
 
+class TokenCache:
+    """
+    Кэш проверенных токенов: токен -> сотрудник. Запись действительна до истечения срока действия токена (exp),
+    при превышении maxsize вытесняется давно не использованная запись. Отзыв токенов сотрудника увеличивает версию,
+    общую для процессов на сервере, и кэши всех процессов очищаются.
+    """
+    def __init__(self, version: SharedVersion, maxsize: int):
+        self.version = version
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, tuple[float, models.Staff]] = OrderedDict()
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        version = self.version.value
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def get(self, token: str) -> Optional[models.Staff]:
+        with self._lock:
+            self._sync()
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return entry[1]
+
+    def set(self, token: str, staff_member: models.Staff, expires_at: float):
+        with self._lock:
+            self._sync()
+            self._entries[token] = (expires_at, staff_member)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def revoke(self, staff_id: int):
+        """Удаляет из кэша токены сотрудника"""
+        with self._lock:
+            for token in [t for t, (_, staff_member) in self._entries.items() if staff_member.id == staff_id]:
+                del self._entries[token]
+        self.version.bump()
+
+
+token_cache = TokenCache(SharedVersion(settings.auth_version_path), settings.token_cache_size)
+
+
+T = TypeVar('T')
+
+
+class PasswordHasher:
+    """
+    Хэширование и проверка паролей bcrypt в отдельном пуле из workers потоков, чтобы вход множества сотрудников
+    не занимал потоки, обслуживающие остальные запросы. Если пул занят и в очереди уже queue_size задач,
+    запрос сразу отклоняется с кодом 503. Хэши со стоимостью, отличной от rounds, требуют обновления.
+    """
+    busy_exception = HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail='Слишком много попыток входа, повторите попытку',
+        headers={'Retry-After': '1'},
+    )
+
+    def __init__(self, workers: int, queue_size: int, rounds: int):
+        self.handler = bcrypt.using(rounds=rounds, min_desired_rounds=rounds, max_desired_rounds=rounds)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def _submit(self, func: Callable[..., T], *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasher.busy_exception
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(self.handler.hash, password))
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        return await asyncio.wrap_future(self._submit(self.handler.verify, password, password_hash))
+
+    def needs_update(self, password_hash: str) -> bool:
+        return self.handler.needs_update(password_hash)
+
+
+password_hasher = PasswordHasher(settings.password_workers, settings.password_queue_size, settings.bcrypt_rounds)
+
+
 def get_current_staff(token: str = Depends(oauth2_scheme)) -> models.Staff:
     return AuthService.verify_token(token)
 
@@ -43,14 +141,17 @@ def validate_operator_access(staff_member: models.Staff = Depends(get_current_st
 class AuthService:
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str) -> bool:
-        return bcrypt.verify(plain_password, hashed_password)
+        return password_hasher.handler.verify(plain_password, hashed_password)
 
     @staticmethod
     def hash_password(password: str) -> str:
-        return bcrypt.hash(password)
+        return password_hasher.handler.hash(password)
 
     @staticmethod
     def verify_token(token: str) -> models.Staff:
+        if (user := token_cache.get(token)) is not None:
+            return user
+
         exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail='Could not validate credentials',
@@ -72,6 +173,12 @@ class AuthService:
         except ValidationError:
             raise exception from None
 
+        # create_token всегда указывает срок действия, токен без него бессрочный и не принимается
+        expires_at = payload.get('exp')
+        if expires_at is None:
+            raise exception
+
+        token_cache.set(token, user, expires_at)
         return user
 
     @staticmethod
@@ -99,17 +206,35 @@ class AuthService:
     def register_new_staff(
         self,
         user_data: models.StaffCreate,
+        password_hash: Optional[str] = None,
     ) -> models.Staff:
+        """:param password_hash: хэш пароля, вычисленный заранее"""
         user = tables.Staff(
             email=user_data.email,
             username=user_data.username,
-            password_hash=self.hash_password(user_data.password),
+            password_hash=password_hash or self.hash_password(user_data.password),
             role=tables.Roles.operator
         )
         self.session.add(user)
         self.session.commit()
         return user
 
+    def get_staff_by_username(self, username: str) -> Optional[tables.Staff]:
+        return (
+            self.session
+            .query(tables.Staff)
+            .filter_by(username=username)
+            .scalar()
+        )
+
+    def update_password_hash(self, staff_id: int, password_hash: str):
+        self.session.execute(
+            update(tables.Staff)
+            .where(tables.Staff.id == staff_id)
+            .values(password_hash=password_hash)
+        )
+        self.session.commit()
+
     def authenticate_staff(
         self,
         username: str,
@@ -121,12 +246,7 @@ class AuthService:
             headers={'WWW-Authenticate': 'Bearer'},
         )
 
-        user = (
-            self.session
-            .query(tables.Staff)
-            .filter_by(username=username)
-            .scalar()
-        )
+        user = self.get_staff_by_username(username)
 
         if not user:
             raise exception
@@ -167,3 +287,54 @@ class AuthService:
             self.session.commit()
         except IntegrityError:
             raise HTTPException(status.HTTP_409_CONFLICT)
+        token_cache.revoke(staff_id)
+
+
+class AsyncAuthService:
+    """
+    Асинхронный вход и регистрация сотрудников: пароли обрабатываются в пуле password_hasher,
+    запросы к базе данных выполняются методами AuthService через AsyncSession.run_sync
+    """
+    def __init__(
+        self,
+        session: AsyncSession = Depends(get_async_session),
+    ):
+        self.session = session
+
+    async def register_new_staff(
+        self,
+        user_data: models.StaffCreate,
+    ) -> models.Staff:
+        password_hash = await password_hasher.hash(user_data.password)
+        return await self.session.run_sync(
+            lambda session: AuthService(session).register_new_staff(user_data, password_hash)
+        )
+
+    async def authenticate_staff(
+        self,
+        username: str,
+        password: str,
+    ) -> models.Token:
+        """Хэш пароля, вычисленный с прежней стоимостью bcrypt, заменяется при успешном входе"""
+        exception = HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Incorrect username or password',
+            headers={'WWW-Authenticate': 'Bearer'},
+        )
+
+        user = await self.session.run_sync(
+            lambda session: AuthService(session).get_staff_by_username(username)
+        )
+
+        if not user:
+            raise exception
+        if not await password_hasher.verify(password, user.password_hash):
+            raise exception
+
+        if password_hasher.needs_update(user.password_hash):
+            password_hash = await password_hasher.hash(password)
+            await self.session.run_sync(
+                lambda session: AuthService(session).update_password_hash(user.id, password_hash)
+            )
+
+        return AuthService.create_token(user)
@@ -0,0 +1,226 @@
+"""
+    Запись на занятия в момент открытия регистрации.
+    Регистрация на занятия открывается в 16:00 (Program.registration_opens_at), поэтому запросы на популярные занятия
+    приходят одновременно. Проверки записи выполняются по снимку программ и схем в памяти процесса (BookingCatalog),
+    который перестраивается только при изменении catalog_version и заранее прогревается фоновой задачей. Запросы на
+    одно занятие проходят через очередь (AdmissionGate): к базе данных одновременно обращается ограниченное число
+    запросов, остальные ожидают своей очереди, а при переполнении очереди или отсутствии мест сразу отклоняются.
+"""
+import asyncio
+import datetime
+import time
+from collections.abc import Container
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Hashable, Optional, TypeVar
+
+from fastapi import (
+    HTTPException,
+    status
+)
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession as _AsyncSession
+from sqlalchemy.orm import Session
+
+from .schedules.cache import SharedVersion, catalog_version
+from .schedules.schema import SchemaService
+from ..database import AsyncSession
+from .. import (
+    tables,
+    utils
+)
+
+
+# Занятие схемы: id программы, день недели, время дня
+Slot = tuple[int, int, datetime.time]
+SchemaT = TypeVar('SchemaT')
+
+
+def booking_schema(
+    date: datetime.datetime,
+    active_schema: Optional[SchemaT],
+    next_week_schema: Optional[SchemaT],
+) -> Optional[SchemaT]:
+    """Схема, по которой проводится занятие date: на следующей неделе - схема следующей недели, если она назначена"""
+    if date >= utils.next_mo() and next_week_schema:
+        return next_week_schema
+    return active_schema
+
+
+def check_booking(
+    program: tables.Program,
+    date: datetime.datetime,
+    slots: Container[Slot],
+):
+    """
+    Правила записи на занятие, общие для ClientService.book_client и BookingCatalog.validate
+    :param slots: занятия схемы, по которой проводится занятие date
+    """
+    if any([
+        not program.available_registration,
+        date < utils.now(),
+        utils.now() < program.registration_opens_at(date),
+    ]):
+        raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Регистрация закрыта")
+    if (program.id, date.weekday(), date.time()) not in slots:
+        raise HTTPException(status.HTTP_404_NOT_FOUND)
+
+
+class BookingCatalog:
+    """
+    Снимок программ и занятий действующей схемы и схемы следующей недели. Снимок строится по версии catalog_version
+    и неделе, на которой он построен, и перестраивается при изменении любой из них.
+    """
+    def __init__(self, version: SharedVersion, sessionmaker: Callable[[], _AsyncSession]):
+        self.version = version
+        # фабрика сессий, в которых строится снимок
+        self.sessionmaker = sessionmaker
+        self.programs: dict[int, tables.Program] = {}
+        self.active_schema: Optional[int] = None
+        self.next_week_schema: Optional[int] = None
+        self.slots: dict[int, frozenset[Slot]] = {}
+        self._key: Optional[Hashable] = None
+        self._loading: Optional[asyncio.Task] = None
+
+    def _current_key(self) -> Hashable:
+        return self.version.value, utils.this_mo()
+
+    @property
+    def is_stale(self) -> bool:
+        return self._key != self._current_key()
+
+    def load(self, session: Session):
+        """Строит снимок. Программы отсоединяются от сессии, поэтому не обновляются её откатом или закрытием"""
+        key = self._current_key()
+        programs = session.execute(select(tables.Program)).scalars().all()
+        for program in programs:
+            session.expunge(program)
+        active_schema, next_week_schema = SchemaService(session).current_schemas()
+        schema_ids = [schema.id for schema in (active_schema, next_week_schema) if schema]
+        slots = session.execute(
+            select(
+                tables.schedule_schema_record.c.schedule_schema,
+                tables.SchemaRecord.program,
+                tables.SchemaRecord.week_day,
+                tables.SchemaRecord.day_time,
+            )
+            .join(tables.SchemaRecord, tables.SchemaRecord.id == tables.schedule_schema_record.c.schema_record)
+            .where(tables.schedule_schema_record.c.schedule_schema.in_(schema_ids))
+        ).all()
+        self.programs = {program.id: program for program in programs}
+        self.active_schema = active_schema.id if active_schema else None
+        self.next_week_schema = next_week_schema.id if next_week_schema else None
+        self.slots = {
+            schema_id: frozenset((program, week_day, day_time) for schema, program, week_day, day_time in slots
+                                 if schema == schema_id)
+            for schema_id in schema_ids
+        }
+        self._key = key
+
+    async def _load(self):
+        async with self.sessionmaker() as session:
+            await session.run_sync(self.load)
+
+    async def refresh(self):
+        """
+        Перестраивает устаревший снимок. Одновременные запросы ожидают одно построение. Снимок строится в отдельной
+        сессии, поэтому отмена запроса, начавшего построение, не прерывает его для остальных
+        """
+        if not self.is_stale:
+            return
+        if self._loading is None or self._loading.done():
+            self._loading = asyncio.create_task(self._load())
+        await asyncio.shield(self._loading)
+
+    def validate(
+        self,
+        program_id: int,
+        date: datetime.datetime,
+    ):
+        """Проверки ClientService.book_client, выполняемые по снимку без обращения к базе данных"""
+        program = self.programs.get(program_id)
+        if program is None:
+            raise HTTPException(status.HTTP_404_NOT_FOUND)
+        schema = booking_schema(date, self.active_schema, self.next_week_schema)
+        check_booking(program, date, self.slots.get(schema, frozenset()))
+
+
+class _Occurrence:
+    def __init__(self, concurrency: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.queued = 0
+
+
+class AdmissionGate:
+    """
+    Очередь запросов на запись на каждое занятие. Очередь занятия существует, пока в ней есть запросы.
+    Занятие, на которое не хватило мест, считается заполненным в течение sold_out_ttl секунд: запросы на него
+    отклоняются без обращения к базе данных. Отмена записи в этом процессе снимает отметку сразу, в остальных
+    процессах - по истечении sold_out_ttl.
+    """
+    busy_exception = HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail='Слишком много запросов на занятие, повторите попытку',
+        headers={'Retry-After': '1'},
+    )
+
+    def __init__(
+        self,
+        sold_out_exception: HTTPException,
+        concurrency: int,
+        queue_size: int,
+        sold_out_ttl: float,
+    ):
+        self.sold_out_exception = sold_out_exception
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.sold_out_ttl = sold_out_ttl
+        self._occurrences: dict[Hashable, _Occurrence] = {}
+        self._sold_out: dict[Hashable, float] = {}
+
+    def is_sold_out(self, key: Hashable) -> bool:
+        expires = self._sold_out.get(key)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            self._sold_out.pop(key, None)
+            return False
+        return True
+
+    def mark_sold_out(self, key: Hashable):
+        now = time.monotonic()
+        if len(self._sold_out) > self.queue_size:
+            for expired in [k for k, expires in self._sold_out.items() if expires < now]:
+                del self._sold_out[expired]
+        self._sold_out[key] = now + self.sold_out_ttl
+
+    def release(self, key: Hashable):
+        """Снимает отметку о заполненности занятия, например, после отмены записи"""
+        self._sold_out.pop(key, None)
+
+    @asynccontextmanager
+    async def admit(self, key: Hashable) -> AsyncIterator[None]:
+        if self.is_sold_out(key):
+            raise self.sold_out_exception
+        occurrence = self._occurrences.get(key)
+        if occurrence is None:
+            occurrence = self._occurrences[key] = _Occurrence(self.concurrency)
+        if occurrence.queued >= self.queue_size:
+            raise AdmissionGate.busy_exception
+        occurrence.queued += 1
+        try:
+            async with occurrence.semaphore:
+                if self.is_sold_out(key):
+                    raise self.sold_out_exception
+                try:
+                    yield
+                except HTTPException as e:
+                    if e is self.sold_out_exception:
+                        self.mark_sold_out(key)
+                    raise
+        finally:
+            occurrence.queued -= 1
+            if not occurrence.queued:
+                del self._occurrences[key]
+
+
+booking_catalog = BookingCatalog(catalog_version, AsyncSession)
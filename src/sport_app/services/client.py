@@ -1,5 +1,6 @@
 import datetime
-from typing import Optional
+import re
+from typing import Optional, Union
 
 from fastapi import (
     Depends,
@@ -7,16 +8,19 @@ from fastapi import (
     status
 )
 from sqlalchemy import delete
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import IntegrityError, DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy import select, func
-from sqlalchemy.sql import and_
+from sqlalchemy.sql import and_, or_, case
 
 from . import (
     SchemaService,
     ProgramService
 )
-from ..database import get_session
+from .booking import AdmissionGate, Slot, booking_catalog, booking_schema, check_booking
+from ..database import get_session, get_async_session
+from ..settings import settings
 from .. import (
     tables,
     models,
@@ -24,11 +28,20 @@ from .. import (
 )
 
 
+def _escape_like(value: str) -> str:
+    """Экранирует служебные символы шаблона LIKE (escape-символ - обратная косая черта)"""
+    return re.sub(r'([\\%_])', r'\\\1', value)
+
+
 class ClientService:
     exception = HTTPException(
         status_code=status.HTTP_409_CONFLICT,
         detail='Номер телефона уже имеется в базе'
     )
+    no_seats_exception = HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail='Отсутствуют свободные места'
+    )
 
     def __init__(
         self,
@@ -58,20 +71,88 @@ class ClientService:
     ) -> tables.Client:
         return self._get_client(client_id)
 
+    @staticmethod
+    def _list_columns(staff_member: models.Staff) -> tuple[tuple, type[Union[models.Client, models.ClientMinimum]]]:
+        """Столбцы и модель клиента в списках: оператору доступны только id и ФИО"""
+        C = tables.Client
+        if staff_member.role == 'staff_role.admin':
+            return (C.id, C.credentials, C.phone, C.additional_data), models.Client
+        return (C.id, C.credentials), models.ClientMinimum
+
     def get_many(
         self,
-        staff_member: models.Staff
-    ) -> list[tables.Client]:
-        clients = (
-            self.session
-            .query(tables.Client)
-            .all()
+        staff_member: models.Staff,
+        after_id: Optional[int] = None,
+        limit: int = 50,
+        with_total: bool = False,
+        credentials: Optional[str] = None,
+        phone: Optional[str] = None,
+    ) -> Union[models.ClientsPage, models.ClientsMinimumPage]:
+        """
+        Страница клиентов, упорядоченных по id.
+        :param after_id: id последнего клиента предыдущей страницы
+        :param with_total: подсчитать количество клиентов, удовлетворяющих фильтрам
+        :param credentials: часть ФИО клиента без учета регистра
+        :param phone: начало номера телефона
+        """
+        C = tables.Client
+        columns, item_model = self._list_columns(staff_member)
+        page_model = models.ClientsPage if item_model is models.Client else models.ClientsMinimumPage
+
+        filters = []
+        if credentials:
+            filters.append(C.credentials.ilike(f'%{_escape_like(credentials)}%', escape='\\'))
+        if phone:
+            filters.append(C.phone.startswith(phone, autoescape=True))
+
+        stmt = select(*columns).where(*filters).order_by(C.id).limit(limit + 1)
+        if after_id is not None:
+            stmt = stmt.where(C.id > after_id)
+        rows = self.session.execute(stmt).all()
+        items = [item_model.from_orm(row) for row in rows[:limit]]
+
+        total = None
+        if with_total:
+            total = self.session.execute(select(func.count(C.id)).where(*filters)).scalar()
+        return page_model(
+            items=items,
+            next_after_id=items[-1].id if len(rows) > limit else None,
+            total=total,
         )
-        if staff_member.role == 'staff_role.admin':
-            clients = [models.Client.from_orm(c) for c in clients]
-        else:
-            clients = [models.ClientMinimum.from_orm(c) for c in clients]
-        return clients
+
+    def search(
+        self,
+        staff_member: models.Staff,
+        query: str,
+        limit: int = 20,
+    ) -> list[Union[models.Client, models.ClientMinimum]]:
+        """
+        Поиск клиентов по ФИО и номеру телефона с использованием триграммных индексов (pg_trgm).
+        Находит клиентов, ФИО которых начинается с query или содержит похожее на query слово (с опечатками),
+        и клиентов, номер телефона которых содержит цифры query (не менее трех). Сначала возвращаются совпадения
+        с начала ФИО или номера, затем - в порядке убывания схожести.
+        """
+        C = tables.Client
+        columns, item_model = self._list_columns(staff_member)
+        query = query.strip()
+        digits = re.sub(r'[^0-9]', '', query)
+        prefix = C.credentials.ilike(_escape_like(query) + '%', escape='\\')
+
+        conditions = [prefix, C.credentials.op('%>')(query)]
+        exact = [prefix]
+        score = func.word_similarity(query, C.credentials)
+        if len(digits) >= 3:
+            conditions.append(C.phone_digits.contains(digits))
+            exact.append(C.phone_digits.startswith(digits))
+            score = func.greatest(score, case((C.phone_digits.contains(digits), 1), else_=0))
+
+        stmt = (
+            select(*columns)
+            .where(or_(*conditions))
+            .order_by(or_(*exact).desc(), score.desc(), C.id)
+            .limit(limit)
+        )
+        return [item_model.from_orm(row) for row in self.session.execute(stmt).all()]
 
     def create_client(
         self,
@@ -126,49 +207,56 @@ class ClientService:
         :param date: дата занятия
         """
         program = self.program_service.get(program)
-        if any([
-            not program.available_registration,
-            date < utils.now(),
-            utils.now() < program.registration_opens_at(date),
-        ]):
-            raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Регистрация закрыта")
-
-        if all([
-            date >= utils.next_mo(),
-            nw_schema := self.schema_service.next_week_schema
-        ]):
-            schema = nw_schema
-        else:
-            schema = self.schema_service.active_schema
-
-        schema_record = (
-            self.session
-            .query(tables.SchemaRecord)
+        active_schema, next_week_schema = self.schema_service.current_schemas()
+        schema = booking_schema(date, active_schema, next_week_schema)
+        check_booking(program, date, self._schema_slots(schema, program.id, date))
+
+        self.reserve_place(client_id, program.id, date)
+
+    def _schema_slots(
+        self,
+        schema: Optional[tables.ScheduleSchema],
+        program_id: int,
+        date: datetime.datetime,
+    ) -> set[Slot]:
+        """Занятия программы в схеме schema, совпадающие с date по дню недели и времени"""
+        if schema is None:
+            return set()
+        R, SSR = tables.SchemaRecord, tables.schedule_schema_record
+        rows = self.session.execute(
+            select(R.program, R.week_day, R.day_time)
+            .join(SSR, SSR.c.schema_record == R.id)
             .where(and_(
-                tables.SchemaRecord.week_day == date.weekday(),
-                tables.SchemaRecord.day_time == date.time(),
-                tables.SchemaRecord.program == program.id)
-            ).scalar()
-        )
-        if schema_record not in schema.records:
-            raise HTTPException(status.HTTP_404_NOT_FOUND)
+                SSR.c.schedule_schema == schema.id,
+                R.week_day == date.weekday(),
+                R.day_time == date.time(),
+                R.program == program_id)
+            )
+        ).all()
+        return {tuple(row) for row in rows}
 
-        if program.place_limit:
-            BC = tables.BookedClasses
-            booked_places = self.session.execute(
-                select(func.count(BC.id))
-                .where(BC.date == date)
-                .where(BC.program == program.id)
-            ).scalar_one()
-            available_places = program.place_limit - booked_places
-            if not available_places:
-                raise HTTPException(status.HTTP_409_CONFLICT, detail="Отсутствуют свободные места")
+    def reserve_place(
+        self,
+        client_id: int,
+        program_id: int,
+        date: datetime.datetime,
+    ):
+        """
+        Вставка бронирования без проверок программы и схемы.
+        Наличие свободных мест проверяется триггером booked_classes_seats при вставке строки.
+        """
         try:
-            place = tables.BookedClasses(client=client_id, program=program.id, date=date)
+            place = tables.BookedClasses(client=client_id, program=program_id, date=date)
             self.session.add(place)
             self.session.commit()
         except IntegrityError:
+            self.session.rollback()
             raise HTTPException(status.HTTP_409_CONFLICT, detail="Клиент уже записан или не найден")
+        except DBAPIError as e:
+            self.session.rollback()
+            if getattr(e.orig, 'pgcode', None) == tables.NO_SEATS_SQLSTATE:
+                raise ClientService.no_seats_exception from None
+            raise
 
     def remove_client_booking(
         self,
@@ -191,5 +279,45 @@ class ClientService:
         self.session.commit()
 
 
+admission_gate = AdmissionGate(
+    ClientService.no_seats_exception,
+    concurrency=settings.booking_concurrency,
+    queue_size=settings.booking_queue_size,
+    sold_out_ttl=settings.booking_sold_out_ttl_s,
+)
 
 
+class AsyncClientService:
+    """
+    Асинхронный вариант записи клиентов на занятия, выполняющий методы ClientService через AsyncSession.run_sync.
+    Запись проверяется по снимку booking_catalog и проходит через очередь занятия admission_gate (см. services.booking).
+    """
+    def __init__(
+        self,
+        session: AsyncSession = Depends(get_async_session),
+    ):
+        self.session = session
+
+    async def book_client(
+        self,
+        client_id: int,
+        program: int,
+        date: datetime.datetime,
+    ):
+        await booking_catalog.refresh()
+        booking_catalog.validate(program, date)
+        async with admission_gate.admit((program, date)):
+            await self.session.run_sync(
+                lambda session: ClientService(session).reserve_place(client_id, program, date)
+            )
+
+    async def remove_client_booking(
+        self,
+        client_id: int,
+        program: int,
+        date: datetime.datetime
+    ):
+        await self.session.run_sync(
+            lambda session: ClientService(session).remove_client_booking(client_id, program, date)
+        )
+        admission_gate.release((program, date))
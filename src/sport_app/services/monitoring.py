@@ -0,0 +1,34 @@
+import os
+
+from sqlalchemy.engine import Engine
+
+from ..database import engine, async_engine, PoolStats
+from .. import models
+
+
+def pool_status(name: str, engine: Engine) -> models.PoolStatus:
+    pool = engine.pool
+    stats: PoolStats = getattr(pool, 'stats', None) or PoolStats()
+    return models.PoolStatus(
+        name=name,
+        pid=os.getpid(),
+        size=pool.size(),
+        checked_in=pool.checkedin(),
+        checked_out=pool.checkedout(),
+        overflow=max(pool.overflow(), 0),
+        checkouts=stats.checkouts,
+        timeouts=stats.timeouts,
+        wait_avg_ms=stats.wait_total_s / max(stats.checkouts + stats.timeouts, 1) * 1000,
+        wait_max_ms=stats.wait_max_s * 1000,
+    )
+
+
+def pools_status() -> list[models.PoolStatus]:
+    """
+    Состояние пулов соединений воркера, обработавшего запрос. Каждый воркер gunicorn имеет собственные пулы,
+    поэтому ответ содержит pid воркера
+    """
+    return [
+        pool_status('sync', engine),
+        pool_status('async', async_engine.sync_engine),
+    ]
@@ -1,5 +1,4 @@
 from pathlib import Path
-from secrets import token_urlsafe
 from typing import (
     Optional, Union
 )
@@ -10,12 +9,14 @@ from fastapi import (
     status
 )
 from fastapi import UploadFile
-from sqlalchemy import delete
+from sqlalchemy import delete, exists
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from ...database import get_session
+from ...database import get_session, get_async_session
 from ...settings import settings
+from ... import images
 
 from ... import (
     tables,
@@ -23,11 +24,16 @@ from ... import (
 )
 
 
+def upload_dir() -> Path:
+    return Path.cwd() / settings.images_path / 'instructors'
+
+
 class InstructorService:
     exception = HTTPException(
         status_code=status.HTTP_409_CONFLICT,
         detail='Номер телефона уже имеется в базе'
     )
+    image_exception = HTTPException(status.HTTP_400_BAD_REQUEST, detail='Invalid image type')
 
     def __init__(
         self,
@@ -60,9 +66,6 @@ class InstructorService:
             model = models.InstructorPublic.from_orm(instructor)
         else:
             model = models.Instructor.from_orm(instructor)
-        if t := instructor.photo_token:
-            model.photo_src = f'{settings.images_path}/instructors/{t}.jpg'
-
         return model
 
     def get_many(
@@ -73,13 +76,7 @@ class InstructorService:
             .query(tables.Instructor)
             .all()
         )
-        instructors_models = []
-        for instructor in instructors:
-            model = models.Instructor.from_orm(instructor)
-            if t := instructor.photo_token:
-                model.photo_src = f'{settings.images_path}/instructors/{t}.jpg'
-            instructors_models.append(model)
-        return instructors_models
+        return [models.Instructor.from_orm(instructor) for instructor in instructors]
 
     def create_instructor(
         self,
@@ -96,30 +93,31 @@ class InstructorService:
             raise InstructorService.exception from None
         return instructor
 
-    def upload_image(
+    def replace_image(
         self,
         instructor_id: int,
-        image: UploadFile,
+        img_token: str,
     ) -> models.InstructorPublic:
+        """
+        Заменяет фотографию инструктора вариантами, сохраненными под именем img_token. Файлы прежней фотографии
+        удаляются, если она не используется другими инструкторами (одинаковые изображения имеют одно имя)
+        """
         instructor = self._get(instructor_id)
-        if not any([
-            image.content_type == 'image/jpeg',
-            image.content_type == 'image/png',
-        ]):
-            raise HTTPException(status.HTTP_400_BAD_REQUEST, detail='Invalid image type')
-        upload_dir = Path.cwd() / settings.images_path / 'instructors'
-        upload_dir.mkdir(parents=True, exist_ok=True)
-        img_token = token_urlsafe(10)
-        filename = f'{img_token}.jpg'
-        with open(upload_dir / filename, 'wb') as out:
-            while content := image.file.read(1024):
-                out.write(content)
-        if old_img_token := instructor.photo_token:
-            (upload_dir / f'{old_img_token}.jpg').unlink(missing_ok=True)
+        old_img_token = instructor.photo_token
         instructor.photo_token = img_token
         self.session.commit()
+        if old_img_token and old_img_token != img_token and not self._image_in_use(old_img_token):
+            images.remove(upload_dir(), old_img_token)
         return self.get_instructor(instructor_id, for_public=True)
 
+    def _image_in_use(
+        self,
+        img_token: str
+    ) -> bool:
+        return self.session.query(
+            exists().where(tables.Instructor.photo_token == img_token)
+        ).scalar()
+
     def delete_instructor(
         self,
         instructor_id: int
@@ -145,4 +143,37 @@ class InstructorService:
         except IntegrityError:
             self.session.rollback()
             raise InstructorService.exception from None
-        return instructor
\ No newline at end of file
+        return instructor
+
+
+class AsyncInstructorService:
+    """
+    Загрузка фотографий инструкторов: варианты изображения создаются в пуле процессов image_processor,
+    запросы к базе данных выполняются методами InstructorService через AsyncSession.run_sync
+    """
+    def __init__(
+        self,
+        session: AsyncSession = Depends(get_async_session),
+    ):
+        self.session = session
+
+    async def upload_image(
+        self,
+        instructor_id: int,
+        image: UploadFile,
+    ) -> models.InstructorPublic:
+        await self.session.run_sync(lambda session: InstructorService(session)._get(instructor_id))
+        if not any([
+            image.content_type == 'image/jpeg',
+            image.content_type == 'image/png',
+        ]):
+            raise InstructorService.image_exception
+        directory = upload_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        try:
+            img_token = await images.image_processor.render(await image.read(), directory)
+        except images.InvalidImage:
+            raise InstructorService.image_exception from None
+        return await self.session.run_sync(
+            lambda session: InstructorService(session).replace_image(instructor_id, img_token)
+        )
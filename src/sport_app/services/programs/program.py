@@ -51,6 +51,7 @@ class ProgramService:
         programs = (
             self.session
             .query(tables.Program)
+            .options(*tables.program_model_options)
             .all()
         )
         return [c.to_model()
@@ -1,11 +1,22 @@
+import csv
+import datetime
+import io
+import json
+from typing import AsyncIterator, Optional
+
 from fastapi import (
     Depends,
 )
+from pydantic.json import pydantic_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from sqlalchemy.engine import Row
+from sqlalchemy.sql import Select
 from sqlalchemy import select, func, desc
 from sqlalchemy.orm import aliased
 
-from ..database import get_session
+from ..database import get_session, get_async_session
+from ..settings import settings
 from .. import (
     tables,
     models,
@@ -22,19 +33,19 @@ class ReportsService:
 
     def client_report(self, client_id: int, period: models.Periods) -> list[models.ClientReportRow]:
         """Отчёт о видах и количестве посещенных занятиях клиентом в динамике"""
-        BC = tables.BookedClasses
+        CA = tables.ClientAttendance
 
         rows = self.session.execute(
             select(
-                func.extract("year", BC.date).label("year"),
-                func.extract(period.name, BC.date).label("period"),
-                func.count(BC.id),
+                CA.year,
+                CA.num.label("period"),
+                CA.amount.label("count"),
                 tables.Program
             )
-            .join(BC)
-            .where(BC.client == client_id)
-            .group_by("year", "period", tables.Program)
-            .order_by(tables.Program.id, desc("year"), desc("period"))
+            .join(tables.Program)
+            .where(CA.client == client_id, CA.period == period.name, CA.amount > 0)
+            .order_by(tables.Program.id, desc(CA.year), desc(CA.num))
+            .options(*tables.program_model_options)
         ).all()
 
         response = {}
@@ -63,24 +74,24 @@ class ReportsService:
             period_end = utils.last_month_day(row.year, row.period)
         return period_begin, period_end
 
-    def programs_report(self, req: models.ProgramsReport) -> models.ProgramsReportResponse:
-        """Отчет о количестве и динамике изменений посещаемости занятия или группы занятий по неделям/месяцам"""
-        BC = tables.BookedClasses
-        subq = (
-            select(BC.date, func.count(BC.id))
-            .where(BC.program.in_(req.programs))
-            .group_by(BC.date)
-            .subquery()
-        )
-        rows = self.session.execute(
+    @staticmethod
+    def programs_report_query(req: models.ProgramsReport) -> Select:
+        PA = tables.ProgramAttendance
+        return (
             select(
-                func.extract(req.period.name, subq.c.date).label("period"),
-                func.extract("year", subq.c.date).label("year"),
-                func.sum(subq.c.count)
+                PA.num.label("period"),
+                PA.year,
+                func.sum(PA.amount).label("sum")
             )
-            .group_by("year", "period")
-            .order_by(desc("year"), desc("period"))
-        ).all()
+            .where(PA.program.in_(req.programs), PA.period == req.period.name)
+            .group_by(PA.year, PA.num)
+            .having(func.sum(PA.amount) > 0)
+            .order_by(desc(PA.year), desc(PA.num))
+        )
+
+    def programs_report(self, req: models.ProgramsReport) -> models.ProgramsReportResponse:
+        """Отчет о количестве и динамике изменений посещаемости занятия или группы занятий по неделям/месяцам"""
+        rows = self.session.execute(self.programs_report_query(req)).all()
 
         data = []
         for row in rows:
@@ -96,3 +107,110 @@ class ReportsService:
             period=req.period,
             data=data
         )
+
+
+class AsyncReportsService:
+    """Асинхронный вариант ReportsService, выполняющий синхронные методы через AsyncSession.run_sync"""
+    def __init__(
+        self,
+        session: AsyncSession = Depends(get_async_session),
+    ):
+        self.session = session
+
+    async def client_report(self, client_id: int, period: models.Periods) -> list[models.ClientReportRow]:
+        return await self.session.run_sync(
+            lambda session: ReportsService(session).client_report(client_id, period)
+        )
+
+    async def programs_report(self, req: models.ProgramsReport) -> models.ProgramsReportResponse:
+        return await self.session.run_sync(
+            lambda session: ReportsService(session).programs_report(req)
+        )
+
+    async def _partitions(self, stmt: Select) -> AsyncIterator[list[Row]]:
+        """
+        Читает результат запроса серверным курсором частями по settings.export_batch_size строк.
+        Запрос выбирает столбцы, а не объекты, поэтому прочитанные строки не накапливаются в сессии.
+        """
+        result = await self.session.stream(stmt)
+        async for partition in result.partitions(settings.export_batch_size):
+            yield partition
+
+    async def _export(self, stmt: Select) -> AsyncIterator[list[dict]]:
+        async for partition in self._partitions(stmt):
+            yield [row._asdict() for row in partition]
+
+    def export_bookings(
+        self,
+        date_from: Optional[datetime.datetime] = None,
+        date_to: Optional[datetime.datetime] = None,
+    ) -> AsyncIterator[list[dict]]:
+        """Бронирования на занятия в период [date_from, date_to)"""
+        BC = tables.BookedClasses
+        stmt = (
+            select(
+                BC.id,
+                BC.date,
+                BC.client,
+                tables.Client.credentials.label("client_credentials"),
+                BC.program,
+                tables.Program.name.label("program_name"),
+            )
+            .join(tables.Client, tables.Client.id == BC.client)
+            .join(tables.Program, tables.Program.id == BC.program)
+            .order_by(BC.date, BC.id)
+        )
+        if date_from:
+            stmt = stmt.where(BC.date >= date_from)
+        if date_to:
+            stmt = stmt.where(BC.date < date_to)
+        return self._export(stmt)
+
+    def export_client_history(self, client_id: int) -> AsyncIterator[list[dict]]:
+        """Все бронирования клиента"""
+        BC = tables.BookedClasses
+        stmt = (
+            select(
+                BC.date,
+                BC.program,
+                tables.Program.name.label("program_name"),
+            )
+            .join(tables.Program, tables.Program.id == BC.program)
+            .where(BC.client == client_id)
+            .order_by(BC.date, BC.program)
+        )
+        return self._export(stmt)
+
+    async def export_programs_report(self, req: models.ProgramsReport) -> AsyncIterator[list[dict]]:
+        async for partition in self._partitions(ReportsService.programs_report_query(req)):
+            data = []
+            for row in partition:
+                period_begin, period_end = ReportsService.calc_periods(req.period, row)
+                data.append(models.ProgramsReportRow(
+                    period_begin=period_begin,
+                    period_end=period_end,
+                    period_num=row.period,
+                    amount=row.sum
+                ).dict())
+            yield data
+
+
+async def encode_export(
+    partitions: AsyncIterator[list[dict]],
+    export_format: models.ExportFormat,
+) -> AsyncIterator[str]:
+    """Кодирует строки выгрузки в CSV (с заголовком) или NDJSON. Каждая часть строк кодируется одним фрагментом"""
+    header = True
+    async for partition in partitions:
+        if not partition:
+            continue
+        if export_format == models.ExportFormat.ndjson:
+            yield ''.join(json.dumps(row, default=pydantic_encoder, ensure_ascii=False) + '\n' for row in partition)
+            continue
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=list(partition[0]))
+        if header:
+            writer.writeheader()
+            header = False
+        writer.writerows(partition)
+        yield buffer.getvalue()
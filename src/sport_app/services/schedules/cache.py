@@ -0,0 +1,195 @@
+"""
+    Кэш и версия сформированного расписания.
+    Расписание зависит от небольшого набора таблиц, которые изменяются несколько раз в неделю, тогда как
+    GET /api/schedule запрашивается постоянно. Фиксация (commit) транзакции, изменившей строки этих таблиц, увеличивает
+    версию расписания. Версия хранится в файле, отображенном в память (mmap), поэтому она общая для всех воркеров на
+    сервере и читается без обращения к базе данных. Расписание, сериализованное в JSON (ScheduleService.encoded_schedule),
+    хранится в памяти процесса вместе с версией, по которой оно построено, и перестает использоваться при её изменении.
+    Версия и текущий день, входящие в ключ кэша, определяют и ETag ответа.
+"""
+import datetime
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+from pathlib import Path
+from typing import Any, Hashable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, ORMExecuteState
+
+from ... import tables
+from ...settings import settings
+
+
+# Сущности, от которых зависит сформированное расписание
+SCHEDULE_ENTITIES = (
+    tables.Category,
+    tables.Placement,
+    tables.Instructor,
+    tables.Program,
+    tables.SchemaRecord,
+    tables.ScheduleSchema,
+    tables.BookedClasses,
+)
+
+SCHEDULE_TABLES = frozenset(
+    [entity.__tablename__ for entity in SCHEDULE_ENTITIES] + [tables.schedule_schema_record.name]
+)
+
+# Удаление клиента каскадно удаляет его бронирования
+CASCADE_TABLES = frozenset([tables.Client.__tablename__])
+
+# Таблицы, от которых зависит проверка возможности записи на занятие (BookingCatalog), но не количество мест
+CATALOG_TABLES = frozenset([
+    tables.Program.__tablename__,
+    tables.SchemaRecord.__tablename__,
+    tables.ScheduleSchema.__tablename__,
+    tables.schedule_schema_record.name,
+])
+
+_CHANGED_KEY = 'schedule_changed'
+_CATALOG_CHANGED_KEY = 'catalog_changed'
+
+# Расписание, сериализованное в JSON
+Schedule = bytes
+
+
+class SharedVersion:
+    """
+    Монотонно возрастающая версия данных, общая для процессов на одном сервере.
+    Файл содержит номер версии и время её изменения (unix time). Оба значения входят в ETag, поэтому пересоздание
+    файла (сброс номера версии) не приводит к совпадению ETag с выданными ранее.
+    """
+    _layout = struct.Struct('Qd')
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._map: Optional[mmap.mmap] = None
+        self._fd: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _open(self) -> mmap.mmap:
+        with self._lock:
+            if self._map is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    if os.fstat(fd).st_size < self._layout.size:
+                        os.write(fd, self._layout.pack(0, time.time()))
+                finally:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                self._fd = fd
+                self._map = mmap.mmap(fd, self._layout.size)
+        return self._map
+
+    def read(self) -> tuple[int, float]:
+        """Возвращает номер версии и время её изменения"""
+        return self._layout.unpack_from(self._map or self._open())
+
+    @property
+    def value(self) -> int:
+        return self.read()[0]
+
+    def bump(self):
+        buffer = self._map or self._open()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            version, _ = self._layout.unpack_from(buffer)
+            self._layout.pack_into(buffer, 0, version + 1, time.time())
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class ScheduleCache:
+    """
+    LRU-кэш сериализованного расписания. Ключ - набор фильтров и текущий день (от него зависят неделя расписания и
+    вычисляемые поля занятий). Значение хранится с версией расписания, которая была актуальна до начала его
+    построения, и возвращается только пока эта версия не изменилась.
+    """
+    def __init__(self, version: SharedVersion, maxsize: int):
+        self.version = version
+        self.maxsize = maxsize
+        self._entries: OrderedDict[Hashable, tuple[int, Schedule]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(filters: dict[str, Any], day: datetime.datetime) -> Hashable:
+        return tuple(sorted((k, v) for k, v in filters.items() if v)), day
+
+    def get(self, key: Hashable) -> Optional[Schedule]:
+        version = self.version.value
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: Hashable, value: Schedule, version: int):
+        """Сохраняет значение, построенное по данным версии version"""
+        if version != self.version.value:
+            return
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        self.version.bump()
+
+
+schedule_version = SharedVersion(settings.schedule_version_path)
+schedule_cache = ScheduleCache(schedule_version, settings.schedule_cache_size)
+# Версия программ и схем без учета бронирований, которые изменяются постоянно
+catalog_version = SharedVersion(settings.catalog_version_path)
+
+
+def _mark_changed(session: Session, table: str, delete: bool = False):
+    if table in SCHEDULE_TABLES or (delete and table in CASCADE_TABLES):
+        session.info[_CHANGED_KEY] = True
+    if table in CATALOG_TABLES:
+        session.info[_CATALOG_CHANGED_KEY] = True
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flush(session: Session, flush_context):
+    for obj in chain(session.new, session.dirty):
+        _mark_changed(session, obj.__table__.name)
+    for obj in session.deleted:
+        _mark_changed(session, obj.__table__.name, delete=True)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_execute(orm_execute_state: ORMExecuteState):
+    if not any([
+        orm_execute_state.is_insert,
+        orm_execute_state.is_update,
+        orm_execute_state.is_delete,
+    ]):
+        return
+    table = orm_execute_state.statement.table.name
+    _mark_changed(orm_execute_state.session, table, delete=orm_execute_state.is_delete)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session: Session):
+    if session.info.pop(_CHANGED_KEY, False):
+        schedule_cache.invalidate()
+    if session.info.pop(_CATALOG_CHANGED_KEY, False):
+        catalog_version.bump()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session: Session):
+    session.info.pop(_CHANGED_KEY, None)
+    session.info.pop(_CATALOG_CHANGED_KEY, None)
@@ -48,7 +48,12 @@ class RecordService:
         return schedule_record
 
     def get_many(self) -> list[models.SchemaRecord]:
-        records = self.session.query(tables.SchemaRecord).all()
+        records = (
+            self.session
+            .query(tables.SchemaRecord)
+            .options(*tables.record_model_options)
+            .all()
+        )
         return [record.to_model() for record in records]
 
     def delete_record(
@@ -1,19 +1,25 @@
 import datetime
+import json
 from typing import (
     Optional,
     NamedTuple,
-    Any
+    Any,
+    Union
 )
-from collections.abc import Iterable
+from collections.abc import Iterable, Iterator, AsyncIterator
 
 from dateutil import relativedelta as rd
-from fastapi import Depends
+from fastapi import Depends, HTTPException, status
+from pydantic.json import pydantic_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy import select, func
 from sqlalchemy.sql.expression import Select
 
 from .schema import SchemaService
-from ...database import get_session
+from .cache import schedule_cache, schedule_version
+from ...database import get_session, get_async_session
+from ...settings import settings
 from ... import (
     tables,
     models,
@@ -42,7 +48,8 @@ class ScheduleInstance(NamedTuple):
     def __hash__(self):
         return hash((self.program.id, self.date))
 
-    def to_model(self) -> models.ScheduleRecord:
+    def _registration(self) -> tuple[Optional[int], Optional[datetime.datetime]]:
+        """Возвращает количество свободных мест и дату открытия записи на занятие"""
         place_limit = self.program.place_limit
         places_available = None
         registration_opens_at = None
@@ -53,9 +60,23 @@ class ScheduleInstance(NamedTuple):
             if self.program.registration_opens:
                 registration_period = rd.relativedelta(days=self.program.registration_opens, hour=16)
                 registration_opens_at = self.date - registration_period
+        return places_available, registration_opens_at
 
+    def to_model(self, program: Optional[models.Program] = None) -> models.ScheduleRecord:
+        """:param program: модель программы, если она уже построена для другого занятия этой программы"""
+        places_available, registration_opens_at = self._registration()
         return models.ScheduleRecord(
-                program=self.program.to_model(),
+                program=program or self.program.to_model(),
+                duration=self.duration,
+                places_available=places_available,
+                registration_opens_at=registration_opens_at,
+                date=self.date,
+            )
+
+    def to_occurrence(self) -> models.ScheduleOccurrence:
+        places_available, registration_opens_at = self._registration()
+        return models.ScheduleOccurrence(
+                program=self.program.id,
                 duration=self.duration,
                 places_available=places_available,
                 registration_opens_at=registration_opens_at,
@@ -71,19 +92,6 @@ class ScheduleService:
         self.session = session
         self.schema_service = SchemaService(session)
 
-    def validate_active_schema(self):
-        next_week_schema = self.schema_service.next_week_schema
-        active_schema = self.schema_service.active_schema
-        if next_week_schema:
-            start_date = next_week_schema.to_be_active_from
-            if utils.now() > start_date:
-                next_week_schema.to_be_active_from = None
-                next_week_schema.active = True
-                active_schema.active = False
-                self.session.commit()
-                return next_week_schema, None
-        return active_schema, next_week_schema
-
     def _get_grid(
         self,
         schema: tables.ScheduleSchema,
@@ -95,6 +103,7 @@ class ScheduleService:
             .join(tables.SchemaRecord)
             .join(SSR)
             .where(SSR.c.schedule_schema == schema.id)
+            .options(*tables.program_model_options)
         ), filters)
         return \
             {hash((row.Program.id, row.SchemaRecord.date)):
@@ -102,13 +111,20 @@ class ScheduleService:
                 for row in self.session.execute(stmt).all()}
 
     @staticmethod
-    def _prolong_grid(grid: dict[str, ScheduleInstance]) -> dict[str, ScheduleInstance]:
-        week = rd.relativedelta(days=7)
+    def _prolong_grid(grid: dict[str, ScheduleInstance], weeks: int = 1) -> dict[str, ScheduleInstance]:
+        """Переносит занятия сетки на :weeks недель вперед (или назад при отрицательном значении)"""
+        week = rd.relativedelta(days=7 * weeks)
         return \
             {hash((obj.program.id, obj.date + week)):
                 ScheduleInstance(program=obj.program, duration=obj.duration, date=obj.date + week)
                 for obj in grid.values()}
 
+    @staticmethod
+    def _apply_booked_classes(grid: dict[str, ScheduleInstance], booked_classes: dict[str, int]):
+        for k, booked_places in booked_classes.items():
+            if k in grid:
+                grid[k] = grid[k]._replace(booked_places=booked_places)
+
     @staticmethod
     def _apply_filters(stmt: Select, filters: dict[str, Any]):
         for filter_pointer, filter_val in filters.items():
@@ -117,23 +133,101 @@ class ScheduleService:
                 stmt = stmt.where(cond)
         return stmt
 
-    def _count_booked_classes(self, filters: dict[str, Any]) -> dict[str, int]:
+    def _count_booked_classes(
+        self,
+        filters: dict[str, Any],
+        date_from: Optional[datetime.datetime] = None,
+        date_to: Optional[datetime.datetime] = None,
+    ) -> dict[str, int]:
         """
         Обращается к базе данных с целью подсчитать количество забронированных мест на занятия.
+        Без указания периода [date_from, date_to) подсчитываются места на все предстоящие занятия.
         """
         BC = tables.BookedClasses
-        stmt = self._apply_filters((
-            select(tables.Program, BC.date, func.count(BC.id))
+        stmt = (
+            select(tables.Program.id, BC.date, func.count(BC.id))
             .join(BC)
-            .where(BC.date > func.now())
-            .group_by(tables.Program, BC.date)
-        ), filters)
+            .group_by(tables.Program.id, BC.date)
+        )
+        if date_from or date_to:
+            stmt = stmt.where(BC.date >= date_from, BC.date < date_to)
+        else:
+            stmt = stmt.where(BC.date > func.now())
+        stmt = self._apply_filters(stmt, filters)
         return \
-            {hash((row.Program.id, row.date)): row.count
+            {hash((row.id, row.date)): row.count
                 for row in self.session.execute(stmt).all()}
 
-    def construct_schedule(self, filters: dict[str, Any]) -> list[models.ScheduleRecord]:
-        active_schema, next_week_schema = self.validate_active_schema()
+    def construct_schedule(
+        self,
+        filters: dict[str, Any],
+        compact: bool = False,
+    ) -> Union[list[models.ScheduleRecord], models.CompactSchedule]:
+        """
+        :param compact: вернуть расписание в нормализованном виде - словарь программ и список занятий,
+        ссылающихся на программы по id
+        """
+        instances = self._construct_schedule(filters)
+        if compact:
+            return self._to_compact(instances)
+        return self._to_models(instances)
+
+    def encoded_schedule(
+        self,
+        filters: dict[str, Any],
+        compact: bool = False,
+    ) -> bytes:
+        """
+        Расписание, сериализованное в JSON. Кэшируется в готовом виде, поэтому повторный запрос не требует ни
+        обращения к базе данных, ни валидации и сериализации моделей
+        """
+        key = (compact, schedule_cache.key(filters, utils.today()))
+        if (schedule := schedule_cache.get(key)) is not None:
+            return schedule
+        version = schedule_version.value
+        schedule = json.dumps(
+            self.construct_schedule(filters, compact),
+            default=pydantic_encoder,
+            ensure_ascii=False,
+            separators=(',', ':'),
+        ).encode()
+        schedule_cache.set(key, schedule, version)
+        return schedule
+
+    @staticmethod
+    def _to_models(instances: Iterable[ScheduleInstance]) -> list[models.ScheduleRecord]:
+        programs: dict[int, models.Program] = {}
+        schedule = []
+        for obj in instances:
+            if obj.program.id not in programs:
+                programs[obj.program.id] = obj.program.to_model()
+            schedule.append(obj.to_model(programs[obj.program.id]))
+        return schedule
+
+    @staticmethod
+    def _to_compact(instances: Iterable[ScheduleInstance]) -> models.CompactSchedule:
+        programs: dict[int, models.Program] = {}
+        occurrences = []
+        for obj in instances:
+            if obj.program.id not in programs:
+                programs[obj.program.id] = obj.program.to_model()
+            occurrences.append(obj.to_occurrence())
+        return models.CompactSchedule(programs=programs, occurrences=occurrences)
+
+    @staticmethod
+    def validators() -> tuple[str, datetime.datetime]:
+        """
+        Возвращает ETag и время последнего изменения расписания, не обращаясь к базе данных.
+        Помимо версии расписания учитывается текущий день, от которого зависят неделя расписания и поля занятий.
+        """
+        version, modified = schedule_version.read()
+        today = utils.today()
+        etag = f'"{version}-{int(modified * 1e6)}-{today:%Y%m%d}"'
+        last_modified = max(datetime.datetime.fromtimestamp(modified, utils.tz), today)
+        return etag, last_modified
+
+    def _construct_schedule(self, filters: dict[str, Any]) -> Iterable[ScheduleInstance]:
+        active_schema, next_week_schema = self.schema_service.current_schemas()
         booked_classes = self._count_booked_classes(filters)
         current_week_classes = self._get_grid(active_schema, filters)
         if next_week_schema:
@@ -142,6 +236,115 @@ class ScheduleService:
         else:
             next_week_classes = self._prolong_grid(current_week_classes)
         response = current_week_classes | next_week_classes
-        for k, booked_places in booked_classes.items():
-            response[k] = response[k]._replace(booked_places=booked_places)
-        return [obj.to_model() for obj in response.values()]
+        self._apply_booked_classes(response, booked_classes)
+        return response.values()
+
+    def expand_schedule(
+        self,
+        filters: dict[str, Any],
+        date_from: datetime.date,
+        date_to: datetime.date,
+    ) -> Iterator[list[models.ScheduleRecord]]:
+        """
+        Формирует расписание за период с date_from по date_to включительно. Возвращает генератор, который строит
+        занятия по одной неделе за раз, поэтому объем памяти не зависит от длины периода.
+        Для недель до текущей включительно используется активная схема (история схем не хранится), для последующих -
+        схема следующей недели, если она назначена.
+        """
+        if date_to < date_from:
+            raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, detail='Некорректный период')
+        if (date_to - date_from).days >= settings.schedule_range_max_days:
+            raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                detail=f'Период не может превышать {settings.schedule_range_max_days} дней')
+        begin = datetime.datetime.combine(date_from, datetime.time(), tzinfo=utils.tz)
+        end = datetime.datetime.combine(date_to, datetime.time(), tzinfo=utils.tz) + rd.relativedelta(days=1)
+        return self._expand_weeks(filters, begin, end)
+
+    def _expand_weeks(
+        self,
+        filters: dict[str, Any],
+        begin: datetime.datetime,
+        end: datetime.datetime,
+    ) -> Iterator[list[models.ScheduleRecord]]:
+        active_schema, next_week_schema = self.schema_service.current_schemas()
+        this_mo = utils.this_mo()
+        grids: dict[int, dict[str, ScheduleInstance]] = {}
+        programs: dict[int, models.Program] = {}
+
+        monday = begin + rd.relativedelta(weekday=rd.MO(-1))
+        while monday < end:
+            weeks = (monday - this_mo).days // 7
+            schema = next_week_schema if next_week_schema and weeks > 0 else active_schema
+            if schema.id not in grids:
+                grids[schema.id] = self._get_grid(schema, filters)
+            grid = self._prolong_grid(grids[schema.id], weeks)
+            next_monday = monday + rd.relativedelta(days=7)
+            booked_classes = self._count_booked_classes(filters, max(monday, begin), min(next_monday, end))
+            self._apply_booked_classes(grid, booked_classes)
+
+            week = []
+            for obj in sorted(grid.values(), key=lambda instance: instance.date):
+                if not begin <= obj.date < end:
+                    continue
+                if obj.program.id not in programs:
+                    programs[obj.program.id] = obj.program.to_model()
+                week.append(obj.to_model(programs[obj.program.id]))
+            yield week
+            monday = next_monday
+
+
+class AsyncScheduleService:
+    """
+    Асинхронный вариант ScheduleService. Логика формирования расписания не дублируется: синхронные методы
+    выполняются через AsyncSession.run_sync поверх asyncpg, без передачи запроса в пул потоков.
+    """
+    def __init__(
+        self,
+        session: AsyncSession = Depends(get_async_session),
+    ):
+        self.session = session
+
+    async def construct_schedule(
+        self,
+        filters: dict[str, Any],
+        compact: bool = False,
+    ) -> Union[list[models.ScheduleRecord], models.CompactSchedule]:
+        return await self.session.run_sync(
+            lambda session: ScheduleService(session).construct_schedule(filters, compact)
+        )
+
+    async def encoded_schedule(
+        self,
+        filters: dict[str, Any],
+        compact: bool = False,
+    ) -> bytes:
+        return await self.session.run_sync(
+            lambda session: ScheduleService(session).encoded_schedule(filters, compact)
+        )
+
+    async def expand_schedule(
+        self,
+        filters: dict[str, Any],
+        date_from: datetime.date,
+        date_to: datetime.date,
+    ) -> AsyncIterator[models.ScheduleRecord]:
+        """
+        Асинхронный вариант ScheduleService.expand_schedule. Проверка периода выполняется сразу,
+        занятия строятся по одной неделе при итерации по результату.
+        """
+        weeks = await self.session.run_sync(
+            lambda session: ScheduleService(session).expand_schedule(filters, date_from, date_to)
+        )
+        return self._iterate_weeks(weeks)
+
+    async def _iterate_weeks(
+        self,
+        weeks: Iterator[list[models.ScheduleRecord]],
+    ) -> AsyncIterator[models.ScheduleRecord]:
+        while (week := await self.session.run_sync(lambda _: next(weeks, None))) is not None:
+            for record in week:
+                yield record
+
+    @staticmethod
+    def validators() -> tuple[str, datetime.datetime]:
+        return ScheduleService.validators()
@@ -7,9 +7,10 @@ from fastapi import (
     HTTPException,
     status
 )
-from dateutil import relativedelta as rd
 from sqlalchemy.orm import Session
-from sqlalchemy import delete, tuple_, select
+from sqlalchemy import delete, tuple_, select, func, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql.expression import SelectBase
 
 from ...database import get_session
 
@@ -20,6 +21,10 @@ from ... import (
 )
 
 
+# Ключ рекомендательной блокировки PostgreSQL, под которой переключаются схемы
+SCHEMA_ACTIVATION_LOCK = 7_010_001
+
+
 class SchemaService:
     def __init__(
         self,
@@ -61,6 +66,36 @@ class SchemaService:
         )
         return schema
 
+    def current_schemas(self) -> tuple[Optional[tables.ScheduleSchema], Optional[tables.ScheduleSchema]]:
+        """
+        Возвращает действующую схему и схему следующей недели, не изменяя данных. Схема следующей недели, дата
+        активации которой уже наступила, считается действующей, даже если фоновая задача ещё не переключила схемы.
+        """
+        next_week_schema = self.next_week_schema
+        active_schema = self.active_schema
+        if next_week_schema and utils.now() >= next_week_schema.to_be_active_from:
+            return next_week_schema, None
+        return active_schema, next_week_schema
+
+    def activate_scheduled_schema(self) -> Optional[datetime.datetime]:
+        """
+        Делает действующей схему следующей недели, если наступила дата её активации. Выполняется под
+        транзакционной рекомендательной блокировкой, поэтому схемы переключает только один из процессов.
+        :return: дата предстоящей активации схемы следующей недели, если она назначена
+        """
+        self.session.execute(select(func.pg_advisory_xact_lock(SCHEMA_ACTIVATION_LOCK)))
+        next_week_schema = self.next_week_schema
+        if next_week_schema and utils.now() >= next_week_schema.to_be_active_from:
+            active_schema = self.active_schema
+            if active_schema:
+                active_schema.active = False
+            next_week_schema.to_be_active_from = None
+            next_week_schema.active = True
+            self.session.commit()
+            return None
+        self.session.commit()
+        return next_week_schema.to_be_active_from if next_week_schema else None
+
     def get_many_schemas(self) -> list[tables.ScheduleSchema]:
         schemas = (
             self.session
@@ -104,43 +139,38 @@ class SchemaService:
         next_week=False,
     ):
         """
-        Генерирует список занятий, которые отсутствуют в schema, но присутствуют в target_schema,
-        передает список на снятие бронирования
+        Формирует запрос занятий, которые отсутствуют в schema, но присутствуют в other_schema,
+        передает его на снятие бронирования. Элементы схем в память не загружаются
         """
-        records = set(other_schema.records) - set(schema.records)
+        SSR = tables.schedule_schema_record
+        records = (
+            select(SSR.c.schema_record).where(SSR.c.schedule_schema == other_schema.id)
+            .except_(select(SSR.c.schema_record).where(SSR.c.schedule_schema == schema.id))
+        )
         self._remove_booking(records, next_week=next_week)
 
     def _remove_booking(
         self,
-        records: Union[Iterable[tables.SchemaRecord], Iterable[int]],
+        records: Union[Iterable[tables.SchemaRecord], Iterable[int], SelectBase],
         next_week=False
     ):
         """
-        Снимает бронирование (запись) клиентов с предстоящих занятий (но отмененных), соответствующим переданным records
+        Снимает бронирование (запись) клиентов с предстоящих занятий (но отмененных), соответствующим переданным records.
+        Даты занятий вычисляются на стороне базы данных, бронирования удаляются одним запросом
+        :param records: элементы схем, их id или запрос, возвращающий id
         :param next_week: снимет на следующей неделе
         """
-        if isinstance(next(iter(records), None), int):
-            records = (
-                self.session
-                .query(tables.SchemaRecord)
-                .where(tables.SchemaRecord.id.in_(records))
-                .all()
-            )
-        interval = rd.relativedelta(days=7) if next_week else rd.relativedelta()
-        obj_to_remove = [(r.program, r.date + interval)
-                         for r in records
-                         if r.date+interval > utils.now()]
-        self._remove_booked_rows(obj_to_remove)
-
-    def _remove_booked_rows(self, rows: list[tuple[int, datetime.datetime]]):
-        """
-        Removes rows from BookedClasses
-        :param rows: int - id тренировочной программы, datetime.datetime - дата занятия
-        """
-        B = tables.BookedClasses
+        if not isinstance(records, SelectBase):
+            records = [r if isinstance(r, int) else r.id for r in records]
+            if not records:
+                return
+        B, R = tables.BookedClasses, tables.SchemaRecord
+        date = utils.tz_date_sql(utils.calc_date_sql(R.week_day, R.day_time, weeks=1 if next_week else 0))
         self.session.execute(
             delete(B)
-            .where(tuple_(B.program, B.date).in_(rows))
+            .where(tuple_(B.program, B.date).in_(select(R.program, date).where(R.id.in_(records))))
+            .where(B.date > func.now())
+            .execution_options(synchronize_session=False)
         )
         self.session.flush()
 
@@ -193,26 +223,40 @@ class SchemaService:
         self,
         schema_id: int
     ) -> list[models.SchemaRecord]:
-        schedule_schema = self._get_schema(schema_id)
-        return [record.to_model() for record in schedule_schema.records]
+        self._get_schema(schema_id)
+        SSR = tables.schedule_schema_record
+        records = (
+            self.session
+            .query(tables.SchemaRecord)
+            .join(SSR)
+            .where(SSR.c.schedule_schema == schema_id)
+            .options(*tables.record_model_options)
+            .all()
+        )
+        return [record.to_model() for record in records]
 
     def include_records_in_schema(
         self,
         schema_id: int,
         records_to_include: Iterable[int],
     ) -> list[int]:
-        schema = self._get_schema(schema_id)
-        records = set((r.id for r in schema.records))
-        records.update(records_to_include)
-        new_records = (
-            self.session
-            .query(tables.SchemaRecord)
-            .filter(tables.SchemaRecord.id.in_(records))
-            .all()
+        """
+        Добавляет к схеме существующие элементы из records_to_include одним запросом, уже входящие в схему пропускаются
+        :return: id всех элементов схемы
+        """
+        self._get_schema(schema_id)
+        SSR, R = tables.schedule_schema_record, tables.SchemaRecord
+        self.session.execute(
+            insert(SSR)
+            .from_select(
+                ['schedule_schema', 'schema_record'],
+                select(literal(schema_id), R.id).where(R.id.in_(list(records_to_include)))
+            )
+            .on_conflict_do_nothing()
         )
-        schema.records = new_records
+        records = self.session.scalars(select(SSR.c.schema_record).where(SSR.c.schedule_schema == schema_id)).all()
         self.session.commit()
-        return [r.id for r in new_records]
+        return records
 
     def exclude_records_from_schema_(
         self,
@@ -225,6 +269,7 @@ class SchemaService:
         из активных схем (отменены) и у которых дата проведения не наступила. Такое состояние возникает, когда клиенты
         успели записаться на занятие, которое впоследствии было исключено из расписания, что требует удаления
         соответствующих строк из базы данных, поскольку по ним формируется отчет о посещаемости той или иной трен. программы.
+        :param force_delete: удалить исключенные элементы, не входящие больше ни в одну схему
         """
         schema = self._get_schema(schema_id)
 
@@ -243,10 +288,13 @@ class SchemaService:
         )
 
         if force_delete:
-            for record in records_to_exclude:
-                rows = self.session.query(table).where(table.c.schema_record == record).all()
-                if not rows:
-                    self.session.execute(delete(tables.SchemaRecord).where(tables.SchemaRecord.id == record))
+            R = tables.SchemaRecord
+            self.session.execute(
+                delete(R)
+                .where(R.id.in_(records_to_exclude))
+                .where(~select(table.c.schema_record).where(table.c.schema_record == R.id).exists())
+                .execution_options(synchronize_session='fetch')
+            )
 
         self.session.flush()
 
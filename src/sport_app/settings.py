@@ -8,23 +8,62 @@ class Settings(BaseSettings):
     angular_port: int = '4200'
 
     db_dialect: str = 'postgresql'
+    db_async_driver: str = 'asyncpg'
     db_username: str = 'admin'
     db_password: str = '123'
     db_host: str = 'localhost'
     db_port: str = '5432'
     db_database: str = 'sport_app'
+    # пул соединений каждого воркера
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout_s: float = 30
+    db_pool_recycle_s: int = 1800
+    db_pool_pre_ping: bool = True
+    # 0 - без ограничения
+    db_statement_timeout_ms: int = 0
+    # статистика запросов к базе данных за HTTP-запрос
+    sql_slowest_statements: int = 3
+    sql_repeat_threshold: int = 10
 
     adm_username: str = 'John Doe'
     adm_email: str = 'johndoe@example.com'
     adm_password: str = '123'
 
+    # часовой пояс передается триггеру счетчиков посещаемости при его создании: после изменения выполнить
+    # python -m sport_app.rebuild_attendance, иначе отчеты продолжат группировать бронирования в прежнем поясе
     timezone: str = 'Asia/Yekaterinburg'
 
     jwt_secret: str = ''
     jwt_algorithm: str = 'HS256'
     jwt_expires_s: int = 360000
+    token_cache_size: int = 1024
+    bcrypt_rounds: int = 12
+    password_workers: int = 2
+    password_queue_size: int = 16
+    auth_version_path: str = '/tmp/sport_app/auth.version'
 
     images_path = 'images'
+    image_workers: int = 2
+    # в production изображения отдает nginx
+    serve_images: bool = True
+
+    schedule_cache_size: int = 256
+    schedule_version_path: str = '/tmp/sport_app/schedule.version'
+    catalog_version_path: str = '/tmp/sport_app/catalog.version'
+    schedule_range_max_days: int = 366
+
+    booking_concurrency: int = 4
+    booking_queue_size: int = 100
+    booking_sold_out_ttl_s: float = 2.0
+    booking_catalog_refresh_s: int = 10
+
+    export_batch_size: int = 1000
+
+    metrics_dir: str = '/tmp/sport_app/metrics'
+
+    scheduler_enabled: bool = True
+    schema_activation_interval_s: int = 60
 
 
 settings = Settings(
@@ -1,11 +1,12 @@
 from sqlalchemy import (
     Column, String, Integer,
     ForeignKey, DateTime, Time, Boolean, JSON,
-    Table, UniqueConstraint, Enum
+    Table, UniqueConstraint, Enum, Index,
+    DDL, event, Computed, text
 )
 
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, selectinload
 
 from .constructor import constructor
 from .models import (
@@ -14,6 +15,8 @@ from .models import (
     Roles
 )
 from .utils import *
+from .settings import settings
+from . import images
 
 
 Base = declarative_base(constructor=constructor)
@@ -44,6 +47,16 @@ class Instructor(Base):
 
     programs = relationship("Program", back_populates="instructor_obj")
 
+    @property
+    def photo_src(self):
+        if self.photo_token:
+            return images.urls(self.photo_token)['full']
+
+    @property
+    def photo_variants(self):
+        if self.photo_token and images.has_variants(self.photo_token):
+            return images.urls(self.photo_token)
+
 
 class Program(Base):
     __tablename__ = "program"
@@ -91,6 +104,11 @@ class SchemaRecord(Base):
     program_obj = relationship("Program", back_populates="schema_records")
     to_model = record_to_model
 
+    __table_args__ = (
+        # поиск занятия схемы при записи клиента
+        Index('ix_schema_record_slot', 'week_day', 'day_time', 'program'),
+    )
+
     @property
     def date(self):
         return calculate_date(self.week_day, self.day_time)
@@ -107,6 +125,18 @@ class ScheduleSchema(Base):
     records = relationship("SchemaRecord", secondary=schedule_schema_record)
 
 
+# Стратегии загрузки объектов, к которым обращаются program_to_model и record_to_model.
+# Позволяют сформировать список моделей фиксированным количеством запросов вместо запроса на каждый объект
+program_model_options = (
+    selectinload(Program.category_obj),
+    selectinload(Program.instructor_obj),
+)
+record_model_options = tuple(
+    selectinload(SchemaRecord.program_obj).options(option)
+    for option in program_model_options
+)
+
+
 class Client(Base):
     __tablename__ = "client"
 
@@ -114,6 +144,23 @@ class Client(Base):
     credentials = Column(String)
     phone = Column(String, unique=True)
     additional_data = Column(JSON)
+    # цифры номера телефона для поиска по его части независимо от формата записи
+    phone_digits = Column(String, Computed("regexp_replace(phone, '[^0-9]', '', 'g')"))
+
+
+# Поиск клиентов (ClientService.search) использует триграммные индексы расширения pg_trgm. Если расширение
+# не установлено на сервере, таблица создается без них, а поиск недоступен
+def pg_trgm_available(ddl, target, bind, **kw) -> bool:
+    return bind.execute(text("SELECT exists(SELECT FROM pg_available_extensions WHERE name = 'pg_trgm')")).scalar()
+
+
+client_search_indexes = DDL("""
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS ix_client_credentials_trgm ON client USING gin (credentials gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_client_phone_digits_trgm ON client USING gin (phone_digits gin_trgm_ops);
+""")
+
+event.listen(Client.__table__, 'after_create', client_search_indexes.execute_if(callable_=pg_trgm_available))
 
 
 class BookedClasses(Base):
@@ -125,15 +172,160 @@ class BookedClasses(Base):
     date = Column(DateTime(timezone=True))
 
     __table_args__ = (
+        # индекс ограничения обслуживает и выборку бронирований клиента (в т.ч. каскадное удаление клиента)
         UniqueConstraint(
             'client',
             'program',
             'date',
             name='one_booking_per_client_uc'
         ),
+        # подсчет мест на предстоящие занятия (ScheduleService._count_booked_classes)
+        Index('ix_booked_classes_date_program', 'date', 'program', postgresql_include=['id']),
+        # снятие записей на занятия (SchemaService._remove_booking) и отчет по программам
+        Index('ix_booked_classes_program_date', 'program', 'date', postgresql_include=['id']),
     )
 
 
+class ClassSeats(Base):
+    """
+    Количество забронированных мест на занятии. Поддерживается триггером booked_classes_seats: при вставке строки
+    в booked_classes счётчик занятия атомарно увеличивается с проверкой place_limit программы, при удалении -
+    уменьшается. Блокируется только строка счётчика бронируемого занятия.
+    """
+    __tablename__ = "class_seats"
+
+    program = Column(Integer, ForeignKey("program.id", ondelete="CASCADE"), primary_key=True)
+    date = Column(DateTime(timezone=True), primary_key=True)
+    booked = Column(Integer, nullable=False, default=0)
+
+
+# SQLSTATE ошибки, возникающей при попытке забронировать место на занятии без свободных мест
+NO_SEATS_SQLSTATE = 'SA001'
+
+booked_classes_seats_function = DDL(f"""
+CREATE OR REPLACE FUNCTION booked_classes_seats() RETURNS trigger AS $$
+DECLARE
+    seats_limit integer;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        UPDATE class_seats SET booked = booked - 1
+        WHERE program = OLD.program AND date = OLD.date;
+        RETURN OLD;
+    END IF;
+
+    SELECT place_limit INTO seats_limit FROM program WHERE id = NEW.program;
+    INSERT INTO class_seats AS seats (program, date, booked)
+    VALUES (NEW.program, NEW.date, 1)
+    ON CONFLICT (program, date) DO UPDATE SET booked = seats.booked + 1
+    WHERE coalesce(seats_limit, 0) = 0 OR seats.booked < seats_limit;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'no seats available for program %% on %%', NEW.program, NEW.date
+            USING ERRCODE = '{NO_SEATS_SQLSTATE}';
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+""")
+
+booked_classes_seats_trigger = DDL("""
+CREATE TRIGGER booked_classes_seats
+BEFORE INSERT OR DELETE ON booked_classes
+FOR EACH ROW EXECUTE FUNCTION booked_classes_seats()
+""")
+
+event.listen(BookedClasses.__table__, 'after_create', booked_classes_seats_function)
+event.listen(BookedClasses.__table__, 'after_create', booked_classes_seats_trigger)
+
+
+class ProgramAttendance(Base):
+    """
+    Количество бронирований программы за неделю (period='week', num - номер недели ISO) или месяц (period='month').
+    Поддерживается триггером booked_classes_attendance, поэтому отчеты не обращаются к booked_classes.
+    """
+    __tablename__ = "program_attendance"
+
+    program = Column(Integer, ForeignKey("program.id", ondelete="CASCADE"), primary_key=True)
+    period = Column(String, primary_key=True)
+    year = Column(Integer, primary_key=True)
+    num = Column(Integer, primary_key=True)
+    amount = Column(Integer, nullable=False, default=0)
+
+
+class ClientAttendance(Base):
+    """Количество бронирований программы клиентом за неделю или месяц. Поддерживается триггером booked_classes_attendance"""
+    __tablename__ = "client_attendance"
+
+    client = Column(Integer, ForeignKey("client.id", ondelete="CASCADE"), primary_key=True)
+    program = Column(Integer, ForeignKey("program.id", ondelete="CASCADE"), primary_key=True)
+    period = Column(String, primary_key=True)
+    year = Column(Integer, primary_key=True)
+    num = Column(Integer, primary_key=True)
+    amount = Column(Integer, nullable=False, default=0)
+
+
+# Год и номер периода считаются в часовом поясе, переданном аргументом триггера (settings.timezone на момент его
+# создания). Неделя относится к году ISO, которому она принадлежит. При удалении бронирования счетчики только
+# уменьшаются: при каскадном удалении клиента или программы их строки могут быть уже удалены
+booked_classes_attendance_function = DDL("""
+CREATE OR REPLACE FUNCTION booked_classes_attendance() RETURNS trigger AS $$
+DECLARE
+    booking booked_classes;
+    period_name text;
+    period_year integer;
+    period_num integer;
+    local_date timestamp;
+BEGIN
+    booking := CASE TG_OP WHEN 'DELETE' THEN OLD ELSE NEW END;
+    IF booking.date IS NULL THEN
+        RETURN NULL;
+    END IF;
+    local_date := timezone(TG_ARGV[0], booking.date);
+
+    FOREACH period_name IN ARRAY ARRAY['week', 'month'] LOOP
+        period_year := date_part(CASE period_name WHEN 'week' THEN 'isoyear' ELSE 'year' END, local_date);
+        period_num := date_part(period_name, local_date);
+        IF TG_OP = 'DELETE' THEN
+            UPDATE program_attendance SET amount = amount - 1
+            WHERE program = booking.program AND period = period_name
+                AND year = period_year AND num = period_num;
+            UPDATE client_attendance SET amount = amount - 1
+            WHERE client = booking.client AND program = booking.program AND period = period_name
+                AND year = period_year AND num = period_num;
+            CONTINUE;
+        END IF;
+
+        INSERT INTO program_attendance AS a (program, period, year, num, amount)
+        VALUES (booking.program, period_name, period_year, period_num, 1)
+        ON CONFLICT (program, period, year, num) DO UPDATE SET amount = a.amount + 1;
+
+        INSERT INTO client_attendance AS a (client, program, period, year, num, amount)
+        VALUES (booking.client, booking.program, period_name, period_year, period_num, 1)
+        ON CONFLICT (client, program, period, year, num) DO UPDATE SET amount = a.amount + 1;
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+""")
+
+
+
+def booked_classes_attendance_trigger(timezone: str) -> DDL:
+    """
+    Триггер, ведущий счетчики посещаемости в часовом поясе timezone. После изменения settings.timezone триггер
+    и счетчики пересоздаются командой python -m sport_app.rebuild_attendance
+    """
+    timezone = timezone.replace("'", "''")
+    return DDL(f"""
+CREATE TRIGGER booked_classes_attendance
+AFTER INSERT OR DELETE ON booked_classes
+FOR EACH ROW EXECUTE FUNCTION booked_classes_attendance('{timezone}')
+""")
+
+
+event.listen(BookedClasses.__table__, 'after_create', booked_classes_attendance_function)
+event.listen(BookedClasses.__table__, 'after_create', booked_classes_attendance_trigger(settings.timezone))
+
+
 class Staff(Base):
     __tablename__ = "staff"
 
@@ -0,0 +1,84 @@
+"""
+    Периодические задачи, выполняемые в процессе приложения.
+    Планировщик запускается вместе с приложением (startup) и выполняет зарегистрированные задачи в event loop
+    воркера. Задача может вернуть время (в секундах) до следующего запуска, например, до момента активации схемы;
+    иначе она повторяется с заданным интервалом. Задачи, изменяющие общие данные, должны защищаться
+    рекомендательными блокировками PostgreSQL, поскольку выполняются в каждом воркере.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+from .database import AsyncSession
+from .services.booking import booking_catalog
+from .services.schedules.schema import SchemaService
+from .settings import settings
+from . import utils
+
+
+logger = logging.getLogger(__name__)
+
+JobFunc = Callable[[], Awaitable[Optional[float]]]
+
+
+class Job(NamedTuple):
+    func: JobFunc
+    interval: float
+
+
+class Scheduler:
+    def __init__(self):
+        self.jobs: list[Job] = []
+        self._tasks: list[asyncio.Task] = []
+
+    def job(self, interval: float) -> Callable[[JobFunc], JobFunc]:
+        """
+        Регистрирует задачу.
+        :param interval: максимальный интервал между запусками задачи в секундах
+        """
+        def decorator(func: JobFunc) -> JobFunc:
+            self.jobs.append(Job(func, interval))
+            return func
+        return decorator
+
+    @staticmethod
+    async def _run(job: Job):
+        while True:
+            try:
+                delay = await job.func()
+            except Exception:
+                logger.exception('Job %s failed', job.func.__name__)
+                delay = None
+            if delay is None or delay > job.interval:
+                delay = job.interval
+            await asyncio.sleep(max(delay, 0))
+
+    def start(self):
+        for job in self.jobs:
+            self._tasks.append(asyncio.create_task(self._run(job)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+
+scheduler = Scheduler()
+
+
+@scheduler.job(interval=settings.schema_activation_interval_s)
+async def activate_scheduled_schema() -> Optional[float]:
+    """Переключает схемы в момент активации схемы следующей недели"""
+    async with AsyncSession() as session:
+        activation_date = await session.run_sync(
+            lambda sync_session: SchemaService(sync_session).activate_scheduled_schema()
+        )
+    if activation_date:
+        return (activation_date - utils.now()).total_seconds()
+
+
+@scheduler.job(interval=settings.booking_catalog_refresh_s)
+async def prewarm_booking_catalog():
+    """Заранее строит снимок для записи на занятия, чтобы запросы в момент открытия регистрации его не ожидали"""
+    await booking_catalog.refresh()
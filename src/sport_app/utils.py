@@ -4,7 +4,6 @@ from dateutil.tz import gettz
 from dateutil import relativedelta as rd
 import datetime
 from sqlalchemy import func, Integer, Time
-from sqlalchemy.sql.expression import BinaryExpression
 
 from .settings import settings
 
@@ -20,15 +19,15 @@ def now() -> datetime.datetime:
 
 
 def mo_on_week(year: int, week: int) -> datetime.datetime:
-    """Возвращает понедельник недели под номером :week_num в году :year"""
-    D = datetime.datetime(year, 1, 1, tzinfo=tz)
-    return D + rd.relativedelta(weeks=int(week), weekday=rd.MO(-1))
+    """Возвращает понедельник недели ISO под номером :week_num в году ISO :year"""
+    D = datetime.date.fromisocalendar(int(year), int(week), 1)
+    return datetime.datetime(D.year, D.month, D.day, tzinfo=tz)
 
 
 def su_on_week(year: int, week: int) -> datetime.datetime:
-    """Возвращает воскресенье недели под номером :week_num в году :year"""
-    D = datetime.datetime(year, 1, 1, tzinfo=tz)
-    return D + rd.relativedelta(weeks=int(week), weekday=rd.SU(-1))
+    """Возвращает воскресенье недели ISO под номером :week_num в году ISO :year"""
+    D = datetime.date.fromisocalendar(int(year), int(week), 7)
+    return datetime.datetime(D.year, D.month, D.day, tzinfo=tz)
 
 
 def first_month_day(year: int, month: int) -> datetime.datetime:
@@ -38,8 +37,7 @@ def first_month_day(year: int, month: int) -> datetime.datetime:
 
 def last_month_day(year: int, month: int) -> datetime.datetime:
     """Возвращает последний день месяца :month в году :year"""
-    D = datetime.datetime(year, month + 1, 1, tzinfo=tz)
-    return D - rd.relativedelta(days=1)
+    return first_month_day(year, month) + rd.relativedelta(months=1, days=-1)
 
 
 def next_mo() -> datetime.datetime:
@@ -64,20 +62,28 @@ def day_stub() -> datetime.datetime:
     return datetime.datetime(2000, 1, 1, tzinfo=tz)
 
 
-def this_mo_sql() -> BinaryExpression:
+def local_now_sql():
+    """PostgreSQL function: Возвращает текущее время в часовом поясе приложения type::timestamp (no TZ)"""
+    return func.timezone(settings.timezone, func.now())
+
+
+def this_mo_sql():
     """PostgreSQL function: Возвращает понедельник на текущей неделе type::timestamp (no TZ)"""
-    return func.current_date() + 1 - func.cast(func.extract("isodow", func.current_date()), Integer)
+    return func.date_trunc('week', local_now_sql())
 
 
 def previous_mo_sql():
     """PostgreSQL function: Возвращает понедельник на предыдущей неделе type::timestamp (no TZ)"""
-    return this_mo_sql() - 7
+    return this_mo_sql() - make_interval_sql(days=7)
 
 
-def calc_date_sql(week_day: Integer, day_time: Time):
-    """PostgreSQL function: Конструирует дату по дню недели и времени дня на текущей неделе type::timestamp (no TZ)"""
+def calc_date_sql(week_day: Integer, day_time: Time, weeks: int = 0):
+    """
+    PostgreSQL function: Конструирует дату по дню недели и времени дня на текущей неделе type::timestamp (no TZ)
+    :param weeks: смещение в неделях относительно текущей
+    """
     MONDAY = this_mo_sql()
-    return MONDAY + week_day + day_time
+    return MONDAY + make_interval_sql(weeks=weeks, days=week_day) + day_time
 
 
 def make_interval_sql(years=0, months=0, weeks=0, days=0):
@@ -1,20 +1,24 @@
 import datetime
 import itertools
-from typing import Iterable
+from contextlib import contextmanager
+from typing import Iterable, Iterator
 
 import pytest
 from dateutil import relativedelta as rd
 
-from sqlalchemy import create_engine, inspect
+from sqlalchemy import create_engine, inspect, event
 from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import NullPool
 
 from sport_app.settings import settings
 from src.sport_app.tables import Base
 from src.sport_app.app import app
-from src.sport_app.database import get_session
+from src.sport_app.database import get_session, get_async_session
 from src.sport_app import tables
-from src.sport_app.services.auth import validate_admin_access
+from src.sport_app.services.auth import validate_admin_access, AuthService
+from src.sport_app.services.booking import booking_catalog
 
 
 url_object = URL.create(
@@ -26,6 +30,8 @@ url_object = URL.create(
     database='test_sport_app',
 )
 engine = create_engine(url_object)
+# TestClient runs every request in its own event loop, so async connections must not be pooled
+async_engine = create_async_engine(url_object.set(drivername='postgresql+asyncpg'), poolclass=NullPool)
 
 
 def empty_db():
@@ -38,6 +44,28 @@ def delete_all(session: Session, instances: Iterable):
     session.commit()
 
 
+@contextmanager
+def count_queries() -> Iterator[list[str]]:
+    """ Collects SQL statements issued to the test database within the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def assert_max_queries(response, max_queries: int):
+    """ Fails when the request issued more SQL statements than the budget (the response must be for staff)"""
+    queries = int(response.headers['X-DB-Queries'])
+    request = f'{response.request.method} {response.request.url.path}'
+    assert queries <= max_queries, f'{request} issued {queries} queries, budget is {max_queries}'
+
+
 @pytest.fixture(scope="session")
 def sessionmaker_db():
     empty_db()
@@ -66,6 +94,27 @@ def session_db_dependency(session_db):
     app.dependency_overrides[get_session] = get_session_test_db
 
 
+@pytest.fixture(scope="session", autouse=True)
+def async_session_dependency():
+    Session = sessionmaker(
+        async_engine,
+        class_=AsyncSession,
+        autocommit=False,
+        autoflush=False,
+        expire_on_commit=False,
+    )
+
+    async def get_async_session_test_db():
+        session = Session()
+        try:
+            yield session
+        finally:
+            await session.close()
+
+    app.dependency_overrides[get_async_session] = get_async_session_test_db
+    booking_catalog.sessionmaker = Session
+
+
 @pytest.fixture(scope="session", autouse=True)
 def admin_access(session_db):
     staff = tables.Staff(username='John Doe', email='email@mail.cm', role='admin', password_hash='123')
@@ -76,6 +125,13 @@ def admin_access(session_db):
         return staff
 
     app.dependency_overrides[validate_admin_access] = override
+    return staff
+
+
+@pytest.fixture(scope="session")
+def staff_headers(admin_access) -> dict[str, str]:
+    """ Responses to requests with these headers carry SQL statistics headers"""
+    return {'Authorization': f'Bearer {AuthService.create_token(admin_access).access_token}'}
 
 
 @pytest.fixture(name='instructor')
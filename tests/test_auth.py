@@ -0,0 +1,149 @@
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from jose import jwt
+from passlib.hash import bcrypt
+from pytest_mock import MockerFixture
+
+from src.sport_app import models
+from src.sport_app import services
+from src.sport_app import tables
+from src.sport_app.settings import settings
+from src.sport_app.app import app
+from src.sport_app.services.auth import token_cache, password_hasher, PasswordHasher
+
+
+test_client = TestClient(app)
+
+
+@pytest.fixture()
+def staff(session_db):
+    staff = tables.Staff(username='token-staff', email='token@mail.cm', role='operator', password_hash='123')
+    session_db.add(staff)
+    session_db.commit()
+    staff_id = staff.id
+    yield staff
+    session_db.query(tables.Staff).filter_by(id=staff_id).delete()
+    session_db.commit()
+
+
+@pytest.fixture()
+def token(staff) -> str:
+    return services.AuthService.create_token(staff).access_token
+
+
+def test_verified_token_is_cached(token, staff, mocker: MockerFixture):
+    decode = mocker.spy(jwt, 'decode')
+
+    first = services.AuthService.verify_token(token)
+    second = services.AuthService.verify_token(token)
+
+    assert first.id == second.id == staff.id
+    decode.assert_called_once()
+
+
+def test_expired_entry_is_not_used(token, mocker: MockerFixture):
+    staff_member = services.AuthService.verify_token(token)
+    token_cache.set(token, staff_member, time.time() - 1)
+    decode = mocker.spy(jwt, 'decode')
+
+    services.AuthService.verify_token(token)
+
+    decode.assert_called_once()
+
+
+def test_invalid_token_is_not_cached():
+    with pytest.raises(HTTPException):
+        services.AuthService.verify_token('not-a-token')
+
+    assert token_cache.get('not-a-token') is None
+
+
+def test_token_without_expiration_is_rejected(staff):
+    user = models.Staff.from_orm(staff)
+    user.role = str(user.role)
+    token = jwt.encode({'sub': str(user.id), 'user': user.dict()}, settings.jwt_secret, algorithm=settings.jwt_algorithm)
+
+    with pytest.raises(HTTPException) as error:
+        services.AuthService.verify_token(token)
+
+    assert error.value.status_code == 401
+    assert token_cache.get(token) is None
+
+def test_cache_size_is_bounded(mocker: MockerFixture):
+    mocker.patch.object(token_cache, 'maxsize', 2)
+    staff_member = models.Staff(id=0, username='staff', email='staff@mail.cm', role='staff_role.operator')
+    for token in ('a', 'b', 'c'):
+        token_cache.set(token, staff_member, time.time() + 60)
+
+    assert token_cache.get('a') is None
+    assert token_cache.get('c') == staff_member
+
+
+def test_deleting_staff_revokes_cached_tokens(session_db, staff, token):
+    services.AuthService.verify_token(token)
+    version = token_cache.version.value
+
+    services.AuthService(session_db).delete_staff(staff.id)
+
+    assert token_cache.get(token) is None
+    assert token_cache.version.value > version
+
+
+@pytest.fixture()
+def fast_hasher(mocker: MockerFixture) -> PasswordHasher:
+    """ The configured bcrypt cost is too slow for tests"""
+    handler = bcrypt.using(rounds=5, min_desired_rounds=5, max_desired_rounds=5)
+    mocker.patch.object(password_hasher, 'handler', handler)
+    return password_hasher
+
+
+def sign_in(username: str, password: str):
+    return test_client.post('/api/auth/sign-in', data={'username': username, 'password': password})
+
+
+def test_sign_in(session_db, staff, fast_hasher):
+    staff.password_hash = fast_hasher.handler.hash('secret')
+    session_db.commit()
+
+    assert sign_in(staff.username, 'secret').status_code == 200
+    assert sign_in(staff.username, 'wrong').status_code == 401
+
+
+def test_sign_in_rehashes_password_with_new_cost(session_db, staff, fast_hasher):
+    staff.password_hash = bcrypt.using(rounds=4).hash('secret')
+    session_db.commit()
+
+    response = sign_in(staff.username, 'secret')
+    session_db.refresh(staff)
+
+    assert response.status_code == 200
+    assert bcrypt.from_string(staff.password_hash).rounds == 5
+    assert bcrypt.verify('secret', staff.password_hash)
+
+
+def test_saturated_hasher_rejects_at_once():
+    hasher = PasswordHasher(workers=1, queue_size=1, rounds=4)
+    release = threading.Event()
+    futures = [hasher._submit(release.wait) for _ in range(2)]
+
+    with pytest.raises(HTTPException) as e:
+        hasher._submit(release.wait)
+    release.set()
+
+    assert e.value.status_code == 503
+    assert all(f.result() for f in futures)
+    assert hasher._submit(release.wait).result()
+
+
+def test_sign_in_is_rejected_when_hasher_is_saturated(staff, fast_hasher, mocker: MockerFixture):
+    mocker.patch.object(fast_hasher, '_slots', threading.BoundedSemaphore(1))
+    fast_hasher._slots.acquire()
+
+    response = sign_in(staff.username, 'secret')
+
+    assert response.status_code == 503
+    assert response.headers['retry-after'] == '1'
@@ -0,0 +1,381 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+from dateutil import relativedelta as rd
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, func, text
+from sqlalchemy.orm import sessionmaker
+from pytest_mock import MockerFixture
+
+from src.sport_app import models
+from src.sport_app import services
+from src.sport_app import tables
+from src.sport_app.app import app
+from src.sport_app.services.auth import validate_operator_access
+from src.sport_app.services.booking import booking_catalog
+from src.sport_app.services.client import admission_gate
+from src.sport_app.services.schedules.cache import catalog_version
+from .conftest import delete_all, engine, url_object
+
+
+test_client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def operator_access(session_db):
+    staff = session_db.query(tables.Staff).first()
+    app.dependency_overrides[validate_operator_access] = lambda: staff
+    yield
+    del app.dependency_overrides[validate_operator_access]
+
+
+@pytest.fixture(autouse=True)
+def empty_admission_gate():
+    yield
+    admission_gate._sold_out.clear()
+
+
+@pytest.fixture()
+def bookable_schema(session_db, records):
+    schema = tables.ScheduleSchema(name='bookable-schema', active=True)
+    schema.records = records
+    session_db.add(schema)
+    session_db.commit()
+    yield schema
+    delete_all(session_db, [schema])
+
+
+@pytest.fixture()
+def next_week_record(records):
+    """ A record with its date on the next week, which is always open for booking"""
+    record = records[0]
+    return record, record.date + rd.relativedelta(days=7)
+
+
+def test_book_client(session_db, bookable_schema, client, next_week_record):
+    record, date = next_week_record
+    params = {'program': record.program, 'date': date.isoformat()}
+
+    response = test_client.post(f'/api/client/{client.id}/book', params=params)
+    booking = session_db.query(tables.BookedClasses).filter_by(client=client.id, program=record.program).all()
+
+    assert response.status_code == 204
+    assert [b.date for b in booking] == [date]
+
+
+def test_book_client_twice_conflicts(session_db, bookable_schema, client, next_week_record):
+    record, date = next_week_record
+    params = {'program': record.program, 'date': date.isoformat()}
+
+    test_client.post(f'/api/client/{client.id}/book', params=params)
+    response = test_client.post(f'/api/client/{client.id}/book', params=params)
+
+    assert response.status_code == 409
+
+
+def test_remove_client_booking(session_db, bookable_schema, client, next_week_record):
+    record, date = next_week_record
+    params = {'program': record.program, 'date': date.isoformat()}
+    test_client.post(f'/api/client/{client.id}/book', params=params)
+
+    response = test_client.delete(f'/api/client/{client.id}/book', params=params)
+
+    assert response.status_code == 204
+    assert session_db.query(tables.BookedClasses).filter_by(client=client.id).all() == []
+
+
+@pytest.fixture()
+def many_clients(session_db):
+    clients = [tables.Client(credentials=f'client-{i}', phone=f'stress-{i}') for i in range(300)]
+    session_db.add_all(clients)
+    session_db.commit()
+    yield clients
+    delete_all(session_db, clients)
+
+
+@pytest.fixture()
+def limited_program(session_db, programs):
+    program = programs[0]
+    program.place_limit = 10
+    session_db.commit()
+    yield program
+    program.place_limit = None
+    session_db.commit()
+
+
+def test_booking_respects_place_limit(session_db, bookable_schema, limited_program, records, many_clients):
+    record = next(r for r in records if r.program == limited_program.id)
+    date = record.date + rd.relativedelta(days=7)
+    for c in many_clients[:limited_program.place_limit]:
+        services.ClientService(session_db).book_client(c.id, limited_program.id, date)
+
+    with pytest.raises(HTTPException) as e:
+        services.ClientService(session_db).book_client(many_clients[-1].id, limited_program.id, date)
+
+    assert e.value.status_code == 409
+    assert e.value.detail == 'Отсутствуют свободные места'
+
+
+def test_concurrent_booking_never_overbooks(session_db, bookable_schema, limited_program, records, many_clients):
+    """ Hundreds of parallel bookings for the same class must not exceed its place limit"""
+    record = next(r for r in records if r.program == limited_program.id)
+    date = record.date + rd.relativedelta(days=7)
+    program_id, place_limit = limited_program.id, limited_program.place_limit
+    engine = create_engine(url_object, pool_size=50, max_overflow=0)
+    Session = sessionmaker(engine, autocommit=False, autoflush=False)
+
+    def book(client_id: int) -> int:
+        with Session() as session:
+            try:
+                services.ClientService(session).book_client(client_id, program_id, date)
+            except HTTPException as e:
+                return e.status_code
+            return 204
+
+    with ThreadPoolExecutor(max_workers=50) as executor:
+        results = list(executor.map(book, [c.id for c in many_clients]))
+    engine.dispose()
+
+    BC = tables.BookedClasses
+    booked = session_db.query(func.count(BC.id)).filter(BC.program == program_id, BC.date == date).scalar()
+    seats = session_db.query(tables.ClassSeats).filter_by(program=program_id, date=date).one()
+    assert results.count(204) == place_limit
+    assert results.count(409) == len(many_clients) - place_limit
+    assert booked == seats.booked == place_limit
+
+
+def test_cancelled_booking_frees_seat(session_db, bookable_schema, limited_program, records, many_clients):
+    record = next(r for r in records if r.program == limited_program.id)
+    date = record.date + rd.relativedelta(days=7)
+    for c in many_clients[:limited_program.place_limit]:
+        services.ClientService(session_db).book_client(c.id, limited_program.id, date)
+
+    services.ClientService(session_db).remove_client_booking(many_clients[0].id, limited_program.id, date)
+    services.ClientService(session_db).book_client(many_clients[-1].id, limited_program.id, date)
+
+    seats = session_db.query(tables.ClassSeats).filter_by(program=limited_program.id, date=date).one()
+    assert seats.booked == limited_program.place_limit
+
+
+def test_booking_full_class_through_api_conflicts(session_db, bookable_schema, limited_program, records, many_clients):
+    record = next(r for r in records if r.program == limited_program.id)
+    date = record.date + rd.relativedelta(days=7)
+    for c in many_clients[:limited_program.place_limit]:
+        services.ClientService(session_db).book_client(c.id, limited_program.id, date)
+    params = {'program': limited_program.id, 'date': date.isoformat()}
+
+    response = test_client.post(f'/api/client/{many_clients[-1].id}/book', params=params)
+
+    assert response.status_code == 409
+    assert response.json()['detail'] == 'Отсутствуют свободные места'
+
+
+def fill_class(session_db, program, date, clients):
+    for c in clients[:program.place_limit]:
+        services.ClientService(session_db).book_client(c.id, program.id, date)
+
+
+def test_booking_uses_prewarmed_catalog(bookable_schema, client, next_week_record, many_clients, mocker: MockerFixture):
+    record, date = next_week_record
+    params = {'program': record.program, 'date': date.isoformat()}
+    test_client.post(f'/api/client/{many_clients[0].id}/book', params=params)
+    schemas = mocker.spy(services.SchemaService, 'current_schemas')
+    program = mocker.spy(services.ProgramService, 'get')
+
+    response = test_client.post(f'/api/client/{client.id}/book', params=params)
+
+    assert response.status_code == 204
+    schemas.assert_not_called()
+    program.assert_not_called()
+
+
+def test_booking_catalog_follows_schema_changes(session_db, bookable_schema, client, next_week_record):
+    record, date = next_week_record
+    params = {'program': record.program, 'date': date.isoformat()}
+    test_client.post(f'/api/client/{client.id}/book', params=params)
+    test_client.delete(f'/api/client/{client.id}/book', params=params)
+    bookable_schema.records = [r for r in bookable_schema.records if r is not record]
+    session_db.commit()
+
+    response = test_client.post(f'/api/client/{client.id}/book', params=params)
+
+    assert response.status_code == 404
+
+
+def test_booking_catalog_refresh_survives_cancelled_request(bookable_schema):
+    """ The snapshot is loaded in its own session, so cancelling the request that started the load does not
+    affect the requests waiting for it"""
+    async def scenario():
+        catalog_version.bump()
+        first = asyncio.create_task(booking_catalog.refresh())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(booking_catalog.refresh())
+        first.cancel()
+        await waiter
+        return first.cancelled()
+
+    assert asyncio.run(scenario())
+    assert not booking_catalog.is_stale
+    assert booking_catalog.slots[bookable_schema.id]
+
+
+def test_sold_out_class_is_rejected_without_database(
+        session_db, bookable_schema, limited_program, records, many_clients, mocker: MockerFixture):
+    record = next(r for r in records if r.program == limited_program.id)
+    date = record.date + rd.relativedelta(days=7)
+    fill_class(session_db, limited_program, date, many_clients)
+    params = {'program': limited_program.id, 'date': date.isoformat()}
+    test_client.post(f'/api/client/{many_clients[-1].id}/book', params=params)
+    reserve = mocker.spy(services.ClientService, 'reserve_place')
+
+    response = test_client.post(f'/api/client/{many_clients[-2].id}/book', params=params)
+
+    assert response.status_code == 409
+    assert response.json()['detail'] == 'Отсутствуют свободные места'
+    reserve.assert_not_called()
+
+
+def test_cancellation_reopens_sold_out_class(session_db, bookable_schema, limited_program, records, many_clients):
+    record = next(r for r in records if r.program == limited_program.id)
+    date = record.date + rd.relativedelta(days=7)
+    fill_class(session_db, limited_program, date, many_clients)
+    params = {'program': limited_program.id, 'date': date.isoformat()}
+    test_client.post(f'/api/client/{many_clients[-1].id}/book', params=params)
+
+    test_client.delete(f'/api/client/{many_clients[0].id}/book', params=params)
+    response = test_client.post(f'/api/client/{many_clients[-1].id}/book', params=params)
+
+    assert response.status_code == 204
+
+
+async def book_concurrently(clients: list[tables.Client], params: dict) -> list[int]:
+    async with httpx.AsyncClient(app=app, base_url='http://test') as http:
+        responses = await asyncio.gather(*[
+            http.post(f'/api/client/{c.id}/book', params=params) for c in clients
+        ])
+    return [r.status_code for r in responses]
+
+
+def test_flash_crowd_is_admitted_in_order(session_db, bookable_schema, limited_program, records, many_clients):
+    """ A burst of requests for one class books exactly its place limit and rejects the rest"""
+    record = next(r for r in records if r.program == limited_program.id)
+    date = record.date + rd.relativedelta(days=7)
+    params = {'program': limited_program.id, 'date': date.isoformat()}
+
+    results = asyncio.run(book_concurrently(many_clients[:80], params))
+
+    seats = session_db.query(tables.ClassSeats).filter_by(program=limited_program.id, date=date).one()
+    assert results.count(204) == seats.booked == limited_program.place_limit
+    assert results.count(409) == 80 - limited_program.place_limit
+
+
+def test_flash_crowd_overflowing_queue_is_told_to_retry(
+        bookable_schema, limited_program, records, many_clients, mocker: MockerFixture):
+    record = next(r for r in records if r.program == limited_program.id)
+    date = record.date + rd.relativedelta(days=7)
+    params = {'program': limited_program.id, 'date': date.isoformat()}
+    mocker.patch.object(admission_gate, 'queue_size', 5)
+
+    results = asyncio.run(book_concurrently(many_clients[:40], params))
+
+    assert results.count(503) > 0
+    assert results.count(204) <= limited_program.place_limit
+
+
+def test_clients_are_paginated_by_id(many_clients):
+    ids, params = [], {'limit': 120}
+    while True:
+        page = test_client.get('/api/client/', params=params).json()
+        ids += [c['id'] for c in page['items']]
+        if page['next_after_id'] is None:
+            break
+        params['after_id'] = page['next_after_id']
+
+    assert ids == sorted(ids)
+    assert set(ids) >= {c.id for c in many_clients}
+
+
+def test_clients_page_filters_and_total(many_clients):
+    params = {'credentials': 'CLIENT-1', 'phone': 'stress-1', 'with_total': True, 'limit': 5}
+
+    page = test_client.get('/api/client/', params=params).json()
+
+    expected = [c.id for c in many_clients if c.phone.startswith('stress-1')]
+    assert page['total'] == len(expected)
+    assert [c['id'] for c in page['items']] == expected[:5]
+    assert page['next_after_id'] == expected[4]
+
+
+@pytest.mark.parametrize('params', ({'credentials': '%'}, {'credentials': 'client_1'}, {'phone': '%'}, {'phone': 'stress_'}))
+def test_clients_page_filters_match_wildcards_literally(many_clients, params):
+    page = test_client.get('/api/client/', params={**params, 'with_total': True}).json()
+
+    assert page['total'] == 0 and page['items'] == []
+
+
+def test_operator_gets_minimum_client_model(many_clients):
+    operator = models.Staff(id=0, username='operator', email='operator@mail.cm', role='staff_role.operator')
+    app.dependency_overrides[validate_operator_access] = lambda: operator
+
+    page = test_client.get('/api/client/', params={'limit': 1}).json()
+
+    assert page['items'][0].keys() == {'id', 'credentials'}
+
+
+def test_admin_gets_full_client_model(many_clients):
+    admin = models.Staff(id=0, username='admin', email='admin@mail.cm', role='staff_role.admin')
+    app.dependency_overrides[validate_operator_access] = lambda: admin
+
+    page = test_client.get('/api/client/', params={'limit': 1}).json()
+
+    assert page['items'][0].keys() == {'id', 'credentials', 'phone', 'additional_data'}
+
+
+def pg_trgm_installed() -> bool:
+    with engine.connect() as connection:
+        return connection.execute(text("SELECT exists(SELECT FROM pg_extension WHERE extname = 'pg_trgm')")).scalar()
+
+
+requires_pg_trgm = pytest.mark.skipif(not pg_trgm_installed(), reason='pg_trgm extension is not installed')
+
+
+@pytest.fixture()
+def named_clients(session_db):
+    clients = [
+        tables.Client(credentials='Иванов Иван Петрович', phone='+7 (912) 000-11-22'),
+        tables.Client(credentials='Петров Иван Сергеевич', phone='+7 (912) 345-67-89'),
+        tables.Client(credentials='Сидорова Анна', phone='8 922 111 22 33'),
+    ]
+    session_db.add_all(clients)
+    session_db.commit()
+    yield clients
+    delete_all(session_db, clients)
+
+
+def test_client_phone_digits_are_normalized(named_clients):
+    assert named_clients[0].phone_digits == '79120001122'
+
+
+def search(q: str) -> list[str]:
+    response = test_client.get('/api/client/search', params={'q': q})
+    assert response.status_code == 200
+    return [c['credentials'] for c in response.json()]
+
+
+@requires_pg_trgm
+def test_search_clients_by_name_prefix_first(named_clients):
+    assert search('Петров')[0] == 'Петров Иван Сергеевич'
+
+
+@requires_pg_trgm
+def test_search_clients_tolerates_typos(named_clients):
+    assert search('Сидорава') == ['Сидорова Анна']
+
+
+@requires_pg_trgm
+def test_search_clients_by_partial_phone(named_clients):
+    assert search('345-67') == ['Петров Иван Сергеевич']
+    assert search('912')[:2] == ['Иванов Иван Петрович', 'Петров Иван Сергеевич']
@@ -0,0 +1,133 @@
+import json
+from contextlib import contextmanager
+from typing import Iterator
+
+import pytest
+from dateutil import relativedelta as rd
+from sqlalchemy import delete, event, insert, text
+
+from src.sport_app import models
+from src.sport_app import services
+from src.sport_app import tables
+from src.sport_app.services.reports import ReportsService
+from .conftest import delete_all, engine
+
+
+@contextmanager
+def used_indexes() -> Iterator[set[str]]:
+    """ Collects names of the indexes in the plans of SELECT and DELETE statements issued within the block.
+    Sequential scans are disabled, since on the tiny test tables the planner prefers them to any index,
+    and statistics are refreshed so that the choice between indexes does not depend on the previous tests"""
+    indexes, statements = set(), []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'DELETE')):
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield indexes
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    def collect(plan: dict):
+        if 'Index Name' in plan:
+            indexes.add(plan['Index Name'])
+        for child in plan.get('Plans', []):
+            collect(child)
+
+    with engine.connect() as connection, connection.begin():
+        connection.execute(text('ANALYZE'))
+        connection.execute(text('SET LOCAL enable_seqscan = off'))
+        for statement, parameters in statements:
+            plan = connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {statement}', parameters).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            collect(plan[0]['Plan'])
+
+
+@pytest.fixture()
+def schema(session_db, records):
+    schema = tables.ScheduleSchema(name='indexed-schema', active=True)
+    schema.records = records
+    session_db.add(schema)
+    session_db.commit()
+    yield schema
+    delete_all(session_db, [schema])
+
+
+@pytest.fixture()
+def booking(session_db, client, records):
+    record = records[0]
+    booking = tables.BookedClasses(client=client.id, program=record.program, date=record.date + rd.relativedelta(days=7))
+    session_db.add(booking)
+    session_db.commit()
+    return booking
+
+
+@pytest.fixture()
+def past_bookings(session_db, records):
+    """ Booking history, so that upcoming classes are a small part of booked_classes as in production"""
+    clients = [tables.Client(credentials=f'history-{i}', phone=f'history-{i}') for i in range(200)]
+    session_db.add_all(clients)
+    session_db.commit()
+    session_db.execute(insert(tables.BookedClasses), [
+        {'client': c.id, 'program': record.program, 'date': record.date - rd.relativedelta(weeks=weeks)}
+        for c in clients for weeks, record in enumerate(records[:10], start=1)
+    ])
+    session_db.commit()
+    yield
+    delete_all(session_db, clients)
+
+
+def test_upcoming_bookings_count_uses_date_index(session_db, schema, past_bookings, booking):
+    with used_indexes() as indexes:
+        services.ScheduleService(session_db)._count_booked_classes({})
+
+    assert 'ix_booked_classes_date_program' in indexes
+
+
+def test_client_report_uses_attendance_key(session_db, booking):
+    with used_indexes() as indexes:
+        ReportsService(session_db).client_report(booking.client, models.Periods.week)
+
+    assert 'client_attendance_pkey' in indexes
+
+
+def test_client_bookings_lookup_uses_unique_constraint_index(session_db, booking):
+    """ The statement ON DELETE CASCADE runs on booked_classes when a client is deleted. The client is the leading
+    column of one_booking_per_client_uc, so no separate index on it is needed"""
+    client_id = booking.client
+
+    with used_indexes() as indexes:
+        session_db.execute(delete(tables.BookedClasses).where(tables.BookedClasses.client == client_id))
+    session_db.rollback()
+
+    assert 'one_booking_per_client_uc' in indexes
+
+
+def test_booking_uses_schema_record_slot_index(session_db, schema, client, records):
+    record = records[1]
+
+    with used_indexes() as indexes:
+        services.ClientService(session_db).book_client(client.id, record.program, record.date + rd.relativedelta(days=7))
+
+    assert 'ix_schema_record_slot' in indexes
+
+
+def test_programs_report_uses_attendance_key(session_db, booking):
+    report = models.ProgramsReport(programs=[booking.program], period=models.Periods.month)
+
+    with used_indexes() as indexes:
+        ReportsService(session_db).programs_report(report)
+
+    assert 'program_attendance_pkey' in indexes
+
+
+def test_removing_booking_uses_program_and_date_index(session_db, booking, records):
+    with used_indexes() as indexes:
+        services.SchemaService(session_db)._remove_booking([records[0].id], next_week=True)
+    session_db.rollback()
+
+    assert indexes & {'ix_booked_classes_program_date', 'ix_booked_classes_date_program'}
+    assert 'booked_classes_pkey' not in indexes
@@ -1,26 +1,30 @@
+import io
 from pathlib import Path
-from pytest_mock import MockerFixture
+
+from PIL import Image
 
 from fastapi.testclient import TestClient
 
-from src.sport_app import services
+from src.sport_app import images
+from src.sport_app import models
+from src.sport_app import tables
 from src.sport_app.app import app
+from src.sport_app.backfill_images import backfill
 from src.sport_app.settings import settings
 from src.sport_app.services.programs.instructor import InstructorService
+from .conftest import delete_all
 
 client = TestClient(app)
+img_path = Path('files/img.jpg').resolve()
 
-def test_upload_instructor_image_writes_new_image_file(instructor, tmp_path, monkeypatch, mocker: MockerFixture):
+def test_upload_instructor_image_writes_new_image_file(instructor, tmp_path, monkeypatch):
     files = {'image': open('files/img.jpg', 'rb')}
     monkeypatch.chdir(tmp_path)
-    token_name = 'img-name'
-    patched = mocker.patch.object(services.programs.instructor, 'token_urlsafe')
-    patched.return_value = token_name
 
     response = client.put(f'/api/programs/instructor/{instructor.id}/image', files=files)
 
     assert response.status_code == 200
-    assert Path.exists(tmp_path / settings.images_path / 'instructors' / f'{token_name}.jpg')
+    assert Path.exists(tmp_path / response.json()['photo_src'])
 
 
 def test_upload_instructor_image_removes_old_image_file(instructor_with_image, tmp_path, monkeypatch):
@@ -43,3 +47,129 @@ def test_upload_instructor_image_fails_on_non_image_file(instructor, tmp_path, m
 
     assert response.status_code == 400
     assert response.json()['detail'] == 'Invalid image type'
+
+
+def test_upload_instructor_image_writes_resized_variants(session_db, instructor, tmp_path, monkeypatch):
+    files = {'image': ('big.png', big_png(), 'image/png')}
+    monkeypatch.chdir(tmp_path)
+
+    response = client.put(f'/api/programs/instructor/{instructor.id}/image', files=files)
+
+    assert response.status_code == 200
+    session_db.refresh(instructor)
+    token = instructor.photo_token
+    assert response.json()['photo_variants'] == images.urls(token)
+    assert response.json()['photo_src'] == images.urls(token)['full']
+    for variant, size in images.VARIANTS.items():
+        with Image.open(tmp_path / settings.images_path / 'instructors' / images.filename(token, variant)) as img:
+            assert img.format == 'JPEG'
+            assert img.mode == 'RGB'
+            assert max(img.size) == size
+            assert img.size[0] == 2 * img.size[1]
+
+
+def test_uploaded_image_is_named_by_content(instructor, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    first = client.put(f'/api/programs/instructor/{instructor.id}/image', files={'image': open(img_path, 'rb')})
+    second = client.put(f'/api/programs/instructor/{instructor.id}/image', files={'image': open(img_path, 'rb')})
+    other = client.put(f'/api/programs/instructor/{instructor.id}/image', files={'image': ('big.png', big_png(), 'image/png')})
+
+    assert first.json()['photo_src'] == second.json()['photo_src'] != other.json()['photo_src']
+
+
+def test_upload_keeps_image_shared_with_other_instructor(session_db, instructor, tmp_path, monkeypatch):
+    other = tables.Instructor(credentials='other-instructor', phone='901')
+    session_db.add(other)
+    session_db.commit()
+    monkeypatch.chdir(tmp_path)
+    for instructor_id in (instructor.id, other.id):
+        shared = client.put(f'/api/programs/instructor/{instructor_id}/image', files={'image': open(img_path, 'rb')})
+
+    response = client.put(f'/api/programs/instructor/{instructor.id}/image', files={'image': ('big.png', big_png(), 'image/png')})
+
+    assert response.status_code == 200
+    assert Path.exists(tmp_path / shared.json()['photo_src'])
+    delete_all(session_db, [other])
+
+
+def test_dev_image_route_serves_immutable_files(instructor, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    photo_src = client.put(
+        f'/api/programs/instructor/{instructor.id}/image', files={'image': open(img_path, 'rb')}
+    ).json()['photo_src']
+
+    response = client.get(f'/{photo_src}')
+    monkeypatch.setattr(settings, 'serve_images', False)
+    disabled = client.get(f'/{photo_src}')
+
+    assert response.status_code == 200
+    assert response.headers['cache-control'] == images.CACHE_CONTROL
+    assert disabled.status_code == 404
+
+
+def test_upload_instructor_image_removes_old_variants(instructor_with_image, tmp_path, monkeypatch):
+    files = {'image': open(img_path, 'rb')}
+    monkeypatch.chdir(tmp_path)
+    directory = tmp_path / settings.images_path / 'instructors'
+    old_files = [directory / images.filename(instructor_with_image.photo_token, v) for v in images.VARIANTS]
+    for file in old_files:
+        file.touch()
+
+    response = client.put(f'/api/programs/instructor/{instructor_with_image.id}/image', files=files)
+
+    assert response.status_code == 200
+    assert not any(file.exists() for file in old_files)
+
+
+def test_upload_instructor_image_fails_on_undecodable_image(instructor, tmp_path, monkeypatch):
+    files = {'image': ('img.jpg', b'not an image', 'image/jpeg')}
+    monkeypatch.chdir(tmp_path)
+
+    response = client.put(f'/api/programs/instructor/{instructor.id}/image', files=files)
+
+    assert response.status_code == 400
+    assert response.json()['detail'] == 'Invalid image type'
+    assert not list((tmp_path / settings.images_path / 'instructors').iterdir())
+
+
+def test_instructor_variants_are_served_with_programs(programs, session_db):
+    token = '0123456789abcdef' * 2
+    programs[0].instructor_obj.photo_token = token
+    session_db.commit()
+
+    response = client.get(f'/api/programs/{programs[0].id}')
+
+    assert response.status_code == 200
+    assert response.json()['instructor']['photo_variants']['thumb'] == images.urls(token)['thumb']
+
+
+def test_legacy_photo_is_served_without_variants(instructor_with_image):
+    """ Photos uploaded before variants existed have only the original file until they are backfilled"""
+    model = models.InstructorPublic.from_orm(instructor_with_image)
+
+    assert model.photo_src == images.urls(instructor_with_image.photo_token)['full']
+    assert model.photo_variants is None
+
+
+def test_backfill_renders_variants_for_legacy_photos(session_db, instructor_with_image, tmp_path):
+    directory = tmp_path / settings.images_path / 'instructors'
+    legacy = directory / f'{instructor_with_image.photo_token}.jpg'
+    legacy.write_bytes(img_path.read_bytes())
+
+    result = backfill(session_db, directory)
+    session_db.refresh(instructor_with_image)
+
+    token = instructor_with_image.photo_token
+    assert result == {'rendered': 1, 'missing': 0, 'invalid': 0}
+    assert images.has_variants(token)
+    assert all((directory / images.filename(token, variant)).exists() for variant in images.VARIANTS)
+    assert not legacy.exists()
+    assert backfill(session_db, directory)['rendered'] == 0
+
+
+def big_png() -> bytes:
+    """A transparent image larger than every variant"""
+    buffer = io.BytesIO()
+    Image.new('RGBA', (3200, 1600), (10, 20, 30, 0)).save(buffer, 'PNG')
+    return buffer.getvalue()
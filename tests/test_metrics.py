@@ -0,0 +1,55 @@
+from fastapi.testclient import TestClient
+from prometheus_client.parser import text_string_to_metric_families
+
+from src.sport_app.app import app
+
+
+client = TestClient(app)
+
+
+def scrape() -> dict[tuple, float]:
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in text_string_to_metric_families(response.text)
+        for sample in family.samples
+    }
+
+
+def requests_total(samples: dict, **labels) -> float:
+    return samples.get(('http_requests_total', tuple(sorted(labels.items()))), 0)
+
+
+def test_requests_are_counted_by_operation_id_and_status():
+    before = scrape()
+
+    client.get('/api/monitoring/pool')
+    client.get('/api/schedule/range', params={'from': '2023-01-02', 'to': '2022-01-01'})
+
+    after = scrape()
+    ok = dict(operation='get_pool_status', method='GET', status='200')
+    invalid = dict(operation='get_schedule_range', method='GET', status='422')
+    assert requests_total(after, **ok) == requests_total(before, **ok) + 1
+    assert requests_total(after, **invalid) == requests_total(before, **invalid) + 1
+
+
+def test_latency_histogram_is_recorded_per_operation():
+    client.get('/api/monitoring/pool')
+
+    samples = scrape()
+
+    labels = (('method', 'GET'), ('operation', 'get_pool_status'))
+    assert samples[('http_request_duration_seconds_count', labels)] >= 1
+    assert samples[('http_request_duration_seconds_bucket', (('le', '+Inf'),) + labels)] >= 1
+
+
+def test_unknown_paths_share_one_label():
+    before = scrape()
+
+    client.get('/api/no-such-route/1')
+    client.get('/api/no-such-route/2')
+
+    after = scrape()
+    labels = dict(operation='unmatched', method='GET', status='404')
+    assert requests_total(after, **labels) == requests_total(before, **labels) + 2
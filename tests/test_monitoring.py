@@ -0,0 +1,66 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, exc, text
+
+from src.sport_app.app import app
+from src.sport_app.database import TimedQueuePool, connect_args
+from src.sport_app.services.monitoring import pool_status
+from src.sport_app.settings import settings
+from .conftest import url_object
+
+
+client = TestClient(app)
+
+
+@pytest.fixture()
+def small_pool_engine():
+    engine = create_engine(url_object, poolclass=TimedQueuePool, pool_size=1, max_overflow=1, pool_timeout=0.1)
+    yield engine
+    engine.dispose()
+
+
+def test_pool_status_endpoint_lists_worker_pools():
+    response = client.get('/api/monitoring/pool')
+
+    assert response.status_code == 200
+    assert {pool['name'] for pool in response.json()} == {'sync', 'async'}
+
+
+def test_pool_status_reports_checked_out_and_overflow(small_pool_engine):
+    connections = [small_pool_engine.connect() for _ in range(2)]
+
+    status = pool_status('test', small_pool_engine)
+
+    assert (status.size, status.checked_out, status.overflow, status.checkouts) == (1, 2, 1, 2)
+    for connection in connections:
+        connection.close()
+
+
+def test_pool_status_counts_timeouts(small_pool_engine):
+    connections = [small_pool_engine.connect() for _ in range(2)]
+
+    with pytest.raises(exc.TimeoutError):
+        small_pool_engine.connect()
+
+    status = pool_status('test', small_pool_engine)
+    assert status.timeouts == 1
+    assert status.wait_max_ms >= 100
+    for connection in connections:
+        connection.close()
+
+
+def test_pool_stats_survive_dispose(small_pool_engine):
+    small_pool_engine.connect().close()
+
+    small_pool_engine.dispose()
+
+    assert pool_status('test', small_pool_engine).checkouts == 1
+
+
+def test_statement_timeout_cancels_long_queries(monkeypatch):
+    monkeypatch.setattr(settings, 'db_statement_timeout_ms', 50)
+    engine = create_engine(url_object, connect_args=connect_args('postgresql'))
+
+    with engine.connect() as connection, pytest.raises(exc.OperationalError):
+        connection.execute(text('SELECT pg_sleep(1)'))
+    engine.dispose()
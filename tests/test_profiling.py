@@ -0,0 +1,84 @@
+import logging
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from src.sport_app import tables
+from src.sport_app.app import app
+from src.sport_app.database import collect_query_stats
+from src.sport_app.profiling import log_query_stats
+from src.sport_app.services.schedules.cache import schedule_cache
+from src.sport_app.settings import settings
+from .conftest import delete_all, assert_max_queries
+
+
+client = TestClient(app)
+
+
+@pytest.fixture()
+def schedule_schema(session_db, records):
+    schema = tables.ScheduleSchema(name='profiling-schema', active=True)
+    schema.records = records
+    session_db.add(schema)
+    session_db.commit()
+    schedule_cache.invalidate()
+    yield schema
+    delete_all(session_db, [schema])
+
+
+def test_staff_responses_carry_query_stats(programs, staff_headers):
+    response = client.get('/api/programs/', headers=staff_headers)
+
+    assert int(response.headers['X-DB-Queries']) > 0
+    assert response.headers['Server-Timing'].startswith('db;dur=')
+
+
+def test_anonymous_responses_do_not_carry_query_stats(programs):
+    response = client.get('/api/programs/')
+
+    assert response.status_code == 200
+    assert 'X-DB-Queries' not in response.headers
+    assert 'Server-Timing' not in response.headers
+
+
+@pytest.mark.parametrize('url, max_queries', (
+    ('/api/schedule/', 6),
+    ('/api/schedule/?compact=true', 6),
+    ('/api/schedule/records', 4),
+    ('/api/schedule/schema/{schema_id}/records', 5),
+    ('/api/programs/', 3),
+    ('/api/client/', 1),
+))
+def test_endpoint_query_budget(schedule_schema, staff_headers, url, max_queries):
+    """ Budgets are measured with 9 programs, so lazy loading per program exceeds them"""
+    response = client.get(url.format(schema_id=schedule_schema.id), headers=staff_headers)
+
+    assert response.status_code == 200
+    assert_max_queries(response, max_queries)
+
+
+def test_query_stats_keep_slowest_statements(session_db):
+    with collect_query_stats() as stats:
+        session_db.execute(text('SELECT pg_sleep(0.05)'))
+        for _ in range(5):
+            session_db.execute(text('SELECT 1'))
+    session_db.rollback()
+
+    assert stats.count == 6
+    assert stats.total_s >= 0.05
+    assert [statement for _, statement in stats.slowest][0] == 'SELECT pg_sleep(0.05)'
+    assert len(stats.slowest) == settings.sql_slowest_statements
+
+
+def test_repeated_statement_is_logged_as_n_plus_one(session_db, caplog):
+    scope = {'method': 'GET', 'path': '/api/test'}
+    with collect_query_stats() as stats:
+        for i in range(settings.sql_repeat_threshold):
+            session_db.execute(text('SELECT :i'), {'i': i})
+    session_db.rollback()
+
+    with caplog.at_level(logging.WARNING):
+        log_query_stats(scope, stats)
+
+    assert f'executed {settings.sql_repeat_threshold} times, possible N+1' in caplog.text
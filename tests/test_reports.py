@@ -0,0 +1,166 @@
+import asyncio
+import csv
+import datetime
+import io
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from pytest_mock import MockerFixture
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.sport_app import models
+from src.sport_app import tables
+from src.sport_app import utils
+from src.sport_app.rebuild_attendance import rebuild
+from src.sport_app.app import app
+from src.sport_app.services.reports import ReportsService, AsyncReportsService
+from src.sport_app.settings import settings
+from .conftest import delete_all, count_queries, async_engine
+
+
+test_client = TestClient(app)
+
+
+def at(*args) -> datetime.datetime:
+    return datetime.datetime(*args, 10, tzinfo=utils.tz)
+
+
+# 2025-12-30 belongs to the first ISO week of 2026
+DATES = [at(2025, 12, 30), at(2026, 1, 2), at(2026, 1, 5), at(2026, 3, 2)]
+
+
+@pytest.fixture()
+def history(session_db, programs, client):
+    rows = [tables.BookedClasses(client=client.id, program=programs[0].id, date=date) for date in DATES]
+    rows.append(tables.BookedClasses(client=client.id, program=programs[1].id, date=DATES[0]))
+    session_db.add_all(rows)
+    session_db.commit()
+    yield rows
+    delete_all(session_db, session_db.query(tables.BookedClasses).all())
+
+
+def report_amounts(rows: list[models.ProgramsReportRow]) -> dict:
+    return {(r.period_begin.date(), r.period_end.date()): r.amount for r in rows}
+
+
+def test_programs_report_by_iso_week(session_db, programs, history):
+    request = models.ProgramsReport(programs=[programs[0].id, programs[1].id], period=models.Periods.week)
+
+    report = ReportsService(session_db).programs_report(request)
+
+    assert report_amounts(report.data) == {
+        (datetime.date(2026, 3, 2), datetime.date(2026, 3, 8)): 1,
+        (datetime.date(2026, 1, 5), datetime.date(2026, 1, 11)): 1,
+        (datetime.date(2025, 12, 29), datetime.date(2026, 1, 4)): 3,
+    }
+
+
+def test_programs_report_by_month(session_db, programs, history):
+    request = models.ProgramsReport(programs=[programs[0].id], period=models.Periods.month)
+
+    report = ReportsService(session_db).programs_report(request)
+
+    assert report_amounts(report.data) == {
+        (datetime.date(2026, 3, 1), datetime.date(2026, 3, 31)): 1,
+        (datetime.date(2026, 1, 1), datetime.date(2026, 1, 31)): 2,
+        (datetime.date(2025, 12, 1), datetime.date(2025, 12, 31)): 1,
+    }
+
+
+def test_client_report(session_db, programs, client, history):
+    report = ReportsService(session_db).client_report(client.id, models.Periods.month)
+
+    assert [r.program.id for r in report] == [programs[0].id, programs[1].id]
+    assert sum(r.amount for r in report[0].data) == len(DATES)
+    assert report_amounts(report[1].data) == {(datetime.date(2025, 12, 1), datetime.date(2025, 12, 31)): 1}
+
+
+def test_removed_booking_leaves_report(session_db, programs, client, history):
+    session_db.delete(history[-2])
+    session_db.commit()
+    request = models.ProgramsReport(programs=[programs[0].id], period=models.Periods.month)
+
+    report = ReportsService(session_db).programs_report(request)
+
+    assert (datetime.date(2026, 3, 1), datetime.date(2026, 3, 31)) not in report_amounts(report.data)
+
+
+def test_reports_do_not_read_bookings(session_db, programs, client, history):
+    request = models.ProgramsReport(programs=[programs[0].id], period=models.Periods.week)
+    client_id = client.id
+
+    with count_queries() as statements:
+        ReportsService(session_db).programs_report(request)
+        ReportsService(session_db).client_report(client_id, models.Periods.week)
+
+    assert statements
+    assert not [s for s in statements if 'booked_classes' in s]
+
+
+def weeks(session_db, program_id) -> dict:
+    rows = session_db.query(tables.ProgramAttendance).filter_by(program=program_id, period='week').all()
+    return {(r.year, r.num): r.amount for r in rows}
+
+
+def test_rebuild_attendance_in_other_timezone(session_db, programs, client, history):
+    """ Monday 03:00 in the app timezone is still Sunday in UTC: the rebuild and the trigger move it a week back"""
+    program_id = programs[0].id
+    session_db.add(tables.BookedClasses(client=client.id, program=program_id, date=datetime.datetime(2026, 3, 9, 3, tzinfo=utils.tz)))
+    session_db.commit()
+    assert weeks(session_db, program_id)[(2026, 11)] == 1
+
+    try:
+        rebuild(session_db.connection(), 'UTC')
+        session_db.commit()
+        rebuilt = weeks(session_db, program_id)
+        session_db.add(tables.BookedClasses(client=client.id, program=program_id, date=datetime.datetime(2026, 3, 16, 3, tzinfo=utils.tz)))
+        session_db.commit()
+        triggered = weeks(session_db, program_id)
+    finally:
+        rebuild(session_db.connection(), settings.timezone)
+        session_db.commit()
+
+    assert (2026, 11) not in rebuilt and rebuilt[(2026, 10)] == 2
+    assert triggered[(2026, 11)] == 1
+    assert weeks(session_db, program_id)[(2026, 12)] == 1
+
+def test_export_bookings_as_csv(programs, client, history):
+    response = test_client.get('/api/reports/export/bookings', params={'from': DATES[1].isoformat()})
+
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/csv')
+    assert 'attachment' in response.headers['content-disposition']
+    assert [datetime.datetime.fromisoformat(r['date']) for r in rows] == DATES[1:]
+    assert {r['client_credentials'] for r in rows} == {client.credentials}
+
+
+def test_export_client_history_as_ndjson(programs, client, history):
+    response = test_client.get(f'/api/reports/export/client/{client.id}', params={'format': 'ndjson'})
+
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert response.status_code == 200
+    assert len(rows) == len(history)
+    assert rows[0].keys() == {'date', 'program', 'program_name'}
+
+
+def test_export_programs_report_matches_report(session_db, programs, history):
+    request = models.ProgramsReport(programs=[programs[0].id], period=models.Periods.week)
+
+    response = test_client.post('/api/reports/export/programs', params={'format': 'ndjson'}, json=request.dict())
+
+    rows = [models.ProgramsReportRow(**json.loads(line)) for line in response.text.splitlines()]
+    assert rows == ReportsService(session_db).programs_report(request).data
+
+
+def test_export_reads_in_batches(client, history, mocker: MockerFixture):
+    """ Rows are fetched by a server-side cursor in batches of export_batch_size"""
+    mocker.patch.object(settings, 'export_batch_size', 2)
+    client_id = client.id
+
+    async def export() -> list[int]:
+        async with AsyncSession(async_engine) as session:
+            return [len(p) async for p in AsyncReportsService(session).export_client_history(client_id)]
+
+    assert asyncio.run(export()) == [2, 2, 1]
@@ -0,0 +1,217 @@
+import json
+
+import pytest
+from dateutil import relativedelta as rd
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+from pytest_mock import MockerFixture
+
+from src.sport_app import services
+from src.sport_app import tables
+from src.sport_app import utils
+from src.sport_app.app import app
+from src.sport_app.services.schedules.cache import schedule_cache, schedule_version
+from .conftest import delete_all, count_queries
+
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    schedule_cache.invalidate()
+
+
+@pytest.fixture()
+def schedule_schema(session_db, records):
+    schema = tables.ScheduleSchema(name='schedule-schema', active=True)
+    schema.records = records
+    session_db.add(schema)
+    session_db.commit()
+    yield schema
+    delete_all(session_db, [schema])
+
+
+def test_schedule_is_served_from_cache(schedule_schema, mocker: MockerFixture):
+    first = client.get('/api/schedule/')
+    method = mocker.spy(services.ScheduleService, '_construct_schedule')
+    second = client.get('/api/schedule/')
+
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    method.assert_not_called()
+
+
+@pytest.mark.parametrize('compact', (False, True))
+def test_cached_schedule_matches_response_model(session_db, schedule_schema, compact, mocker: MockerFixture):
+    """ The cached JSON is returned as is and is the same as the schedule encoded through the response model"""
+    client.get('/api/schedule/', params={'compact': compact})
+    method = mocker.spy(services.ScheduleService, 'construct_schedule')
+    response = client.get('/api/schedule/', params={'compact': compact})
+    schedule = services.ScheduleService(session_db).construct_schedule({}, compact)
+    expected = json.loads(json.dumps(jsonable_encoder(schedule)))
+
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/json'
+    assert response.json() == expected
+    method.assert_called_once()
+
+
+def test_schedule_cache_is_keyed_by_filters(schedule_schema, programs, mocker: MockerFixture):
+    client.get('/api/schedule/')
+    method = mocker.spy(services.ScheduleService, '_construct_schedule')
+    response = client.get('/api/schedule/', params={'program': programs[0].id})
+
+    assert response.status_code == 200
+    assert {r['program']['id'] for r in response.json()} == {programs[0].id}
+    method.assert_called_once()
+
+
+def test_booking_invalidates_schedule_cache(session_db, schedule_schema, records):
+    client_row = tables.Client(credentials='cache-client', phone='cache-phone')
+    session_db.add(client_row)
+    session_db.commit()
+    client.get('/api/schedule/')
+    version = schedule_version.value
+    booking = tables.BookedClasses(client=client_row.id, program=records[0].program, date=records[0].date)
+    session_db.add(booking)
+    session_db.commit()
+
+    assert schedule_version.value > version
+    delete_all(session_db, [client_row])
+
+
+def test_unrelated_commit_keeps_schedule_cache(session_db, schedule_schema):
+    client.get('/api/schedule/')
+    version = schedule_version.value
+    staff = tables.Staff(username='cache-staff', email='cache@mail.cm', role='operator', password_hash='123')
+    session_db.add(staff)
+    session_db.commit()
+
+    assert schedule_version.value == version
+    delete_all(session_db, [staff])
+
+
+def test_schedule_returns_etag_and_last_modified(schedule_schema):
+    response = client.get('/api/schedule/')
+
+    assert response.status_code == 200
+    assert response.headers['etag'].startswith('"')
+    assert 'last-modified' in response.headers
+
+
+def test_schedule_not_modified_on_matching_etag(schedule_schema, mocker: MockerFixture):
+    etag = client.get('/api/schedule/').headers['etag']
+    method = mocker.spy(services.ScheduleService, 'construct_schedule')
+
+    response = client.get('/api/schedule/', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.headers['etag'] == etag
+    assert response.content == b''
+    method.assert_not_called()
+
+
+def test_schedule_etag_changes_after_mutation(session_db, schedule_schema, programs):
+    etag = client.get('/api/schedule/').headers['etag']
+    programs[0].place_limit = 10
+    session_db.commit()
+
+    response = client.get('/api/schedule/', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.headers['etag'] != etag
+
+
+def test_schedule_not_modified_since_last_modified(schedule_schema):
+    last_modified = client.get('/api/schedule/').headers['last-modified']
+
+    response = client.get('/api/schedule/', headers={'If-Modified-Since': last_modified})
+
+    assert response.status_code == 304
+
+
+def test_compact_schedule_matches_full_schedule(schedule_schema):
+    full = client.get('/api/schedule/').json()
+    compact = client.get('/api/schedule/', params={'compact': True}).json()
+
+    assert len(compact['occurrences']) == len(full)
+    assert {int(k) for k in compact['programs']} == {r['program']['id'] for r in full}
+    for record, occurrence in zip(full, compact['occurrences']):
+        assert compact['programs'][str(occurrence['program'])] == record['program']
+        assert {**occurrence, 'program': record['program']} == record
+
+
+def schedule_range(date_from, date_to, **params) -> list[dict]:
+    params |= {'from': date_from.date().isoformat(), 'to': date_to.date().isoformat()}
+    response = client.get('/api/schedule/range', params=params)
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_schedule_range_expands_every_week(schedule_schema, records):
+    monday = utils.this_mo()
+    date_from, date_to = monday - rd.relativedelta(days=7), monday + rd.relativedelta(days=20)
+
+    schedule = schedule_range(date_from, date_to)
+
+    dates = [r['date'] for r in schedule]
+    assert len(schedule) == 4 * len(records)
+    assert dates == sorted(dates)
+
+
+def test_schedule_range_is_bounded_by_dates(schedule_schema, records):
+    day = utils.this_mo() + rd.relativedelta(days=9)
+
+    schedule = schedule_range(day, day)
+
+    assert len(schedule) == len([r for r in records if r.week_day == 2])
+    assert all(r['date'].startswith(day.date().isoformat()) for r in schedule)
+
+
+def test_schedule_range_counts_bookings_in_range(session_db, schedule_schema, programs, records):
+    program = programs[0]
+    program.place_limit = 5
+    client_row = tables.Client(credentials='range-client', phone='range-phone')
+    session_db.add(client_row)
+    session_db.commit()
+    record = next(r for r in records if r.program == program.id)
+    date = record.date + rd.relativedelta(days=14)
+    session_db.add(tables.BookedClasses(client=client_row.id, program=program.id, date=date))
+    session_db.commit()
+
+    schedule = schedule_range(date, date, program=program.id)
+
+    places = {r['date']: r['places_available'] for r in schedule}
+    assert places[date.isoformat()] == 4
+    delete_all(session_db, [client_row])
+    program.place_limit = None
+    session_db.commit()
+
+
+@pytest.mark.parametrize('days', (-1, 366))
+def test_schedule_range_rejects_invalid_period(schedule_schema, days):
+    day = utils.today()
+    params = {'from': day.date().isoformat(), 'to': (day + rd.relativedelta(days=days)).date().isoformat()}
+
+    response = client.get('/api/schedule/range', params=params)
+
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize('programs_num', (1, 9))
+def test_schedule_query_count_does_not_depend_on_programs(session_db, sessionmaker_db, records, programs_num):
+    """ Programs and their related objects are loaded with a fixed number of queries"""
+    schema = tables.ScheduleSchema(name='schedule-schema', active=True)
+    schema.records = [r for r in records if r.program in {r.program for r in records[:programs_num]}]
+    session_db.add(schema)
+    session_db.commit()
+    session = sessionmaker_db()
+
+    with count_queries() as statements:
+        schedule = services.ScheduleService(session)._construct_schedule({})
+
+    session.close()
+    delete_all(session_db, [schema])
+    assert len({r.program.id for r in schedule}) == programs_num
+    assert len(statements) == 6
@@ -8,7 +8,7 @@ from sport_app import utils
 from src.sport_app import services
 from src.sport_app import tables
 from src.sport_app.app import app
-from .conftest import delete_all
+from .conftest import delete_all, count_queries
 
 
 client = TestClient(app)
@@ -54,9 +54,10 @@ def schema_with_records(session_db, active_schema, booked_rows_on_records):
 
 
 def test_schema_activation(session_db, three_schemas):
-    response = client.put(f'/api/schedule/schema/2', json={'active': True})
-    old_active = session_db.query(tables.ScheduleSchema).filter_by(id=1).first()
-    new_active = session_db.query(tables.ScheduleSchema).filter_by(id=2).first()
+    old_id, new_id = three_schemas[0].id, three_schemas[1].id
+    response = client.put(f'/api/schedule/schema/{new_id}', json={'active': True})
+    old_active = session_db.query(tables.ScheduleSchema).filter_by(id=old_id).first()
+    new_active = session_db.query(tables.ScheduleSchema).filter_by(id=new_id).first()
     assert response.status_code == 200
     assert old_active.active is False and new_active.active is True
 
@@ -82,6 +83,35 @@ def test_include_records_in_schema(session_db, schema_with_records, records):
     assert all(rec in records_ids for rec in records_to_include)
 
 
+def test_include_records_in_schema_skips_included_records(session_db, schema_with_records, records):
+    """ Records already in the schema are skipped, a single INSERT adds the rest"""
+    schema_id = schema_with_records.id
+    records_to_include = [r.id for r in records[:4]]
+    expected = {r.id for r in schema_with_records.records} | set(records_to_include)
+
+    with count_queries() as statements:
+        response = services.SchemaService(session_db).include_records_in_schema(schema_id, records_to_include)
+
+    assert set(response) == expected and len(response) == len(expected)
+    assert len([s for s in statements if s.lstrip().upper().startswith('INSERT')]) == 1
+
+
+def test_exclude_records_with_force_delete_removes_orphans_only(session_db, schema_with_records):
+    """ Excluded records that are still included in another schema are kept"""
+    records = list(schema_with_records.records)
+    other_schema = tables.ScheduleSchema(name='other-schema')
+    other_schema.records = records[:2]
+    session_db.add(other_schema)
+    session_db.commit()
+    records_ids = [r.id for r in records]
+
+    services.SchemaService(session_db).exclude_records_from_schema(schema_with_records.id, records_ids, True)
+
+    remaining = session_db.query(tables.SchemaRecord.id).filter(tables.SchemaRecord.id.in_(records_ids)).all()
+    delete_all(session_db, [other_schema])
+    assert {r.id for r in remaining} == set(records_ids[:2])
+
+
 def test_exclude_records_from_schema_removes_records(session_db, schema_with_records):
     records_to_exclude = [r.id for r in schema_with_records.records][::2]
     response = client.request('delete', f'/api/schedule/schema/{schema_with_records.id}/records', json=records_to_exclude)
@@ -118,31 +148,120 @@ def test_excluding_records_from_schema_cancels_future_booking_on_nw_schema(sessi
     method.assert_called_once_with(schema_service, records, next_week=True)
 
 
-def test_method_remove_book_rows(session_db, booked_rows):
-    """ Tests the behaviour of SchemaService._remove_booked_rows"""
-    schema_service = services.SchemaService(session_db)
-    rows_to_remove = [(bk.program, bk.date) for bk in booked_rows[::2]]
-    rows_ids = [bk.id for bk in booked_rows[::2]]
+def test_method_remove_booking_keeps_other_records(session_db, booked_rows_on_records):
+    """ Tests the behaviour of SchemaService._remove_booking: bookings on records that are not passed are kept"""
+    booked_rows, records = booked_rows_on_records
+    week = rd.relativedelta(days=7)
+    next_week_rows = [
+        tables.BookedClasses(client=row.client, program=row.program, date=row.date + week) for row in booked_rows
+    ]
+    session_db.add_all(next_week_rows)
+    session_db.commit()
+    booked = {(row.program, row.date) for row in booked_rows + next_week_rows}
+    removed = {(r.program, r.date + week) for r in records[::2]}
 
-    schema_service._remove_booked_rows(rows_to_remove)
+    services.SchemaService(session_db)._remove_booking([r.id for r in records[::2]], next_week=True)
+    session_db.commit()
 
-    assert  session_db.query(tables.BookedClasses)\
-            .filter(tables.BookedClasses.id.in_(rows_ids))\
-            .all() == []
+    remaining = {(row.program, row.date) for row in session_db.query(tables.BookedClasses).all()}
+    assert remaining == booked - removed
 
 
 @pytest.mark.parametrize('next_week', (False, True))
-def test_method_remove_booking_on_records(session_db, booked_rows_on_records, next_week, mocker: MockerFixture):
-    """ Tests the implementation of SchemaService._remove_booking"""
-    booked_rows, records = booked_rows_on_records[0], booked_rows_on_records[1]
+def test_method_remove_booking_on_records(session_db, booked_rows_on_records, next_week):
+    """ Tests the behaviour of SchemaService._remove_booking: only the upcoming classes of the records are released"""
+    booked_rows, records = booked_rows_on_records
+    next_week_rows = [
+        tables.BookedClasses(client=row.client, program=row.program, date=row.date + rd.relativedelta(days=7))
+        for row in booked_rows
+    ]
+    session_db.add_all(next_week_rows)
+    session_db.commit()
+    booked = {(row.program, row.date) for row in booked_rows + next_week_rows}
     interval = rd.relativedelta(days=7) if next_week else rd.relativedelta()
-    expected = [(row.program, row.date + interval)
-                for row in booked_rows
-                if row.date + interval > utils.now()]
-    schema_service = services.SchemaService(session_db)
+    removed = {(row.program, row.date + interval) for row in booked_rows if row.date + interval > utils.now()}
+
+    services.SchemaService(session_db)._remove_booking(records[::2] + [r.id for r in records[1::2]], next_week=next_week)
+    session_db.commit()
+
+    remaining = {(row.program, row.date) for row in session_db.query(tables.BookedClasses).all()}
+    assert remaining == booked - removed
+
+
+def test_compare_schemas_removes_booking_on_missing_records(session_db, schema_with_records, booked_rows_on_records):
+    """ Next week bookings on the records, present only in the other schema, are removed by a single statement"""
+    booked_rows, records = booked_rows_on_records
+    week = rd.relativedelta(days=7)
+    session_db.add_all([
+        tables.BookedClasses(client=row.client, program=row.program, date=row.date + week) for row in booked_rows
+    ])
+    other_schema = tables.ScheduleSchema(name='other-schema')
+    other_schema.records = records
+    session_db.add(other_schema)
+    session_db.commit()
+    kept = {r.id for r in schema_with_records.records}
+    expected = {(r.program, r.date) for r in records} | {(r.program, r.date + week) for r in records if r.id in kept}
+
+    with count_queries() as statements:
+        services.SchemaService(session_db)._compare_schemas(schema_with_records, other_schema, next_week=True)
+    session_db.commit()
 
-    method = mocker.patch.object(services.SchemaService, '_remove_booked_rows', autospec=True)
-    schema_service._remove_booking(records, next_week=next_week)
+    remaining = {(row.program, row.date) for row in session_db.query(tables.BookedClasses).all()}
+    delete_all(session_db, [other_schema])
+    assert remaining == expected
+    assert len([s for s in statements if s.lstrip().upper().startswith('DELETE')]) == 1
 
-    method.assert_called_once_with(schema_service, expected)
 
+@pytest.mark.parametrize('step', (1, 9))
+def test_get_schema_records_query_count_is_constant(session_db, sessionmaker_db, active_schema, records, step):
+    active_schema.records = records[::step]
+    session_db.commit()
+    schema_id = active_schema.id
+    session = sessionmaker_db()
+
+    with count_queries() as statements:
+        response = services.SchemaService(session).get_schema_records(schema_id)
+
+    session.close()
+    assert len(response) == len(records[::step])
+    assert len(statements) == 5
+
+
+@pytest.fixture()
+def due_next_week_schema(session_db, active_schema, next_week_schema):
+    """ Schema planned for the next week, whose activation date has already come"""
+    next_week_schema.to_be_active_from = utils.now() - rd.relativedelta(minutes=1)
+    session_db.commit()
+    return next_week_schema
+
+
+def test_current_schemas_treats_due_schema_as_active(session_db, active_schema, due_next_week_schema):
+    current, next_week = services.SchemaService(session_db).current_schemas()
+    session_db.expire_all()
+
+    assert (current, next_week) == (due_next_week_schema, None)
+    assert active_schema.active is True and due_next_week_schema.active is not True
+
+
+def test_activate_scheduled_schema(session_db, active_schema, due_next_week_schema):
+    result = services.SchemaService(session_db).activate_scheduled_schema()
+    session_db.expire_all()
+
+    assert result is None
+    assert active_schema.active is False
+    assert due_next_week_schema.active is True and due_next_week_schema.to_be_active_from is None
+
+
+def test_activate_scheduled_schema_returns_pending_activation(session_db, active_schema, next_week_schema):
+    result = services.SchemaService(session_db).activate_scheduled_schema()
+
+    assert result == next_week_schema.to_be_active_from
+    assert next_week_schema.active is not True
+
+
+def test_schedule_read_does_not_switch_schemas(session_db, active_schema, due_next_week_schema):
+    response = client.get('/api/schedule/')
+    session_db.expire_all()
+
+    assert response.status_code == 200
+    assert active_schema.active is True
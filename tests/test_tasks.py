@@ -0,0 +1,46 @@
+import asyncio
+
+from src.sport_app.tasks import Scheduler
+
+
+def test_scheduler_runs_jobs_until_stopped():
+    scheduler = Scheduler()
+    calls = []
+
+    @scheduler.job(interval=0.01)
+    async def job():
+        calls.append('job')
+
+    @scheduler.job(interval=60)
+    async def failing_job():
+        calls.append('failing_job')
+        raise RuntimeError
+
+    async def run():
+        scheduler.start()
+        await asyncio.sleep(0.05)
+        await scheduler.stop()
+
+    asyncio.run(run())
+
+    assert calls.count('job') > 1
+    assert calls.count('failing_job') == 1
+
+
+def test_scheduler_uses_delay_returned_by_job():
+    scheduler = Scheduler()
+    calls = []
+
+    @scheduler.job(interval=60)
+    async def job():
+        calls.append('job')
+        return 0.01
+
+    async def run():
+        scheduler.start()
+        await asyncio.sleep(0.05)
+        await scheduler.stop()
+
+    asyncio.run(run())
+
+    assert len(calls) > 1